@@ -0,0 +1,37 @@
+"""add qr_url and qr_estado to visitas
+
+Revision ID: a3f1c9d2e7b4
+Revises: c442f9ba7850
+Create Date: 2026-10-18 10:12:37.418215-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f1c9d2e7b4'
+down_revision: Union[str, None] = 'c442f9ba7850'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('qr_url', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('qr_estado', sa.String(length=20), nullable=True))
+        batch_op.create_check_constraint(
+            'check_qr_estado',
+            "qr_estado IN ('pendiente', 'generado', 'fallido')"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_constraint('check_qr_estado', type_='check')
+        batch_op.drop_column('qr_estado')
+        batch_op.drop_column('qr_url')
@@ -0,0 +1,30 @@
+"""add index to visitas qr_code
+
+Revision ID: b7d24e1f9a30
+Revises: a3f1c9d2e7b4
+Create Date: 2026-10-18 10:47:12.602944-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d24e1f9a30'
+down_revision: Union[str, None] = 'a3f1c9d2e7b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_visitas_qr_code'), ['qr_code'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_visitas_qr_code'))
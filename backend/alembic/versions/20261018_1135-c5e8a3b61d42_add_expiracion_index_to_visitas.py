@@ -0,0 +1,30 @@
+"""add expiracion index to visitas
+
+Revision ID: c5e8a3b61d42
+Revises: b7d24e1f9a30
+Create Date: 2026-10-18 11:35:48.127305-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e8a3b61d42'
+down_revision: Union[str, None] = 'b7d24e1f9a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.create_index('ix_visitas_expiracion_qr_expiracion', ['expiracion', 'qr_expiracion'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index('ix_visitas_expiracion_qr_expiracion')
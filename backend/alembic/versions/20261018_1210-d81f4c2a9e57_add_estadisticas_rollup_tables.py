@@ -0,0 +1,78 @@
+"""add estadisticas rollup tables
+
+Revision ID: d81f4c2a9e57
+Revises: c5e8a3b61d42
+Create Date: 2026-10-18 12:10:22.614083-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f4c2a9e57'
+down_revision: Union[str, None] = 'c5e8a3b61d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('estadisticas_visitas_dia',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('residencial_id', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('estado', sa.String(length=30), nullable=False),
+    sa.Column('tipo_vehiculo', sa.String(length=50), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['residencial_id'], ['residenciales.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('residencial_id', 'fecha', 'estado', 'tipo_vehiculo', name='uq_estadisticas_visitas_dia')
+    )
+    with op.batch_alter_table('estadisticas_visitas_dia', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_estadisticas_visitas_dia_id'), ['id'], unique=False)
+
+    op.create_table('estadisticas_escaneos_hora',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('residencial_id', sa.Integer(), nullable=False),
+    sa.Column('hora', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('guardia_id', sa.Integer(), nullable=False),
+    sa.Column('entradas', sa.Integer(), nullable=False),
+    sa.Column('salidas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['guardia_id'], ['guardias.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['residencial_id'], ['residenciales.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('residencial_id', 'hora', 'guardia_id', name='uq_estadisticas_escaneos_hora')
+    )
+    with op.batch_alter_table('estadisticas_escaneos_hora', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_estadisticas_escaneos_hora_id'), ['id'], unique=False)
+
+    op.create_table('estadisticas_residentes',
+    sa.Column('residente_id', sa.Integer(), nullable=False),
+    sa.Column('residencial_id', sa.Integer(), nullable=False),
+    sa.Column('total_visitas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['residencial_id'], ['residenciales.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['residente_id'], ['residentes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('residente_id')
+    )
+    with op.batch_alter_table('estadisticas_residentes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_estadisticas_residentes_residencial_id'), ['residencial_id'], unique=False)
+
+    # Los rollups se llenan con: python -m app.tasks.rollup_estadisticas
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('estadisticas_residentes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_estadisticas_residentes_residencial_id'))
+    op.drop_table('estadisticas_residentes')
+
+    with op.batch_alter_table('estadisticas_escaneos_hora', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_estadisticas_escaneos_hora_id'))
+    op.drop_table('estadisticas_escaneos_hora')
+
+    with op.batch_alter_table('estadisticas_visitas_dia', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_estadisticas_visitas_dia_id'))
+    op.drop_table('estadisticas_visitas_dia')
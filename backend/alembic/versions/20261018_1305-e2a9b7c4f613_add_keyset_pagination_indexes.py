@@ -0,0 +1,38 @@
+"""add keyset pagination indexes
+
+Revision ID: e2a9b7c4f613
+Revises: d81f4c2a9e57
+Create Date: 2026-10-18 13:05:41.372916-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a9b7c4f613'
+down_revision: Union[str, None] = 'd81f4c2a9e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.create_index('ix_escaneos_qr_fecha_escaneo_id', ['fecha_escaneo', 'id'], unique=False)
+
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.create_index('ix_visitas_residente_fecha_entrada_id', ['residente_id', 'fecha_entrada', 'id'], unique=False)
+        batch_op.create_index('ix_visitas_admin_fecha_entrada_id', ['admin_id', 'fecha_entrada', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index('ix_visitas_admin_fecha_entrada_id')
+        batch_op.drop_index('ix_visitas_residente_fecha_entrada_id')
+
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.drop_index('ix_escaneos_qr_fecha_escaneo_id')
@@ -0,0 +1,61 @@
+"""add residencial_id to visitas and escaneos_qr
+
+Revision ID: f47c1d08b925
+Revises: e2a9b7c4f613
+Create Date: 2026-10-18 13:40:09.518264-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f47c1d08b925'
+down_revision: Union[str, None] = 'e2a9b7c4f613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('residencial_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('visitas_residencial_id_fkey', 'residenciales', ['residencial_id'], ['id'], ondelete='CASCADE')
+
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('residencial_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('escaneos_qr_residencial_id_fkey', 'residenciales', ['residencial_id'], ['id'], ondelete='CASCADE')
+
+    # Backfill: residencial del creador (residente o admin) y, para los escaneos, la de su visita
+    op.execute("""
+        UPDATE visitas SET residencial_id = COALESCE(
+            (SELECT residentes.residencial_id FROM residentes WHERE residentes.id = visitas.residente_id),
+            (SELECT administradores.residencial_id FROM administradores WHERE administradores.id = visitas.admin_id)
+        )
+    """)
+    op.execute("""
+        UPDATE escaneos_qr SET residencial_id = visitas.residencial_id
+        FROM visitas
+        WHERE visitas.id = escaneos_qr.visita_id
+    """)
+
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.create_index('ix_visitas_residencial_fecha_entrada_id', ['residencial_id', 'fecha_entrada', 'id'], unique=False)
+
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.create_index('ix_escaneos_qr_residencial_fecha_escaneo_id', ['residencial_id', 'fecha_escaneo', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.drop_index('ix_escaneos_qr_residencial_fecha_escaneo_id')
+        batch_op.drop_constraint('escaneos_qr_residencial_id_fkey', type_='foreignkey')
+        batch_op.drop_column('residencial_id')
+
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index('ix_visitas_residencial_fecha_entrada_id')
+        batch_op.drop_constraint('visitas_residencial_id_fkey', type_='foreignkey')
+        batch_op.drop_column('residencial_id')
@@ -0,0 +1,47 @@
+"""add tipo to escaneos_qr
+
+Revision ID: 0b6d3e9a1c72
+Revises: f47c1d08b925
+Create Date: 2026-10-18 14:15:33.804127-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6d3e9a1c72'
+down_revision: Union[str, None] = 'f47c1d08b925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tipo', sa.String(length=10), nullable=True))
+
+    # Backfill con la misma regla que se infería al leer: salida si el escaneo es en/después de fecha_salida
+    op.execute("""
+        UPDATE escaneos_qr SET tipo = CASE
+            WHEN visitas.fecha_salida IS NOT NULL AND escaneos_qr.fecha_escaneo >= visitas.fecha_salida THEN 'salida'
+            ELSE 'entrada'
+        END
+        FROM visitas
+        WHERE visitas.id = escaneos_qr.visita_id
+    """)
+
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.alter_column('tipo', existing_type=sa.String(length=10), nullable=False)
+        batch_op.create_check_constraint('check_tipo_escaneo', "tipo IN ('entrada', 'salida')")
+        batch_op.create_index('ix_escaneos_qr_residencial_tipo_fecha_escaneo_id', ['residencial_id', 'tipo', 'fecha_escaneo', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('escaneos_qr', schema=None) as batch_op:
+        batch_op.drop_index('ix_escaneos_qr_residencial_tipo_fecha_escaneo_id')
+        batch_op.drop_constraint('check_tipo_escaneo', type_='check')
+        batch_op.drop_column('tipo')
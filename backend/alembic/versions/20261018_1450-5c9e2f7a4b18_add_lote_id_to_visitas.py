@@ -0,0 +1,32 @@
+"""add lote_id to visitas
+
+Revision ID: 5c9e2f7a4b18
+Revises: 0b6d3e9a1c72
+Create Date: 2026-10-18 14:50:12.417963-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c9e2f7a4b18'
+down_revision: Union[str, None] = '0b6d3e9a1c72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('lote_id', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_visitas_lote_id'), ['lote_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_visitas_lote_id'))
+        batch_op.drop_column('lote_id')
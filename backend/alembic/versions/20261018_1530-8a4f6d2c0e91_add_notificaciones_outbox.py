@@ -0,0 +1,50 @@
+"""add notificaciones_outbox
+
+Revision ID: 8a4f6d2c0e91
+Revises: 5c9e2f7a4b18
+Create Date: 2026-10-18 15:30:41.562208-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4f6d2c0e91'
+down_revision: Union[str, None] = '5c9e2f7a4b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notificaciones_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=50), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('clave_dedup', sa.String(length=200), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('proximo_intento', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('ultimo_error', sa.Text(), nullable=True),
+    sa.Column('fecha_creacion', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('fecha_envio', sa.DateTime(timezone=True), nullable=True),
+    sa.CheckConstraint("estado IN ('pendiente', 'procesando', 'enviado', 'fallido')", name='check_estado_outbox'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('clave_dedup')
+    )
+    with op.batch_alter_table('notificaciones_outbox', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notificaciones_outbox_id'), ['id'], unique=False)
+        batch_op.create_index('ix_notificaciones_outbox_estado_proximo_intento', ['estado', 'proximo_intento'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notificaciones_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_notificaciones_outbox_estado_proximo_intento')
+        batch_op.drop_index(batch_op.f('ix_notificaciones_outbox_id'))
+
+    op.drop_table('notificaciones_outbox')
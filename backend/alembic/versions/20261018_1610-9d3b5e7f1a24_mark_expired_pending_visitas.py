@@ -0,0 +1,34 @@
+"""mark expired pending visitas
+
+Revision ID: 9d3b5e7f1a24
+Revises: 8a4f6d2c0e91
+Create Date: 2026-10-18 16:10:27.493816-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3b5e7f1a24'
+down_revision: Union[str, None] = '8a4f6d2c0e91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Visitas que el job anterior marcó con expiracion='S' sin cambiar su estado.
+    # Los rollups de estadísticas se reconstruyen en 6f1a9c3e8b52 (backfill).
+    op.execute("""
+        UPDATE visitas SET estado = 'expirado'
+        WHERE estado = 'pendiente' AND expiracion = 'S'
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # No se puede distinguir qué visitas expiradas venían de este backfill
+    pass
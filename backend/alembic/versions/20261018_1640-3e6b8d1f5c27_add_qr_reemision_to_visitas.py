@@ -0,0 +1,40 @@
+"""add qr reemision columns to visitas
+
+Revision ID: 3e6b8d1f5c27
+Revises: 9d3b5e7f1a24
+Create Date: 2026-10-18 16:40:12.318245-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e6b8d1f5c27'
+down_revision: Union[str, None] = '9d3b5e7f1a24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('qr_programado_en', sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column('qr_reintentos', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_visitas_qr_estado_qr_programado_en', ['qr_estado', 'qr_programado_en'], unique=False)
+
+    # Emisiones que quedaron sin terminar antes de este cambio: el barrido las toma
+    op.execute("""
+        UPDATE visitas SET qr_programado_en = now()
+        WHERE qr_estado IN ('pendiente', 'fallido')
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('visitas', schema=None) as batch_op:
+        batch_op.drop_index('ix_visitas_qr_estado_qr_programado_en')
+        batch_op.drop_column('qr_reintentos')
+        batch_op.drop_column('qr_programado_en')
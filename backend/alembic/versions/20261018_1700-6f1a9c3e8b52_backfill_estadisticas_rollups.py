@@ -0,0 +1,67 @@
+"""backfill estadisticas rollups
+
+Revision ID: 6f1a9c3e8b52
+Revises: 3e6b8d1f5c27
+Create Date: 2026-10-18 17:00:41.862093-06:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f1a9c3e8b52'
+down_revision: Union[str, None] = '3e6b8d1f5c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Las tablas de rollup se crearon vacías (d81f4c2a9e57) y los listeners solo
+    # suman o restan deltas: hasta la primera reconciliación mostraban ceros o
+    # conteos negativos, y el backfill de 9d3b5e7f1a24 tampoco se reflejaba.
+    # Se reconstruyen aquí con las mismas agrupaciones que rollup_service
+    # (día y hora en UTC); requiere residencial_id y tipo en escaneos_qr.
+    op.execute("DELETE FROM estadisticas_visitas_dia")
+    op.execute("DELETE FROM estadisticas_escaneos_hora")
+    op.execute("DELETE FROM estadisticas_residentes")
+
+    op.execute("""
+        INSERT INTO estadisticas_visitas_dia (residencial_id, fecha, estado, tipo_vehiculo, cantidad)
+        SELECT visitas.residencial_id,
+               CAST(timezone('UTC', visitas.fecha_entrada) AS DATE),
+               visitas.estado,
+               coalesce(visitantes.tipo_vehiculo, ''),
+               count(visitas.id)
+        FROM visitas
+        JOIN visitantes ON visitas.visitante_id = visitantes.id
+        WHERE visitas.residencial_id IS NOT NULL AND visitas.fecha_entrada IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+    op.execute("""
+        INSERT INTO estadisticas_escaneos_hora (residencial_id, hora, guardia_id, entradas, salidas)
+        SELECT residencial_id,
+               timezone('UTC', date_trunc('hour', timezone('UTC', fecha_escaneo))),
+               guardia_id,
+               CAST(sum(CASE WHEN tipo = 'salida' THEN 0 ELSE 1 END) AS INTEGER),
+               CAST(sum(CASE WHEN tipo = 'salida' THEN 1 ELSE 0 END) AS INTEGER)
+        FROM escaneos_qr
+        WHERE residencial_id IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+    op.execute("""
+        INSERT INTO estadisticas_residentes (residente_id, residencial_id, total_visitas)
+        SELECT visitas.residente_id, residentes.residencial_id, count(visitas.id)
+        FROM visitas
+        JOIN residentes ON visitas.residente_id = residentes.id
+        GROUP BY visitas.residente_id, residentes.residencial_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Solo datos derivados: la reconciliación nocturna los vuelve a calcular
+    pass
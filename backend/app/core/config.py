@@ -32,7 +32,59 @@ class Settings(BaseSettings):
     CLOUDINARY_CLOUD_NAME: str
     CLOUDINARY_API_KEY: str
     CLOUDINARY_API_SECRET: str
-    
+
+    # pool de conexiones a Postgres (por worker de uvicorn)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # pool del motor async (asyncpg), aparte del pool sync
+    DB_ASYNC_POOL_SIZE: int = 5
+    DB_ASYNC_MAX_OVERFLOW: int = 5
+
+    # cache en memoria del usuario autenticado (por worker)
+    USUARIO_CACHE_TTL: int = 60
+    USUARIO_CACHE_MAX: int = 1024
+
+    # cache de respuestas de estadísticas (por residencial)
+    ESTADISTICAS_CACHE_TTL: int = 120
+    ESTADISTICAS_CACHE_MAX: int = 256
+
+    # emision de QR (render + subida en segundo plano)
+    QR_WORKERS: int = 4
+    # hilos aparte para los lotes masivos, que no bloquean la emisión interactiva
+    QR_LOTE_WORKERS: int = 1
+    # pool de procesos que renderiza las imagenes (0 = en el mismo hilo)
+    QR_RENDER_PROCESOS: int = 2
+    QR_RENDER_CHUNK: int = 8
+    # cache de imagenes QR renderizadas (memoria por worker + disco compartido)
+    QR_CACHE_MEMORIA_MB: int = 32
+    QR_CACHE_DISCO_MB: int = 256
+    QR_CACHE_DIR: str = ""
+    # barrido que reencola emisiones perdidas (reinicio del worker) o fallidas
+    QR_REEMISION_MINUTOS: int = 10
+    QR_MAX_REINTENTOS: int = 3
+    QR_REEMISION_LOTE: int = 500
+
+    # outbox de notificaciones (push/correo despachados en segundo plano)
+    NOTIF_OUTBOX_INTERVALO: int = 3
+    NOTIF_OUTBOX_LOTE: int = 50
+    NOTIF_OUTBOX_WORKERS: int = 4
+    NOTIF_OUTBOX_MAX_INTENTOS: int = 6
+    NOTIF_OUTBOX_BACKOFF_BASE: int = 10
+    NOTIF_OUTBOX_BACKOFF_MAX: int = 900
+    # envíos web push en paralelo por difusión
+    PUSH_WORKERS: int = 16
+    # claves públicas de suscriptores ya validadas (~2 KB c/u, por worker)
+    PUSH_CACHE_CLAVES: int = 4096
+
+    # envío de correos (Brevo): hilos, destinatarios por llamada y llamadas por segundo
+    EMAIL_WORKERS: int = 4
+    EMAIL_LOTE: int = 500
+    EMAIL_RATE_POR_SEGUNDO: float = 5.0
+    EMAIL_RATE_RAFAGA: int = 10
+
     # cors
     FRONTEND_URL: str
     ALLOWED_ORIGINS: str
@@ -1,15 +1,113 @@
+from collections import deque
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from dotenv import load_dotenv
 from app.core.config import settings
+import threading
+import time
+
+class QueuePoolMedido(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._esperas_ms = deque(maxlen=1000)
+        self._timeouts = 0
+        self._metricas_lock = threading.Lock()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._metricas_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            with self._metricas_lock:
+                self._esperas_ms.append((time.perf_counter() - inicio) * 1000)
+
+    def recreate(self):
+        # Mantener la medición si el engine recrea el pool (p. ej. tras dispose)
+        nuevo = super().recreate()
+        nuevo._esperas_ms = self._esperas_ms
+        nuevo._timeouts = self._timeouts
+        nuevo._metricas_lock = self._metricas_lock
+        return nuevo
+
+    def metricas(self) -> dict:
+        with self._metricas_lock:
+            esperas = sorted(self._esperas_ms)
+            timeouts = self._timeouts
+
+        def percentil(p: float) -> float:
+            if not esperas:
+                return 0.0
+            return round(esperas[min(len(esperas) - 1, round(p / 100 * (len(esperas) - 1)))], 2)
+
+        capacidad = self.size() + max(self._max_overflow, 0)
+        en_uso = self.checkedout()
+        return {
+            "pool_size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_out": en_uso,
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "saturacion": round(en_uso / capacidad, 2) if capacidad else 0.0,
+            "espera_p50_ms": percentil(50),
+            "espera_p99_ms": percentil(99),
+            "timeouts": timeouts
+        }
+
+class AsyncQueuePoolMedido(QueuePoolMedido, AsyncAdaptedQueuePool):
+    """Misma medición de esperas sobre la cola asyncio del motor async."""
+
+def _url_async(database_url: str) -> tuple:
+    """
+    Convierte DATABASE_URL (psycopg2) a postgresql+asyncpg.
+    asyncpg no acepta el parámetro sslmode de libpq: se pasa como connect_args["ssl"].
+    """
+    url = make_url(database_url)
+    sslmode = url.query.get("sslmode")
+    url = url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"])
+    connect_args = {"ssl": sslmode} if sslmode else {}
+    return url, connect_args
 
 # Crear el motor SQLAlchemy usando la URL de la base de datos
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(
+    settings.DATABASE_URL,
+    poolclass=QueuePoolMedido,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING
+)
 
 # Crear sesión para manejar transacciones (lectura/escritura)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor async para los endpoints calientes (auth, escaneos, mis_visitas)
+_async_url, _async_connect_args = _url_async(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    _async_url,
+    connect_args=_async_connect_args,
+    poolclass=AsyncQueuePoolMedido,
+    pool_size=settings.DB_ASYNC_POOL_SIZE,
+    max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING
+)
+
+# expire_on_commit=False: la respuesta se arma después del commit sin volver a la BD
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 #llamando la funcion clave load_dotenv para cargar las variables de entorno del archivo .env
 load_dotenv()
 
@@ -23,3 +121,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependencia async para obtener sesión en rutas async def
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def metricas_pool() -> dict:
+    """Estado del pool de conexiones de este worker (checked-out, overflow, espera)."""
+    return engine.pool.metricas()
+
+def metricas_pool_async() -> dict:
+    return async_engine.pool.metricas()
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
 from fastapi.responses import HTMLResponse
 from apscheduler.schedulers.background import BackgroundScheduler
-from app.database import SessionLocal, get_db
+from app.database import get_db
 from typing import Optional, List
 from app.routers import auth, usuarios, visitas, notificaciones, historial_visitas, estadisticas, sociales, tickets, residenciales, vistas, push_notifications
 from app.routers.super_admin import router as super_admin_router
@@ -11,7 +11,6 @@ from app.schemas.usuario_schema import Usuario, UsuarioCreate, UsuarioUpdate, Us
 from app.utils.security import get_current_user, verify_role
 from app.core.cors import add_cors
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from app.models.usuario import Usuario as UsuarioModel
 from app.models.super_admin import SuperAdmin
 from app.models.residente import Residente
@@ -19,6 +18,10 @@ from app.models.guardia import Guardia
 from app.models.admin import Administrador
 from app.models.refresh_token import RefreshToken
 from app.core.config import settings
+from app.services.expiracion_service import ejecutar_expiracion_visitas
+from app.services.rollup_service import ejecutar_reconciliacion_rollups
+from app.services.outbox_service import despachar_outbox, purgar_outbox
+from app.services.qr_emision_service import reprogramar_emisiones_qr
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -43,15 +46,16 @@ app.include_router(super_admin_router)
 app.include_router(vistas.router)
 app.include_router(push_notifications.router)
 
-# Llamada a la función de expiración de visitas
-def actu_visita_expiracion():
-    db: Session = SessionLocal()
-    db.execute(text("SELECT actu_visita_expiracion()"))
-    db.commit()
-    db.close()
-
+# Expiración de visitas: incremental y solo en el worker líder (advisory lock de sesión)
 scheduler = BackgroundScheduler()
-scheduler.add_job(actu_visita_expiracion, "interval", minutes=5)  
+scheduler.add_job(ejecutar_expiracion_visitas, "interval", minutes=5, max_instances=1, coalesce=True)
+# Reconciliación nocturna de los rollups de estadísticas (corrige operaciones masivas)
+scheduler.add_job(ejecutar_reconciliacion_rollups, "cron", hour=3, minute=30, max_instances=1, coalesce=True)
+# Despacho de notificaciones encoladas; cada worker toma tandas distintas (SKIP LOCKED)
+scheduler.add_job(despachar_outbox, "interval", seconds=settings.NOTIF_OUTBOX_INTERVALO, max_instances=1, coalesce=True)
+scheduler.add_job(purgar_outbox, "cron", hour=4, minute=0, max_instances=1, coalesce=True)
+# Reemisión de QR que quedaron pendientes o fallidos (reinicio del worker que los emitía)
+scheduler.add_job(reprogramar_emisiones_qr, "interval", minutes=5, max_instances=1, coalesce=True)
 scheduler.start()
 
 @app.get('/', tags=["Inicio"])
@@ -95,14 +99,29 @@ def debug_cookies(request: Request):
 @limiter.limit("60/minute")
 def health_check(request: Request):
     try:
-        from app.utils.async_notifications import email_executor
+        from app.utils.async_notifications import servicio_correo
+        from app.services.escaneo_service import metricas_escaneo
+        from app.services.expiracion_service import metricas_expiracion
+        from app.database import metricas_pool, metricas_pool_async
+        from app.utils.security import cache_usuarios
+        from app.services.estadisticas_cache import cache_estadisticas
+        from app.services.qr_render_service import servicio_render_qr
+        from app.services.qr_cache import cache_imagenes_qr
+        from app.services.outbox_service import metricas_outbox
+        from app.services.push_notification_service import metricas_push
         return {
             "status": "healthy",
-            "email_pool": {
-                "active_threads": email_executor._threads.__len__() if hasattr(email_executor, '_threads') else 0,
-                "max_workers": email_executor._max_workers,
-                "shutdown": email_executor._shutdown
-            }
+            "db_pool": metricas_pool(),
+            "db_pool_async": metricas_pool_async(),
+            "cache_usuarios": cache_usuarios.resumen(),
+            "cache_estadisticas": cache_estadisticas.resumen(),
+            "render_qr": servicio_render_qr.resumen(),
+            "cache_imagenes_qr": cache_imagenes_qr.resumen(),
+            "email_pool": servicio_correo.resumen(),
+            "escaneos": metricas_escaneo.resumen(),
+            "expiracion_visitas": metricas_expiracion.resumen(),
+            "outbox_notificaciones": metricas_outbox.resumen(),
+            "push": metricas_push.resumen()
         }
     except Exception as e:
         return {
@@ -185,9 +204,9 @@ def obtener_usuario_por_id_endpoint(id: int, request: Request, usuario_actual=De
         raise e
 
 # Crear un nuevo usuario
-@app.post('/create_usuarios/admin', response_model=Usuario, tags=["Usuarios"])
+@app.post('/create_usuarios/admin', response_model=Usuario, tags=["Usuarios"], dependencies=[Depends(verify_role(["super_admin","admin"]))])
 @limiter.limit("10/minute")
-def crear_nuevo_usuario(usuario: UsuarioCreateAdmin, request: Request, usuario_actual=Depends(verify_role(["super_admin","admin"])), db: Session = Depends(get_db)):
+def crear_nuevo_usuario(usuario: UsuarioCreateAdmin, request: Request, usuario_actual: UsuarioModel = Depends(get_current_user), db: Session = Depends(get_db)):
     # Convertir UsuarioCreateAdmin a UsuarioCreate agregando el residencial_id
     if usuario_actual.rol == "admin":
         # Obtener el residencial_id del admin actual
@@ -1,15 +1,50 @@
 import atexit
-from app.utils.async_notifications import email_executor
+from app.utils.async_notifications import servicio_correo
+from app.services.qr_emision_service import qr_executor, qr_executor_lotes
+from app.services.qr_render_service import servicio_render_qr
+from app.services.outbox_service import outbox_executor
+from app.services.push_notification_service import push_executor
+from app.utils.lider_cluster import soltar_lideres
 
 def cleanup_resources():
     """
     Función para limpiar recursos al cerrar la aplicación
     """
     try:
-        email_executor.shutdown(wait=True)
+        servicio_correo.cerrar()
         print("Pool de hilos de email cerrado correctamente")
     except Exception as e:
         print(f"Error al cerrar pool de hilos de email: {e}")
+    try:
+        qr_executor.shutdown(wait=True)
+        print("Pool de emisión de QR cerrado correctamente")
+    except Exception as e:
+        print(f"Error al cerrar pool de emisión de QR: {e}")
+    try:
+        qr_executor_lotes.shutdown(wait=True)
+        print("Pool de emisión de QR de lotes masivos cerrado correctamente")
+    except Exception as e:
+        print(f"Error al cerrar pool de emisión de QR de lotes masivos: {e}")
+    try:
+        outbox_executor.shutdown(wait=True)
+        print("Pool del outbox de notificaciones cerrado correctamente")
+    except Exception as e:
+        print(f"Error al cerrar pool del outbox de notificaciones: {e}")
+    try:
+        push_executor.shutdown(wait=True)
+        print("Pool de envíos web push cerrado correctamente")
+    except Exception as e:
+        print(f"Error al cerrar pool de envíos web push: {e}")
+    try:
+        servicio_render_qr.cerrar()
+        print("Pool de render de QR cerrado correctamente")
+    except Exception as e:
+        print(f"Error al cerrar pool de render de QR: {e}")
+    try:
+        soltar_lideres()
+        print("Locks de liderazgo de tareas programadas liberados")
+    except Exception as e:
+        print(f"Error al liberar los locks de liderazgo: {e}")
 
 # Registrar la función de limpieza para que se ejecute al cerrar la aplicación
 atexit.register(cleanup_resources)
\ No newline at end of file
@@ -16,3 +16,5 @@ from .push_subscription import PushSubscription
 from .vista import Vista
 from .vista_admin import VistaAdmin
 from .vista_residencial import VistaResidencial
+from .estadistica_rollup import EstadisticaVisitaDia, EstadisticaEscaneoHora, EstadisticaVisitasResidente
+from .notificacion_outbox import NotificacionOutbox
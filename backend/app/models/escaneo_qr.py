@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Boolean
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Boolean, Index, CheckConstraint
 from sqlalchemy.orm import relationship
 from app.database import Base
 from app.utils.time import get_current_time
@@ -9,8 +9,23 @@ class EscaneoQR(Base):
     id = Column(Integer, primary_key=True, index=True)
     visita_id = Column(Integer, ForeignKey("visitas.id", ondelete="CASCADE"), nullable=False)
     guardia_id = Column(Integer, ForeignKey("guardias.id", ondelete="CASCADE"), nullable=False)
+    # Residencial de la visita escaneada (copiada de visitas.residencial_id)
+    residencial_id = Column(Integer, ForeignKey("residenciales.id", ondelete="CASCADE"), nullable=True)
     dispositivo = Column(String(100), nullable=True)
+    # Se escribe al escanear (validar_qr -> entrada, registrar_salida -> salida)
+    tipo = Column(String(10), nullable=False, default="entrada")
     fecha_escaneo = Column(DateTime(timezone=True), default=get_current_time)
 
     visita = relationship("Visita", back_populates="escaneos", passive_deletes=True)
     guardia = relationship("Guardia", back_populates="escaneos")
+
+    __table_args__ = (
+        CheckConstraint(
+            tipo.in_(['entrada', 'salida']),
+            name='check_tipo_escaneo'
+        ),
+        # Paginación por cursor del historial (fecha_escaneo DESC, id DESC)
+        Index('ix_escaneos_qr_fecha_escaneo_id', 'fecha_escaneo', 'id'),
+        Index('ix_escaneos_qr_residencial_fecha_escaneo_id', 'residencial_id', 'fecha_escaneo', 'id'),
+        Index('ix_escaneos_qr_residencial_tipo_fecha_escaneo_id', 'residencial_id', 'tipo', 'fecha_escaneo', 'id'),
+    )
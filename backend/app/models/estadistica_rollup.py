@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Date, UniqueConstraint
+from app.database import Base
+
+# Tablas de agregados (rollups) para el dashboard de estadísticas.
+# Se mantienen de forma incremental (ver services/rollup_service.py) y se
+# reconstruyen con el job de backfill; no llevan relaciones ORM a propósito.
+
+class EstadisticaVisitaDia(Base):
+    """Visitas por residencial, día (UTC de fecha_entrada), estado actual y tipo de vehículo."""
+    __tablename__ = "estadisticas_visitas_dia"
+
+    id = Column(Integer, primary_key=True, index=True)
+    residencial_id = Column(Integer, ForeignKey("residenciales.id", ondelete="CASCADE"), nullable=False)
+    fecha = Column(Date, nullable=False)
+    estado = Column(String(30), nullable=False)
+    tipo_vehiculo = Column(String(50), nullable=False, default="")
+    cantidad = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('residencial_id', 'fecha', 'estado', 'tipo_vehiculo', name='uq_estadisticas_visitas_dia'),
+    )
+
+class EstadisticaEscaneoHora(Base):
+    """Escaneos de entrada/salida por residencial, hora (UTC, truncada) y guardia."""
+    __tablename__ = "estadisticas_escaneos_hora"
+
+    id = Column(Integer, primary_key=True, index=True)
+    residencial_id = Column(Integer, ForeignKey("residenciales.id", ondelete="CASCADE"), nullable=False)
+    hora = Column(DateTime(timezone=True), nullable=False)
+    guardia_id = Column(Integer, ForeignKey("guardias.id", ondelete="CASCADE"), nullable=False)
+    entradas = Column(Integer, nullable=False, default=0)
+    salidas = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('residencial_id', 'hora', 'guardia_id', name='uq_estadisticas_escaneos_hora'),
+    )
+
+class EstadisticaVisitasResidente(Base):
+    """Total histórico de visitas creadas por cada residente."""
+    __tablename__ = "estadisticas_residentes"
+
+    residente_id = Column(Integer, ForeignKey("residentes.id", ondelete="CASCADE"), primary_key=True)
+    residencial_id = Column(Integer, ForeignKey("residenciales.id", ondelete="CASCADE"), nullable=False, index=True)
+    total_visitas = Column(Integer, nullable=False, default=0)
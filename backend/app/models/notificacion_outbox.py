@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, CheckConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from app.database import Base
+from app.utils.time import get_current_time
+
+class NotificacionOutbox(Base):
+    """
+    Notificación pendiente de envío (push/correo), escrita en la misma transacción
+    que la visita, el escaneo o el ticket que la origina. La despacha en segundo
+    plano services/outbox_service.py, con reintentos.
+    """
+    __tablename__ = "notificaciones_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    # Evita encolar dos veces el mismo evento (p. ej. escaneo:<visita>:entrada)
+    clave_dedup = Column(String(200), nullable=True, unique=True)
+    estado = Column(String(20), nullable=False, default="pendiente")
+    intentos = Column(Integer, nullable=False, default=0)
+    # Próximo reintento, o fin del lease mientras está en 'procesando'
+    proximo_intento = Column(DateTime(timezone=True), nullable=False, default=get_current_time)
+    ultimo_error = Column(Text, nullable=True)
+    fecha_creacion = Column(DateTime(timezone=True), nullable=False, default=get_current_time)
+    fecha_envio = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint(
+            estado.in_(['pendiente', 'procesando', 'enviado', 'fallido']),
+            name='check_estado_outbox'
+        ),
+        # Lo que recorre el despachador: pendientes/procesando vencidos por orden de llegada
+        Index('ix_notificaciones_outbox_estado_proximo_intento', 'estado', 'proximo_intento'),
+    )
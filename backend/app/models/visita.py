@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Text, CheckConstraint
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Text, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 from app.utils.time import get_current_time
@@ -11,9 +11,16 @@ class Visita(Base):
     admin_id = Column(Integer, ForeignKey("administradores.id", ondelete="CASCADE"), nullable=True)
     residente_id = Column(Integer, ForeignKey("residentes.id", ondelete="CASCADE"), nullable=True)
     guardia_id = Column(Integer, ForeignKey("guardias.id", ondelete="SET NULL"), nullable=True)
+    # Residencial del creador, copiada al crear la visita para no resolverla por residente/admin
+    residencial_id = Column(Integer, ForeignKey("residenciales.id", ondelete="CASCADE"), nullable=True)
     tipo_creador = Column(String(10), nullable=False)
-    qr_code = Column(String(255), nullable=True)
+    qr_code = Column(String(255), nullable=True, index=True)
     qr_expiracion = Column(DateTime(timezone=True))
+    qr_url = Column(String(500), nullable=True)
+    qr_estado = Column(String(20), nullable=True)
+    # Última vez que se programó la emisión del QR y reemisiones hechas por el barrido
+    qr_programado_en = Column(DateTime(timezone=True), nullable=True, default=get_current_time)
+    qr_reintentos = Column(Integer, nullable=False, default=0, server_default="0")
     fecha_entrada = Column(DateTime(timezone=True), nullable=True)
     fecha_salida = Column(DateTime(timezone=True), nullable=True)
     estado = Column(String(30), nullable=False, default="pendiente")
@@ -21,6 +28,8 @@ class Visita(Base):
     observacion_entrada = Column(Text, nullable=True)
     observacion_salida = Column(Text, nullable=True)
     expiracion = Column(String(1), nullable=False, default="N")
+    # Lote de la creación masiva (uuid hex); NULL en visitas creadas una a una
+    lote_id = Column(String(32), nullable=True, index=True)
 
     @property
     def imagenes(self):
@@ -47,4 +56,16 @@ class Visita(Base):
             expiracion.in_(['N', 'S']),
             name='check_expiracion'
         ),
+        CheckConstraint(
+            qr_estado.in_(['pendiente', 'generado', 'fallido']),
+            name='check_qr_estado'
+        ),
+        # Rango que recorre el job de expiración (expiracion='N' AND qr_expiracion <= ahora)
+        Index('ix_visitas_expiracion_qr_expiracion', 'expiracion', 'qr_expiracion'),
+        # Emisiones sin terminar que recorre el barrido de reemisión de QR
+        Index('ix_visitas_qr_estado_qr_programado_en', 'qr_estado', 'qr_programado_en'),
+        # Paginación por cursor (fecha_entrada DESC, id DESC) de las visitas de cada creador
+        Index('ix_visitas_residente_fecha_entrada_id', 'residente_id', 'fecha_entrada', 'id'),
+        Index('ix_visitas_admin_fecha_entrada_id', 'admin_id', 'fecha_entrada', 'id'),
+        Index('ix_visitas_residencial_fecha_entrada_id', 'residencial_id', 'fecha_entrada', 'id'),
     )
@@ -7,14 +7,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.database import get_db
 from app.models import Usuario
-from app.schemas.auth_schema import LoginResponse, RefreshResponse
+from app.schemas.auth_schema import LoginResponse, RefreshResponse, Principal
 from app.services.refresh_token_service import RefreshTokenService
 from app.utils.security import (
     verify_password,
     create_access_token,
     get_current_user,
     verify_role,
-    get_password_hash
+    get_password_hash,
+    invalidar_usuario
 )
 from pydantic import BaseModel
 
@@ -145,7 +146,10 @@ def logout(
     clear_refresh_cookie(response)
     
     # Establecer la zona horaria de Honduras
-    usuario_actual.ult_conexion = datetime.now(pytz.timezone('America/Tegucigalpa'))
+    # (el usuario actual viene de la cache de autenticación: se actualiza la fila de esta sesión)
+    db.query(Usuario).filter(Usuario.id == usuario_actual.id).update(
+        {"ult_conexion": datetime.now(pytz.timezone('America/Tegucigalpa'))}
+    )
     db.commit()
     
     return {"mensaje": "Cierre de sesión exitoso."}
@@ -234,24 +238,24 @@ def secure_endpoint(usuario_actual=Depends(get_current_user)):
         "rol": usuario_actual.rol
     }
     
-@router.get("/admin", response_model=dict)
-def admin_endpoint(usuario_actual=Depends(verify_role(["admin"]))):
+@router.get("/admin", response_model=dict, dependencies=[Depends(verify_role(["admin"]))])
+def admin_endpoint(usuario_actual: Usuario = Depends(get_current_user)):
     return {
         "mensaje": f"Acceso autorizado para {usuario_actual.rol}",
         "usuario": get_username(usuario_actual),
         "rol": usuario_actual.rol
     }
     
-@router.get("/guardia", response_model=dict)
-def guardia_endpoint(usuario_actual=Depends(verify_role(["admin", "guardia"]))):
+@router.get("/guardia", response_model=dict, dependencies=[Depends(verify_role(["admin", "guardia"]))])
+def guardia_endpoint(usuario_actual: Usuario = Depends(get_current_user)):
     return {
         "mensaje": f"Acceso autorizado para {usuario_actual.rol}",
         "usuario": get_username(usuario_actual),
         "rol": usuario_actual.rol
     }
     
-@router.get("/residente", response_model=dict)
-def residente_endpoint(usuario_actual=Depends(verify_role(["admin", "residente"]))):
+@router.get("/residente", response_model=dict, dependencies=[Depends(verify_role(["admin", "residente"]))])
+def residente_endpoint(usuario_actual: Usuario = Depends(get_current_user)):
     return {
         "mensaje": f"Acceso autorizado para {usuario_actual.rol}",
         "usuario": get_username(usuario_actual),
@@ -476,7 +480,7 @@ def revoke_all_sessions(
 @router.post("/admin/cleanup-tokens")
 def cleanup_expired_tokens(
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["super_admin"]))
+    usuario_actual: Principal = Depends(verify_role(["super_admin"]))
 ):
     #Limpiar tokens expirados manualmente (solo super_admin)
     deleted_count = RefreshTokenService.cleanup_expired_tokens(db)
@@ -490,7 +494,7 @@ def cleanup_expired_tokens(
 def admin_revoke_user_sessions(
     usuario_id: int,
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["super_admin"]))
+    usuario_actual: Principal = Depends(verify_role(["super_admin"]))
 ):
     #Revocar todas las sesiones de un usuario específico (solo super_admin)
     # Verificar que el usuario existe
@@ -530,10 +534,13 @@ def change_password(
         )
     
     try:
-        # Actualizar contraseña
-        usuario_actual.password_hash = get_password_hash(request.new_password)
-        usuario_actual.fecha_actualizacion = datetime.now(pytz.timezone('America/Tegucigalpa'))
+        # Actualizar contraseña (sobre la fila de esta sesión, no el usuario cacheado)
+        db.query(Usuario).filter(Usuario.id == usuario_actual.id).update({
+            "password_hash": get_password_hash(request.new_password),
+            "fecha_actualizacion": datetime.now(pytz.timezone('America/Tegucigalpa'))
+        })
         db.commit()
+        invalidar_usuario(usuario_actual.id)
         
         # Invalidar todos los tokens existentes por seguridad
         revoked_count = RefreshTokenService.revoke_all_user_tokens(db, usuario_actual.id)
@@ -558,7 +565,7 @@ def debug_password_verification(
     user_email: str,
     test_password: str,
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["super_admin"]))
+    usuario_actual: Principal = Depends(verify_role(["super_admin"]))
 ):
     #Endpoint de debug para verificar problemas de contraseña (solo super_admin)
     user = db.query(Usuario).filter(Usuario.email == user_email).first()
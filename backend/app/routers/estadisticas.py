@@ -1,30 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from datetime import datetime, timezone
+from datetime import datetime, timezone, date, timedelta
+from typing import Optional
 from app.database import get_db
 from app.utils.security import verify_role, get_current_residencial_id
-from app.models.usuario import Usuario
-from app.schemas.estadisticas_schema import EstadisticasResponse
-from app.services.estadisticas_service import obtener_estadisticas_completas
+from app.schemas.auth_schema import Principal
+from app.schemas.estadisticas_schema import EstadisticasResponse, SerieActividad
+from app.services.estadisticas_service import obtener_estadisticas_completas, obtener_serie_actividad, GRANULARIDADES
+from app.utils.time import get_honduras_time
+from app.services.estadisticas_cache import cache_estadisticas
 
 router = APIRouter(prefix="/admin", tags=["Estadísticas"])
 
 @router.get("/estadisticas", response_model=EstadisticasResponse)
 def obtener_estadisticas(
     db: Session = Depends(get_db),
-    admin_actual: Usuario = Depends(verify_role(["admin"])),
+    admin_actual: Principal = Depends(verify_role(["admin"])),
     residencial_id: int = Depends(get_current_residencial_id)
 ):
     try:
+        en_cache = cache_estadisticas.obtener(residencial_id)
+        if en_cache is not None:
+            return en_cache
+
+        version = cache_estadisticas.version(residencial_id)
         estadisticas = obtener_estadisticas_completas(db, residencial_id)
         
-        return EstadisticasResponse(
+        respuesta = EstadisticasResponse(
             fecha_consulta=datetime.now(timezone.utc),
             **estadisticas
-        )
+        ).model_dump(mode="json")
+        cache_estadisticas.guardar(residencial_id, respuesta, version)
+        return respuesta
         
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error al obtener estadísticas: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+# Rango máximo por granularidad, para acotar el tamaño de la respuesta
+MAX_DIAS_SERIE = {"hora": 31, "dia": 366, "semana": 366 * 3}
+
+@router.get("/estadisticas/actividad", response_model=SerieActividad)
+def obtener_actividad(
+    desde: Optional[date] = Query(None, description="Día inicial (hora de Honduras). Por defecto, hace 6 días"),
+    hasta: Optional[date] = Query(None, description="Día final inclusive (hora de Honduras). Por defecto, hoy"),
+    granularidad: str = Query("hora", description="hora, dia o semana"),
+    db: Session = Depends(get_db),
+    admin_actual: Principal = Depends(verify_role(["admin"])),
+    residencial_id: int = Depends(get_current_residencial_id)
+):
+    if granularidad not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail="Granularidad inválida. Use: hora, dia o semana")
+    
+    hasta = hasta or get_honduras_time().date()
+    desde = desde or hasta - timedelta(days=6)
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="La fecha 'desde' no puede ser mayor que 'hasta'")
+    if (hasta - desde).days + 1 > MAX_DIAS_SERIE[granularidad]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Rango máximo para granularidad '{granularidad}': {MAX_DIAS_SERIE[granularidad]} días"
+        )
+    
+    try:
+        return obtener_serie_actividad(db, residencial_id, desde, hasta, granularidad)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al obtener actividad: {str(e)}"
+        )
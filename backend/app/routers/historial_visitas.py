@@ -10,19 +10,30 @@ from app.models.visita import Visita
 from app.models.visitante import Visitante
 from app.models.guardia import Guardia
 from app.schemas.visita_schema import HistorialVisitaResponse, HistorialVisitaItem, HistorialEscaneosDiaResponse, HistorialEscaneosTotalesResponse
-from app.schemas.auth_schema import TokenData
+from app.schemas.auth_schema import TokenData, Principal
 from app.services.visita_service import obtener_historial_escaneos_dia, obtener_historial_escaneos_totales
 
 router = APIRouter(prefix="/visitas", tags=["Visitas"])
 
 from sqlalchemy import or_
 from app.schemas.pagination import PaginatedResponse
+from app.utils.paginacion import validar_modos, condicion_keyset, cortar_pagina, contar
 import math
 
+def _completar_paginacion(result: dict, page: int, limit: int, paginacion: str) -> dict:
+    """Campos de paginación comunes a los historiales de escaneos."""
+    total = result["total_escaneos"]
+    result["page"] = page if paginacion == "offset" else None
+    result["limit"] = limit
+    result["total_pages"] = math.ceil(total / limit) if total is not None else None
+    if paginacion == "cursor":
+        result["has_more"] = result.get("next_cursor") is not None
+    return result
+
 @router.get("/admin/historial", response_model=PaginatedResponse[HistorialVisitaItem])
 def obtener_historial_visitas_admin(
     db: Session = Depends(get_db),
-    admin_actual: Usuario = Depends(verify_role(["admin"])),
+    admin_actual: Principal = Depends(verify_role(["admin"])),
     residencial_id: int = Depends(get_current_residencial_id),
     page: int = Query(1, ge=1, description="Número de página"),
     limit: int = Query(15, ge=1, le=100, description="Registros por página"),
@@ -30,15 +41,19 @@ def obtener_historial_visitas_admin(
     unidad_residencial: Optional[str] = Query(None, description="Filtrar por unidad residencial"),
     nombre_visitante: Optional[str] = Query(None, description="Filtrar por nombre del visitante"),
     estado: Optional[str] = Query(None, description="Filtrar por estado de la visita"),
-    q: Optional[str] = Query(None, description="Búsqueda general (Placa o Chasis)")
+    q: Optional[str] = Query(None, description="Búsqueda general (Placa o Chasis)"),
+    paginacion: str = Query("offset", description="offset o cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (modo cursor)"),
+    conteo: str = Query("exacto", description="exacto, estimado, cache o ninguno")
 ):
+    validar_modos(paginacion, conteo, cursor)
 
     # Construir consulta con joins y filtro por residencial_id
     query = db.query(Residente, Usuario, Visita, Visitante)\
               .join(Usuario, Usuario.id == Residente.usuario_id)\
               .join(Visita, Visita.residente_id == Residente.id)\
               .join(Visitante, Visitante.id == Visita.visitante_id)\
-              .filter(Residente.residencial_id == residencial_id)
+              .filter(Visita.residencial_id == residencial_id)
 
     # Aplicar filtros si se proporcionan
     if nombre_residente:
@@ -55,18 +70,26 @@ def obtener_historial_visitas_admin(
             Visitante.placa_chasis.ilike(f"%{q}%")
         ))
 
-    # Total de registros antes de paginar
-    total = query.count()
-
-    # Calcular offset y total de páginas
-    offset = (page - 1) * limit
-    total_pages = math.ceil(total / limit)
+    # Total de registros antes de paginar (exacto, estimado, en cache u omitido)
+    total, total_estimado = contar(
+        db, query, conteo,
+        ("historial_visitas", residencial_id, nombre_residente, unidad_residencial, nombre_visitante, estado, q)
+    )
+    total_pages = math.ceil(total / limit) if total is not None else None
 
     # Ejecutar la consulta ordenada y paginada
-    resultados = query.order_by(Visita.fecha_entrada.desc())\
-                      .offset(offset)\
-                      .limit(limit)\
-                      .all()
+    query = query.order_by(Visita.fecha_entrada.desc(), Visita.id.desc())
+    next_cursor = None
+    if paginacion == "cursor":
+        query = query.filter(Visita.fecha_entrada.isnot(None))
+        if cursor:
+            query = query.filter(condicion_keyset(Visita.fecha_entrada, Visita.id, cursor))
+        resultados, next_cursor = cortar_pagina(
+            query.limit(limit + 1).all(), limit, lambda fila: (fila[2].fecha_entrada, fila[2].id)
+        )
+    else:
+        offset = (page - 1) * limit
+        resultados = query.offset(offset).limit(limit).all()
 
     # Armar respuesta
     historial = [
@@ -92,40 +115,47 @@ def obtener_historial_visitas_admin(
 
     return PaginatedResponse(
         total=total,
-        page=page,
+        page=page if paginacion == "offset" else None,
         limit=limit,
         total_pages=total_pages,
-        data=historial
+        data=historial,
+        next_cursor=next_cursor,
+        has_more=next_cursor is not None if paginacion == "cursor" else None,
+        total_estimado=total_estimado
     )
 
 @router.get("/admin/escaneos-dia", response_model=HistorialEscaneosDiaResponse)
 def obtener_escaneos_dia_admin(
     db: Session = Depends(get_db),
-    admin_actual: Usuario = Depends(verify_role(["admin"])),
+    admin_actual: Principal = Depends(verify_role(["admin"])),
     residencial_id: int = Depends(get_current_residencial_id),
     nombre_guardia: Optional[str] = Query(None, description="Nombre del guardia para filtrar los escaneos"),
     page: int = Query(1, ge=1, description="Número de página"),
-    limit: int = Query(15, ge=1, le=100, description="Registros por página")
+    limit: int = Query(15, ge=1, le=100, description="Registros por página"),
+    paginacion: str = Query("offset", description="offset o cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (modo cursor)"),
+    conteo: str = Query("exacto", description="exacto, estimado, cache o ninguno")
 ):
-    result = obtener_historial_escaneos_dia(db, residencial_id=residencial_id, nombre_guardia=nombre_guardia, page=page, limit=limit)
-    total = result["total_escaneos"]
-    
-    result["page"] = page
-    result["limit"] = limit
-    result["total_pages"] = math.ceil(total / limit)
-    return result
+    validar_modos(paginacion, conteo, cursor)
+    result = obtener_historial_escaneos_dia(db, residencial_id=residencial_id, nombre_guardia=nombre_guardia, page=page, limit=limit,
+                                            paginacion=paginacion, cursor=cursor, conteo=conteo)
+    return _completar_paginacion(result, page, limit, paginacion)
 
 @router.get("/admin/escaneos-totales", response_model=HistorialEscaneosTotalesResponse)
 def obtener_escaneos_totales_admin(
     db: Session = Depends(get_db),
-    admin_actual: Usuario = Depends(verify_role(["admin"])),
+    admin_actual: Principal = Depends(verify_role(["admin"])),
     residencial_id: int = Depends(get_current_residencial_id),
     nombre_guardia: Optional[str] = Query(None, description="Nombre del guardia para filtrar los escaneos"),
     tipo_escaneo: Optional[str] = Query(None, description="Filtrar por tipo de escaneo (entrada/salida)"),
     estado_visita: Optional[str] = Query(None, description="Filtrar por estado de la visita"),
     page: int = Query(1, ge=1, description="Número de página"),
-    limit: int = Query(15, ge=1, le=100, description="Registros por página")
+    limit: int = Query(15, ge=1, le=100, description="Registros por página"),
+    paginacion: str = Query("offset", description="offset o cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (modo cursor)"),
+    conteo: str = Query("exacto", description="exacto, estimado, cache o ninguno")
 ):
+    validar_modos(paginacion, conteo, cursor)
     result = obtener_historial_escaneos_totales(
         db,
         residencial_id=residencial_id,
@@ -133,22 +163,24 @@ def obtener_escaneos_totales_admin(
         tipo_escaneo=tipo_escaneo,
         estado_visita=estado_visita,
         page=page,
-        limit=limit
+        limit=limit,
+        paginacion=paginacion,
+        cursor=cursor,
+        conteo=conteo
     )
-    total = result["total_escaneos"]
-    
-    result["page"] = page
-    result["limit"] = limit
-    result["total_pages"] = math.ceil(total / limit)
-    return result
+    return _completar_paginacion(result, page, limit, paginacion)
 
 @router.get("/guardia/escaneos-dia", response_model=HistorialEscaneosDiaResponse)
 def obtener_escaneos_dia_guardia(
     db: Session = Depends(get_db),
     usuario_actual: TokenData = Depends(get_current_user),
     page: int = Query(1, ge=1, description="Número de página"),
-    limit: int = Query(15, ge=1, le=100, description="Registros por página")
+    limit: int = Query(15, ge=1, le=100, description="Registros por página"),
+    paginacion: str = Query("offset", description="offset o cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (modo cursor)"),
+    conteo: str = Query("exacto", description="exacto, estimado, cache o ninguno")
 ):
+    validar_modos(paginacion, conteo, cursor)
     # Verificar que el usuario sea guardia
     if usuario_actual.rol != "guardia":
         raise HTTPException(status_code=403, detail="Solo los guardias pueden acceder a este endpoint")
@@ -158,10 +190,6 @@ def obtener_escaneos_dia_guardia(
     if not guardia:
         raise HTTPException(status_code=404, detail="Guardia no encontrado")
     
-    result = obtener_historial_escaneos_dia(db, guardia_id=guardia.id, residencial_id=guardia.residencial_id, page=page, limit=limit)
-    total = result["total_escaneos"]
-    
-    result["page"] = page
-    result["limit"] = limit
-    result["total_pages"] = math.ceil(total / limit)
-    return result
\ No newline at end of file
+    result = obtener_historial_escaneos_dia(db, guardia_id=guardia.id, residencial_id=guardia.residencial_id, page=page, limit=limit,
+                                            paginacion=paginacion, cursor=cursor, conteo=conteo)
+    return _completar_paginacion(result, page, limit, paginacion)
\ No newline at end of file
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
 from app.database import get_db
-from app.utils.security import verify_role, get_password_hash
+from app.utils.security import verify_role, get_password_hash, invalidar_usuario
 from app.models.usuario import Usuario
 from app.models.residencial import Residencial
 
@@ -37,6 +37,7 @@ def toggle_usuario_status(id: int, activo: bool, db: Session = Depends(get_db)):
     
     usuario.activo = activo
     db.commit()
+    invalidar_usuario(id)
     return {"message": f"Usuario {'activado' if activo else 'desactivado'} exitosamente", "activo": activo}
 
 @router.post("/{id}/reset-password", dependencies=[Depends(verify_role(["super_admin"]))])
@@ -48,4 +49,5 @@ def reset_usuario_password(id: int, password: str, db: Session = Depends(get_db)
     
     usuario.password_hash = get_password_hash(password)
     db.commit()
+    invalidar_usuario(id)
     return {"message": "Contraseña actualizada exitosamente"}
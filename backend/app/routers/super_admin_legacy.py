@@ -10,7 +10,7 @@ from app.models.admin import Administrador
 from app.models.residencial import Residencial
 from app.models.residente import Residente
 from app.models.guardia import Guardia
-from app.utils.security import verify_role
+from app.utils.security import verify_role, invalidar_usuario
 from app.services.vista_service import obtener_configuracion_vistas, asignar_vista_residencial, actualizar_vista_residencial, asignar_vista_admin, actualizar_vista_admin, listar_vistas
 from app.schemas.vista_residencial_schema import VistaResidencialCreate, VistaResidencialUpdate
 from app.schemas.vista_admin_schema import VistaAdminCreate, VistaAdminUpdate
@@ -605,6 +605,7 @@ def asignar_residencial_admin(admin_id: int, residencial_id: int, db: Session =
         admin_info.residencial_id = residencial_id
         
         db.commit()
+        invalidar_usuario(admin_usuario.id)
         
         return {
             "message": f"Residencial asignada exitosamente al administrador {admin_usuario.nombre}",
@@ -2,10 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Q
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.database import get_db
-from app.models import Usuario, EstadoTicket
+from app.models import EstadoTicket
 from app.schemas import TicketUpdate, TicketResponse, TicketListResponse
 from app.services.ticket_service import crear_ticket_service, listar_tickets_service, obtener_ticket_service, actualizar_ticket_service, listar_tickets_residente_service, eliminar_ticket_service
 from app.utils.security import verify_role, get_current_residencial_id
+from app.schemas.auth_schema import Principal
 
 router = APIRouter(prefix="/tickets", tags=["tickets"])
 
@@ -16,7 +17,7 @@ def crear_ticket(
     descripcion: str = Form(...),
     imagen: Optional[UploadFile] = File(None),
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["residente"]))
+    usuario_actual: Principal = Depends(verify_role(["residente"]))
 ):
     return crear_ticket_service(titulo, descripcion, imagen, db, usuario_actual)
 
@@ -31,7 +32,7 @@ def listar_tickets(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1),
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["admin"])),
+    usuario_actual: Principal = Depends(verify_role(["admin"])),
     residencial_id: int = Depends(get_current_residencial_id)
 ):
     offset = (page - 1) * limit
@@ -54,7 +55,7 @@ def listar_tickets_residente(
     page: int = Query(1, ge=1),
     limit: int = Query(15, ge=1),
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["residente"]))
+    usuario_actual: Principal = Depends(verify_role(["residente"]))
 ):
     result = listar_tickets_residente_service(db, usuario_actual, page, limit)
     total = result["total"]
@@ -70,7 +71,7 @@ def listar_tickets_residente(
 
 # 3. Obtener ticket por id (ambos roles)
 @router.get("/obtener_ticket/{ticket_id}", response_model=TicketResponse, name="Obtener ticket por ID")
-def obtener_ticket(ticket_id: int, db: Session = Depends(get_db), usuario_actual: Usuario = Depends(verify_role(["admin", "residente"]))):
+def obtener_ticket(ticket_id: int, db: Session = Depends(get_db), usuario_actual: Principal = Depends(verify_role(["admin", "residente"]))):
     return obtener_ticket_service(ticket_id, db, usuario_actual)
 
 # 4. Actualizar ticket (admin)
@@ -79,7 +80,7 @@ def actualizar_ticket(
     ticket_id: int,
     datos: TicketUpdate,
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["admin"]))
+    usuario_actual: Principal = Depends(verify_role(["admin"]))
 ):
     return actualizar_ticket_service(ticket_id, datos, db) 
 
@@ -88,6 +89,6 @@ def actualizar_ticket(
 def eliminar_ticket(
     ticket_id: int,
     db: Session = Depends(get_db),
-    usuario_actual: Usuario = Depends(verify_role(["super_admin", "admin", "residente"]))
+    usuario_actual: Principal = Depends(verify_role(["super_admin", "admin", "residente"]))
 ):
     return eliminar_ticket_service(ticket_id, db, usuario_actual)
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, File, UploadFile, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.schemas.visita_schema import VisitaCreate, VisitaQRResponse, ValidarQRRequest, AccionQR, RegistrarSalidaRequest, VisitaResponse, VisitaUpdate, SolicitudVisitaCreate, HistorialEscaneosDiaResponse, HistorialEscaneosTotalesResponse
+from app.schemas.visita_schema import VisitaCreate, VisitaQRResponse, VisitaMasivaCreate, LoteVisitasResponse, EstadoLoteResponse, EstadoQRResponse, PaqueteOfflineResponse, ValidarQRRequest, AccionQR, RegistrarSalidaRequest, VisitaResponse, VisitaUpdate, SolicitudVisitaCreate, HistorialEscaneosDiaResponse, HistorialEscaneosTotalesResponse
 from app.models.guardia import Guardia
 from app.models.residente import Residente
 from app.models.admin import Administrador
@@ -10,18 +12,20 @@ from app.models import Usuario
 from app.models.visita import Visita
 from app.models.escaneo_qr import EscaneoQR
 from app.services.visita_service import crear_visita_con_qr, validar_qr_entrada, registrar_salida_visita, obtener_visitas_residente, editar_visita_residente, eliminar_visita_residente, crear_solicitud_visita_residente, aprobar_solicitud_visita_admin, obtener_solicitudes_pendientes_admin
-from app.services.notificacion_service import enviar_notificacion_escaneo, enviar_notificacion_guardia
-from app.database import get_db
-from app.utils.security import get_current_user, verify_role
+from app.services.qr_emision_service import obtener_estado_qr_visita
+from app.services.visita_masiva_service import crear_visitas_masivas, leer_csv_visitantes, obtener_estado_lote
+from app.services.escaneo_service import obtener_paquete_offline
+from app.database import get_db, get_async_db
+from app.utils.security import get_current_user, verify_role, get_current_residencial_id
 from app.utils.time import extraer_modelo_dispositivo
 from app.schemas.auth_schema import TokenData
 from datetime import datetime, timezone
+from pydantic import ValidationError
 import logging
 import pytz
-from app.utils.cloudinary_utils import save_upload_to_temp
 from app.services.cloudinary_service import upload_image
-import os
 from app.schemas.pagination import PaginatedResponse
+from app.utils.paginacion import validar_modos
 import math
 
 router = APIRouter(prefix="/visitas", tags=["Visitas"])
@@ -29,6 +33,22 @@ router = APIRouter(prefix="/visitas", tags=["Visitas"])
 def get_username(usuario):
     return usuario.nombre or usuario.email or f"ID {usuario.id}"
 
+def _subir_imagenes_escaneo(imagenes: Optional[List[UploadFile]]) -> list[str]:
+    """Sube las evidencias del guardia directo desde el upload; un fallo no bloquea el escaneo."""
+    imagenes_urls = []
+    if not imagenes:
+        return imagenes_urls
+    try:
+        for img in imagenes:
+            # Validar tipo de archivo
+            if not img.content_type.startswith("image/"):
+                continue
+            result = upload_image(img.file, folder="escaneo_guardia")
+            imagenes_urls.append(result["secure_url"])
+    except Exception as e:
+        logging.error(f"Error subiendo imágenes: {str(e)}")
+    return imagenes_urls
+
 @router.post("/residente/crear_visita", response_model=list[VisitaQRResponse], dependencies=[Depends(verify_role(["admin", "residente"]))])
 def crear_visita(visita: VisitaCreate, db: Session = Depends(get_db), usuario: TokenData = Depends(get_current_user)):
     if usuario.rol == "admin":
@@ -51,14 +71,67 @@ def crear_visita(visita: VisitaCreate, db: Session = Depends(get_db), usuario: T
         raise HTTPException(status_code=403, detail="No autorizado para crear visitas.")
 
 
+@router.get("/residente/qr_estado/{visita_id}", response_model=EstadoQRResponse, dependencies=[Depends(verify_role(["admin", "residente"]))])
+def estado_qr_visita(
+    visita_id: int,
+    db: Session = Depends(get_db),
+    usuario: TokenData = Depends(get_current_user)
+):
+    """Consulta si la imagen QR de una visita ya fue emitida (qr_url disponible)."""
+    return obtener_estado_qr_visita(db, visita_id, usuario.id)
+
+
+@router.post("/admin/crear_visitas_masivas", response_model=LoteVisitasResponse, dependencies=[Depends(verify_role(["admin"]))])
+def crear_visitas_masivas_json(
+    datos: VisitaMasivaCreate,
+    db: Session = Depends(get_db),
+    usuario: TokenData = Depends(get_current_user)
+):
+    """Crea un lote de visitas (eventos, invitados recurrentes); los QR se emiten en segundo plano."""
+    return crear_visitas_masivas(db, datos, usuario.id)
+
+@router.post("/admin/crear_visitas_masivas/csv", response_model=LoteVisitasResponse, dependencies=[Depends(verify_role(["admin"]))])
+def crear_visitas_masivas_csv(
+    archivo: UploadFile = File(...),
+    motivo: str = Form(...),
+    fecha_entrada: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    usuario: TokenData = Depends(get_current_user)
+):
+    """Igual que la carga JSON, con un CSV cuyos encabezados son los campos del visitante."""
+    visitantes = leer_csv_visitantes(archivo.file.read(), motivo)
+    try:
+        datos = VisitaMasivaCreate(visitantes=visitantes, motivo=motivo, fecha_entrada=fecha_entrada)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Datos del lote inválidos: {e.errors()[0]['msg']}")
+    return crear_visitas_masivas(db, datos, usuario.id)
+
+@router.get("/admin/lote/{lote_id}", response_model=EstadoLoteResponse, dependencies=[Depends(verify_role(["admin"]))])
+def estado_lote_visitas(
+    lote_id: str,
+    db: Session = Depends(get_db),
+    residencial_id: int = Depends(get_current_residencial_id)
+):
+    """Avance de la emisión de QR de un lote creado con crear_visitas_masivas."""
+    return obtener_estado_lote(db, lote_id, residencial_id)
+
+@router.get("/guardia/paquete_offline", response_model=PaqueteOfflineResponse, dependencies=[Depends(verify_role(["admin", "guardia"]))])
+def paquete_offline(
+    db: Session = Depends(get_db),
+    residencial_id: int = Depends(get_current_residencial_id)
+):
+    """Visitas pendientes del día (con huella del QR) para pre-validar en el dispositivo sin conexión."""
+    return obtener_paquete_offline(db, residencial_id)
+
+
 @router.post("/guardia/validar_qr", dependencies=[Depends(verify_role(["admin", "guardia"]))])
-def validar_qr(
+async def validar_qr(
     raw_request: Request,
     qr_code: str = Form(..., description="Código QR escaneado"),
     accion: Optional[str] = Form(None, description="Acción a realizar (aprobar/rechazar)"),
     observacion: Optional[str] = Form(None, description="Observación opcional del guardia"),
     imagenes: List[UploadFile] = File(None, description="Imágenes de evidencia (máximo 3)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     usuario: TokenData = Depends(get_current_user)
 ):
     # Logging detallado para debugging
@@ -80,133 +153,56 @@ def validar_qr(
     if imagenes and len(imagenes) > 3:
         raise HTTPException(status_code=400, detail="Se permiten máximo 3 imágenes.")
 
-    # Subir imágenes a Cloudinary
-    imagenes_urls = []
-    if imagenes:
-        try:            
-            for img in imagenes:
-                # Validar tipo de archivo
-                if not img.content_type.startswith("image/"):
-                    continue
-                
-                temp_path = save_upload_to_temp(img)
-                try:
-                    result = upload_image(temp_path, folder="escaneo_guardia")
-                    imagenes_urls.append(result["secure_url"])
-                finally:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-        except Exception as e:
-            logging.error(f"Error subiendo imágenes: {str(e)}")
-            # No bloqueamos el flujo si fallan las imágenes, pero lo loggeamos
-
-    # Obtener el guardia actual
-    guardia = db.query(Guardia).filter(Guardia.usuario_id == usuario.id).first()
-    if not guardia:
-        logging.error(f"❌ Guardia no encontrado para usuario_id: {usuario.id}")
-        return {"valido": False, "error": "Guardia no encontrado"}
+    # Subir imágenes a Cloudinary (bloqueante: fuera del event loop)
+    imagenes_urls = await run_in_threadpool(_subir_imagenes_escaneo, imagenes)
+
+    # Dispositivo del guardia (el escaneo se registra en la misma transacción que la validación)
+    user_agent_str = raw_request.headers.get("user-agent", "desconocido")
+    modelo_dispositivo = extraer_modelo_dispositivo(user_agent_str)
 
     # Llamar al servicio para validar el QR
-    resultado = validar_qr_entrada(db, qr_code, guardia.id, accion, observacion, imagenes_urls)
+    resultado = await validar_qr_entrada(db, qr_code, usuario.id, accion, observacion, imagenes_urls, modelo_dispositivo)
     
     if not resultado["valido"]:
         return resultado
 
-    # Registrar el escaneo QR
-    user_agent_str = raw_request.headers.get("user-agent", "desconocido")
-    modelo_dispositivo = extraer_modelo_dispositivo(user_agent_str)
-
-    escaneo_qr = EscaneoQR(
-        visita_id=resultado["visita_id"],
-        guardia_id=guardia.id,
-        dispositivo=modelo_dispositivo
-    )
-    db.add(escaneo_qr)
-    db.commit()
-
-    # Obtener el estado actualizado de la visita para confirmar el cambio
-    visita_actualizada = db.query(Visita).filter(Visita.id == resultado["visita_id"]).first()
-
-    # Enviar notificación al residente después del escaneo
-    try:
-        usuario_obj = db.query(Usuario).filter(Usuario.id == usuario.id).first()
-        enviar_notificacion_escaneo(db, visita_actualizada, get_username(usuario_obj))
-    except Exception as e:
-        logging.error(f"Error al enviar notificación tras escaneo QR: {e}")
-        
     return {
         "valido": True,
         "visitante": resultado["visitante"],
-        "estado": visita_actualizada.estado,
+        "estado": resultado["estado"],
         "visita_id": resultado["visita_id"],
         "accion_aplicada": accion,
-        "observacion_entrada": getattr(visita_actualizada, "observacion_entrada", None),
+        "observacion_entrada": resultado["observacion_entrada"],
         "imagenes": imagenes_urls,
         "guardia": {
-            "id": guardia.id,
-            "nombre": guardia.usuario.nombre if guardia.usuario else f"Guardia {guardia.id}",
+            "id": resultado["guardia"]["id"],
+            "nombre": resultado["guardia"]["nombre"],
             "rol": usuario.rol
         }
     }
 
 @router.post("/guardia/registrar_salida", dependencies=[Depends(verify_role(["admin", "guardia"]))])
-def registrar_salida(
+async def registrar_salida(
     raw_request: Request,
     qr_code: str = Form(..., description="Código QR escaneado"),
     observacion: Optional[str] = Form(None, description="Observación opcional de salida"),
     imagenes: List[UploadFile] = File(None, description="Imágenes de evidencia (máximo 3)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     usuario: TokenData = Depends(get_current_user)
 ):
     # Validar cantidad de imágenes
     if imagenes and len(imagenes) > 3:
         raise HTTPException(status_code=400, detail="Se permiten máximo 3 imágenes.")
 
-    # Subir imágenes a Cloudinary
-    imagenes_urls = []
-    if imagenes:
-        try:
-            for img in imagenes:
-                if not img.content_type.startswith("image/"):
-                    continue
-                
-                temp_path = save_upload_to_temp(img)
-                try:
-                    result = upload_image(temp_path, folder="escaneo_guardia")
-                    imagenes_urls.append(result["secure_url"])
-                finally:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-        except Exception as e:
-            logging.error(f"Error subiendo imágenes de salida: {str(e)}")
-
-    # Obtener el guardia actual
-    guardia = db.query(Guardia).filter(Guardia.usuario_id == usuario.id).first()
-    if not guardia:
-        raise HTTPException(status_code=404, detail="Guardia no encontrado")
-    
-    # Llamar al servicio para registrar la salida
-    resultado = registrar_salida_visita(db, qr_code, guardia.id, observacion, imagenes_urls)
-    
-    # Registrar el escaneo de salida
+    # Subir imágenes a Cloudinary (bloqueante: fuera del event loop)
+    imagenes_urls = await run_in_threadpool(_subir_imagenes_escaneo, imagenes)
+
+    # Dispositivo del guardia (el escaneo se registra en la misma transacción que la salida)
     user_agent_str = raw_request.headers.get("user-agent", "desconocido")
     modelo_dispositivo = extraer_modelo_dispositivo(user_agent_str)
     
-    escaneo_salida = EscaneoQR(
-        visita_id=resultado["visita_id"],
-        guardia_id=guardia.id,
-        dispositivo=modelo_dispositivo
-    )
-    db.add(escaneo_salida)
-    db.commit()
-    
-    # Enviar notificación al residente sobre la salida
-    try:
-        usuario_obj = db.query(Usuario).filter(Usuario.id == usuario.id).first()
-        visita = db.query(Visita).filter(Visita.id == resultado["visita_id"]).first()
-        enviar_notificacion_escaneo(db, visita, get_username(usuario_obj), es_salida=True)
-    except Exception as e:
-        logging.error(f"Error al enviar notificación de salida: {e}")
+    # Llamar al servicio para registrar la salida
+    resultado = await registrar_salida_visita(db, qr_code, usuario.id, observacion, imagenes_urls, modelo_dispositivo)
     
     return {
         "mensaje": resultado["mensaje"],
@@ -216,30 +212,37 @@ def registrar_salida(
         "observacion_salida": resultado.get("observacion_salida"),
         "imagenes": resultado.get("imagenes", []),
         "guardia": {
-            "id": guardia.id,
-            "nombre": guardia.usuario.nombre if guardia.usuario else usuario_obj.nombre,
+            "id": resultado["guardia"]["id"],
+            "nombre": resultado["guardia"]["nombre"],
             "rol": usuario.rol
         }
     }
 
 @router.get("/residente/mis_visitas", response_model=PaginatedResponse[VisitaResponse], dependencies=[Depends(verify_role(["residente", "admin"]))])
-def mis_visitas(
+async def mis_visitas(
     page: int = Query(1, ge=1),
     limit: int = Query(15, ge=1),
-    db: Session = Depends(get_db),
+    paginacion: str = Query("offset", description="offset o cursor"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (modo cursor)"),
+    conteo: str = Query("exacto", description="exacto, estimado, cache o ninguno"),
+    db: AsyncSession = Depends(get_async_db),
     usuario: TokenData = Depends(get_current_user)
 ):
-    result = obtener_visitas_residente(db, usuario.id, page, limit)
+    validar_modos(paginacion, conteo, cursor)
+    result = await obtener_visitas_residente(db, usuario.id, page, limit, paginacion, cursor, conteo)
     
     total = result["total"]
-    total_pages = math.ceil(total / limit)
+    total_pages = math.ceil(total / limit) if total is not None else None
     
     return PaginatedResponse(
         total=total,
-        page=page,
+        page=page if paginacion == "offset" else None,
         limit=limit,
         total_pages=total_pages,
-        data=result["data"]
+        data=result["data"],
+        next_cursor=result["next_cursor"],
+        has_more=result["next_cursor"] is not None if paginacion == "cursor" else None,
+        total_estimado=result["total_estimado"]
     )
 
 @router.patch("/residente/editar_visita/{visita_id}", response_model=VisitaResponse, dependencies=[Depends(verify_role(["residente", "admin"]))])
@@ -265,7 +268,9 @@ def editar_visita(
         qr_code=visita.qr_code,
         qr_expiracion=visita.qr_expiracion,
         qr_code_img_base64=getattr(visita, "qr_code_img_base64", ""),
-        tipo_creador=visita.tipo_creador
+        tipo_creador=visita.tipo_creador,
+        qr_url=visita.qr_url,
+        qr_estado=visita.qr_estado
     )
 
 @router.delete("/residente/eliminar_visita/{visita_id}", dependencies=[Depends(verify_role(["residente", "admin"]))])
@@ -348,6 +353,7 @@ def obtener_escaneos_guardia_admin(
     guardia_id: int = None,
     fecha_inicio: str = None,
     fecha_fin: str = None,
+    tipo_escaneo: str = None,
     limit: int = 50
 ):
     """Endpoint para que los administradores vean los escaneos realizados por guardias"""
@@ -382,6 +388,9 @@ def obtener_escaneos_guardia_admin(
         if guardia_id:
             query = query.filter(EscaneoQR.guardia_id == guardia_id)
         
+        if tipo_escaneo in ("entrada", "salida"):
+            query = query.filter(EscaneoQR.tipo == tipo_escaneo)
+        
         # Filtrar por fechas si se proporcionan
         if fecha_inicio:
             try:
@@ -403,9 +412,6 @@ def obtener_escaneos_guardia_admin(
         # Procesar resultados
         escaneos = []
         for escaneo, visita, visitante, guardia, nombre_guardia in resultados:
-            # Determinar tipo de escaneo
-            tipo_escaneo = "salida" if visita.fecha_salida and escaneo.fecha_escaneo >= visita.fecha_salida else "entrada"
-            
             # Obtener información del residente
             residente_info = {"nombre": "N/A", "unidad": "N/A"}
             if visita.residente_id:
@@ -439,7 +445,7 @@ def obtener_escaneos_guardia_admin(
                     "fecha_entrada": visita.fecha_entrada,
                     "fecha_salida": visita.fecha_salida
                 },
-                "tipo_escaneo": tipo_escaneo
+                "tipo_escaneo": escaneo.tipo
             })
         
         return {
@@ -522,12 +528,7 @@ def obtener_visitas_del_dia(
         # Filtrar por residencial si es guardia
         if residencial_id:
             # Filtrar visitas del residencial del guardia
-            query = query.outerjoin(Residente, Visita.residente_id == Residente.id)
-            query = query.outerjoin(Administrador, Visita.admin_id == Administrador.id)
-            query = query.filter(
-                (Residente.residencial_id == residencial_id) | 
-                (Administrador.residencial_id == residencial_id)
-            )
+            query = query.filter(Visita.residencial_id == residencial_id)
         
         # Filtrar por estado si se especifica
         if estado:
@@ -12,6 +12,13 @@ class TokenData(BaseModel):
     rol: str | None = None
     residencial_id: int | None = None
 
+class Principal(BaseModel):
+    """Usuario autenticado construido solo con los claims del access token."""
+    id: int
+    email: str | None = None
+    rol: str | None = None
+    residencial_id: int | None = None
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, date
 
 class EstadisticaEstado(BaseModel):
     estado: str
@@ -30,6 +30,16 @@ class EstadisticaResidente(BaseModel):
     unidad_residencial: str
     total_visitas: int
 
+class SerieActividad(BaseModel):
+    granularidad: str
+    zona_horaria: str
+    desde: date
+    hasta: date
+    # Arreglos paralelos: buckets[i] (inicio del bucket, hora local) -> entradas[i], salidas[i]
+    buckets: List[datetime]
+    entradas: List[int]
+    salidas: List[int]
+
 class EstadisticasGenerales(BaseModel):
     total_visitas: int
     visitas_pendientes: int
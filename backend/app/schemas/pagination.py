@@ -1,11 +1,16 @@
-from typing import Generic, TypeVar, List
+from typing import Generic, TypeVar, List, Optional
 from pydantic import BaseModel
 
 T = TypeVar("T")
 
 class PaginatedResponse(BaseModel, Generic[T]):
-    total: int
-    page: int
+    # total/total_pages son None cuando se pide conteo="ninguno"; page es None en modo cursor
+    total: Optional[int]
+    page: Optional[int]
     limit: int
-    total_pages: int
+    total_pages: Optional[int]
     data: List[T]
+    # Modo cursor (keyset): next_cursor es None en la última página
+    next_cursor: Optional[str] = None
+    has_more: Optional[bool] = None
+    total_estimado: bool = False
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, validator, field_validator
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, date
 from .visitante_schema import VisitanteResponse, VisitanteCreate
 from enum import Enum
 from typing import List
@@ -64,6 +64,35 @@ class VisitaCreate(BaseModel):
             return None
         return v
 
+# Tope de visitantes por carga masiva (JSON o CSV)
+MAX_VISITAS_MASIVAS = 5000
+
+class VisitaMasivaCreate(BaseModel):
+    visitantes: List[VisitanteCreate] = Field(..., min_length=1, max_length=MAX_VISITAS_MASIVAS)
+    notas: str = Field(..., alias="motivo")
+    fecha_entrada: Optional[datetime] = None
+
+    @validator("fecha_entrada", pre=True)
+    def parse_fecha_entrada(cls, v):
+        if v == "" or v is None:
+            return None
+        return v
+
+class LoteVisitasResponse(BaseModel):
+    lote_id: str
+    total: int
+    visita_ids: List[int]
+    fecha_entrada: datetime
+    qr_expiracion: datetime
+
+class EstadoLoteResponse(BaseModel):
+    lote_id: str
+    total: int
+    pendientes: int
+    generados: int
+    fallidos: int
+    completado: bool
+
 class VisitaQRResponse(BaseModel):
     id: int
     residente_id: Optional[int] = None
@@ -76,9 +105,10 @@ class VisitaQRResponse(BaseModel):
     estado: str
     qr_code: str
     qr_expiracion: datetime
-    qr_code_img_base64: str
+    qr_code_img_base64: Optional[str] = ""
     tipo_creador: str
     qr_url: Optional[str] = None
+    qr_estado: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -147,6 +177,7 @@ class VisitaResponse(BaseModel):
     qr_code_img_base64: Optional[str] = ""
     tipo_creador: str
     qr_url: Optional[str] = None
+    qr_estado: Optional[str] = None
     observacion_entrada: Optional[str] = None
     observacion_salida: Optional[str] = None
     imagenes: List[VisitaImagenSchema] = []
@@ -154,6 +185,24 @@ class VisitaResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EstadoQRResponse(BaseModel):
+    visita_id: int
+    qr_estado: Optional[str] = None
+    qr_url: Optional[str] = None
+
+class VisitaOfflineItem(BaseModel):
+    visita_id: int
+    qr_huella: str  # sha256 hex del código QR
+    fecha_entrada: datetime
+    qr_expiracion: datetime
+
+class PaqueteOfflineResponse(BaseModel):
+    residencial_id: int
+    fecha: date
+    generado: datetime
+    vigente_hasta: datetime
+    visitas: List[VisitaOfflineItem]
+
 class RegistrarSalidaRequest(BaseModel):
     qr_code: str
 
@@ -177,19 +226,25 @@ class EscaneoDiaItem(BaseModel):
 
 class HistorialEscaneosDiaResponse(BaseModel):
     escaneos: List[EscaneoDiaItem]
-    total_escaneos: int
+    total_escaneos: Optional[int]
     fecha_consulta: datetime
-    page: int = 1
+    page: Optional[int] = 1
     limit: int = 15
-    total_pages: int = 1
+    total_pages: Optional[int] = 1
+    next_cursor: Optional[str] = None
+    has_more: Optional[bool] = None
+    total_estimado: bool = False
     
 class HistorialEscaneosTotalesResponse(BaseModel):
     escaneos: List[EscaneoDiaItem]
-    total_escaneos: int
+    total_escaneos: Optional[int]
     fecha_consulta: datetime
-    page: int = 1
+    page: Optional[int] = 1
     limit: int = 15
-    total_pages: int = 1
+    total_pages: Optional[int] = 1
+    next_cursor: Optional[str] = None
+    has_more: Optional[bool] = None
+    total_estimado: bool = False
 
 class VisitaUpdate(BaseModel):
     fecha_entrada: Optional[datetime] = None
@@ -2,6 +2,7 @@ import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 from app.core.config import settings
+from typing import Union, BinaryIO
 
 # 🔧 Configuración inicial de Cloudinary
 cloudinary.config(
@@ -11,12 +12,13 @@ cloudinary.config(
     secure=True
 )
 
-def upload_image(file_path: str, folder: str, public_id: str = None):
+def upload_image(file_path: Union[str, bytes, BinaryIO], folder: str, public_id: str = None):
     """
     Sube una imagen a Cloudinary en la carpeta especificada.
     
     Args:
-        file_path (str): Ruta local del archivo a subir.
+        file_path (str | bytes | BinaryIO): Ruta local del archivo a subir, o bien los bytes
+            / un buffer en memoria (ej. io.BytesIO) para subir sin escribir a disco.
         folder (str): Carpeta en Cloudinary (ej. 'qr', 'social', 'tickets').
         public_id (str, optional): Nombre único para la imagen. Si no se pasa, Cloudinary genera uno.
     
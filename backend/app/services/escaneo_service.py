@@ -0,0 +1,133 @@
+from collections import deque
+from datetime import timedelta
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.visita import Visita
+from app.models.visitante import Visitante
+from app.models.guardia import Guardia
+from app.models.usuario import Usuario
+from app.utils.qr import huella_qr
+from app.utils.time import get_honduras_time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class MetricasEscaneo:
+    """Ventana deslizante de latencias de escaneo (ms) para reportar p50/p99 por tipo."""
+
+    def __init__(self, ventana: int = 1000):
+        self._muestras = {
+            "entrada": deque(maxlen=ventana),
+            "salida": deque(maxlen=ventana)
+        }
+        # QR rechazados por firma/expiración sin llegar a la BD
+        self._rechazos_sin_bd = {"entrada": 0, "salida": 0}
+        self._lock = threading.Lock()
+
+    def registrar(self, tipo: str, duracion_ms: float):
+        with self._lock:
+            self._muestras[tipo].append(duracion_ms)
+
+    def registrar_rechazo(self, tipo: str):
+        with self._lock:
+            self._rechazos_sin_bd[tipo] += 1
+
+    @staticmethod
+    def _percentil(ordenadas: list[float], p: float) -> float:
+        if not ordenadas:
+            return 0.0
+        indice = min(len(ordenadas) - 1, round(p / 100 * (len(ordenadas) - 1)))
+        return round(ordenadas[indice], 2)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            copias = {tipo: sorted(muestras) for tipo, muestras in self._muestras.items()}
+            rechazos = dict(self._rechazos_sin_bd)
+        return {
+            tipo: {
+                "muestras": len(ordenadas),
+                "p50_ms": self._percentil(ordenadas, 50),
+                "p99_ms": self._percentil(ordenadas, 99),
+                "rechazos_sin_bd": rechazos[tipo]
+            }
+            for tipo, ordenadas in copias.items()
+        }
+
+# Instancia compartida por el proceso
+metricas_escaneo = MetricasEscaneo()
+
+async def resolver_escaneo(db: AsyncSession, qr_code: str, usuario_id: int, bloquear: bool = True, visita_id: int = None) -> list:
+    """
+    Resuelve en una sola consulta la(s) visita(s) del QR, su visitante, su residencial
+    (visitas.residencial_id) y el guardia que escanea (por usuario_id).
+    Con bloquear=True toma SELECT ... FOR UPDATE sobre la visita para evitar doble aprobación.
+    Si se conoce el visita_id (payload ya verificado) se filtra también por la PK.
+
+    Cada fila: (Visita, Visitante, Guardia | None, guardia_nombre | None, visita_residencial_id | None)
+    """
+    UsuarioGuardia = aliased(Usuario)
+    stmt = select(
+        Visita,
+        Visitante,
+        Guardia,
+        UsuarioGuardia.nombre.label('guardia_nombre'),
+        Visita.residencial_id.label('visita_residencial_id')
+    ).join(
+        Visitante, Visita.visitante_id == Visitante.id
+    ).outerjoin(
+        Guardia, Guardia.usuario_id == usuario_id
+    ).outerjoin(
+        UsuarioGuardia, Guardia.usuario_id == UsuarioGuardia.id
+    ).where(
+        Visita.qr_code == qr_code
+    )
+
+    if visita_id is not None:
+        stmt = stmt.where(Visita.id == visita_id)
+
+    if bloquear:
+        stmt = stmt.with_for_update(of=Visita)
+
+    resultado = await db.execute(stmt)
+    return resultado.all()
+
+def obtener_paquete_offline(db: Session, residencial_id: int) -> dict:
+    """
+    Paquete de pre-validación para dispositivos de guardia con conectividad inestable:
+    visitas pendientes del día de la residencial con la huella (sha256) de su QR.
+    El dispositivo calcula la huella del código escaneado y la busca en el paquete.
+    """
+    ahora = get_honduras_time()
+    inicio_dia = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
+    fin_dia = inicio_dia + timedelta(days=1)
+
+    filas = db.query(
+        Visita.id,
+        Visita.qr_code,
+        Visita.fecha_entrada,
+        Visita.qr_expiracion
+    ).filter(
+        Visita.residencial_id == residencial_id,
+        Visita.estado == "pendiente",
+        Visita.fecha_entrada < fin_dia,
+        Visita.qr_expiracion > ahora
+    ).order_by(Visita.fecha_entrada).all()
+
+    return {
+        "residencial_id": residencial_id,
+        "fecha": inicio_dia.date(),
+        "generado": ahora,
+        "vigente_hasta": fin_dia,
+        "visitas": [
+            {
+                "visita_id": visita_id,
+                "qr_huella": huella_qr(qr_code),
+                "fecha_entrada": fecha_entrada,
+                "qr_expiracion": qr_expiracion
+            }
+            for visita_id, qr_code, fecha_entrada, qr_expiracion in filas
+            if qr_code
+        ]
+    }
@@ -0,0 +1,150 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+from app.core.config import settings
+import threading
+import time
+
+class BackendCache(ABC):
+    """
+    Interfaz mínima de almacenamiento para el cache de estadísticas.
+    Los valores son dicts serializables a JSON, así que un backend de red
+    (p. ej. Redis con SETEX/GET/DEL) puede implementarla sin cambiar a los llamadores.
+    """
+
+    @abstractmethod
+    def obtener(self, clave: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def guardar(self, clave: str, valor: Any, ttl: int):
+        ...
+
+    @abstractmethod
+    def eliminar(self, clave: str):
+        ...
+
+    @abstractmethod
+    def limpiar(self):
+        ...
+
+    @abstractmethod
+    def tamano(self) -> int:
+        ...
+
+class BackendCacheMemoria(BackendCache):
+    """LRU con TTL en memoria del proceso (cada worker tiene el suyo)."""
+
+    def __init__(self, max_entradas: int):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] < time.monotonic():
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[1]
+
+    def guardar(self, clave: str, valor: Any, ttl: int):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def eliminar(self, clave: str):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def tamano(self) -> int:
+        with self._lock:
+            return len(self._entradas)
+
+class CacheEstadisticas:
+    """
+    Cache de la respuesta de estadísticas por residencial. Se invalida cuando cambia
+    una visita o un escaneo (validar_qr_entrada, registrar_salida_visita,
+    crear_visita_con_qr, jobs de expiración y rollups); el TTL acota lo que
+    quede fuera de esos eventos.
+
+    Cada invalidación sube la versión de la residencial; un cálculo que empezó
+    antes de invalidar no se guarda, para no cachear datos ya viejos.
+    """
+
+    def __init__(self, backend: BackendCache, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self._versiones = {}
+        self._version_global = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidaciones = 0
+
+    @staticmethod
+    def _clave(residencial_id: int) -> str:
+        return f"estadisticas:{residencial_id}"
+
+    def version(self, residencial_id: int) -> tuple:
+        with self._lock:
+            return (self._version_global, self._versiones.get(residencial_id, 0))
+
+    def obtener(self, residencial_id: int) -> Optional[dict]:
+        valor = self.backend.obtener(self._clave(residencial_id))
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return valor
+
+    def guardar(self, residencial_id: int, valor: dict, version: tuple):
+        if self.version(residencial_id) != version:
+            return
+        self.backend.guardar(self._clave(residencial_id), valor, self.ttl)
+
+    def invalidar(self, residencial_id: int):
+        if residencial_id is None:
+            return
+        with self._lock:
+            self._versiones[residencial_id] = self._versiones.get(residencial_id, 0) + 1
+            self.invalidaciones += 1
+        self.backend.eliminar(self._clave(residencial_id))
+
+    def invalidar_todo(self):
+        with self._lock:
+            self._version_global += 1
+            self.invalidaciones += 1
+        self.backend.limpiar()
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": self.backend.tamano(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidaciones": self.invalidaciones,
+                "ttl": self.ttl
+            }
+
+cache_estadisticas = CacheEstadisticas(
+    BackendCacheMemoria(settings.ESTADISTICAS_CACHE_MAX),
+    settings.ESTADISTICAS_CACHE_TTL
+)
+
+def invalidar_estadisticas(residencial_id: int = None):
+    """Invalida las estadísticas de una residencial, o de todas si no se indica."""
+    if residencial_id is None:
+        cache_estadisticas.invalidar_todo()
+    else:
+        cache_estadisticas.invalidar(residencial_id)
@@ -1,18 +1,23 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract, case, and_
-from datetime import datetime, timezone, timedelta
+from sqlalchemy import func, extract
+from datetime import datetime, timezone, timedelta, date
 from typing import Dict, List
-from app.models.visita import Visita
-from app.models.escaneo_qr import EscaneoQR
-from app.models.visitante import Visitante
 from app.models.residente import Residente
 from app.models.guardia import Guardia
 from app.models.usuario import Usuario
-from app.models.admin import Administrador
+from app.models.estadistica_rollup import EstadisticaVisitaDia, EstadisticaEscaneoHora, EstadisticaVisitasResidente
 from app.schemas.estadisticas_schema import (
     EstadisticasGenerales, EstadisticaEstado, EstadisticaHorario,
-    EstadisticaGuardia, EstadisticaVehiculo, EstadisticaResidente
+    EstadisticaGuardia, EstadisticaVehiculo, EstadisticaResidente,
+    SerieActividad
 )
+from app.utils.time import get_honduras_time
+import pytz
+
+# Zona de los buckets. Honduras no tiene horario de verano y su desfase es de horas
+# completas, así que las horas UTC del rollup caen enteras en horas/días/semanas locales.
+ZONA_HORARIA = 'America/Tegucigalpa'
+GRANULARIDADES = {"hora": "hour", "dia": "day", "semana": "week"}
 
 def to_utc(dt: datetime) -> datetime:
     """Convierte una fecha a UTC"""
@@ -22,74 +27,56 @@ def to_utc(dt: datetime) -> datetime:
         return dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(timezone.utc)
 
+def _inicio_dia_local(dia: date = None) -> datetime:
+    """Medianoche en Honduras (con tz) del día indicado, o de hoy."""
+    tz = pytz.timezone(ZONA_HORARIA)
+    dia = dia or get_honduras_time().date()
+    return tz.localize(datetime(dia.year, dia.month, dia.day))
+
+def _visitas_por_estado(db: Session, residencial_id: int) -> Dict[str, int]:
+    """Totales por estado desde el rollup diario (sin leer la tabla de visitas)."""
+    filas = db.query(
+        EstadisticaVisitaDia.estado,
+        func.sum(EstadisticaVisitaDia.cantidad)
+    ).filter(
+        EstadisticaVisitaDia.residencial_id == residencial_id
+    ).group_by(EstadisticaVisitaDia.estado).all()
+    return {estado: int(cantidad) for estado, cantidad in filas if cantidad}
+
 def obtener_estadisticas_generales(db: Session, residencial_id: int) -> EstadisticasGenerales:
     """Obtiene estadísticas generales del sistema filtradas por residencial"""
-    now_utc = datetime.now(timezone.utc)
-    fecha_inicio = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # Estadísticas de visitas filtradas por residencial
-    visitas_query = db.query(Visita).join(
-        Residente, Visita.residente_id == Residente.id
-    ).filter(Residente.residencial_id == residencial_id)
+    fecha_inicio = _inicio_dia_local()
     
-    total_visitas = visitas_query.count()
-    visitas_pendientes = visitas_query.filter(Visita.estado == "pendiente").count()
-    visitas_aprobadas = visitas_query.filter(Visita.estado == "aprobado").count()
-    visitas_completadas = visitas_query.filter(Visita.estado == "completado").count()
-    visitas_rechazadas = visitas_query.filter(Visita.estado == "rechazado").count()
-    visitas_expiradas = visitas_query.filter(Visita.estado == "expirado").count()
+    por_estado = _visitas_por_estado(db, residencial_id)
     
-    # Estadísticas de escaneos del día filtradas por residencial
-    escaneos_query = db.query(EscaneoQR).join(
-        Visita, EscaneoQR.visita_id == Visita.id
-    ).join(
-        Residente, Visita.residente_id == Residente.id
+    # Escaneos del día desde el rollup por hora
+    escaneos = db.query(
+        func.coalesce(func.sum(EstadisticaEscaneoHora.entradas), 0).label('entradas'),
+        func.coalesce(func.sum(EstadisticaEscaneoHora.salidas), 0).label('salidas')
     ).filter(
-        EscaneoQR.fecha_escaneo >= fecha_inicio,
-        Residente.residencial_id == residencial_id
-    )
-    
-    total_escaneos_hoy = escaneos_query.count()
-    
-    # Escaneos de entrada vs salida del día
-    escaneos_hoy = escaneos_query.all()
-    
-    escaneos_entrada_hoy = 0
-    escaneos_salida_hoy = 0
-    
-    for escaneo in escaneos_hoy:
-        fecha_escaneo_utc = to_utc(escaneo.fecha_escaneo)
-        if escaneo.visita.fecha_salida and fecha_escaneo_utc >= to_utc(escaneo.visita.fecha_salida):
-            escaneos_salida_hoy += 1
-        else:
-            escaneos_entrada_hoy += 1
+        EstadisticaEscaneoHora.residencial_id == residencial_id,
+        EstadisticaEscaneoHora.hora >= fecha_inicio
+    ).one()
     
     return EstadisticasGenerales(
-        total_visitas=total_visitas,
-        visitas_pendientes=visitas_pendientes,
-        visitas_aprobadas=visitas_aprobadas,
-        visitas_completadas=visitas_completadas,
-        visitas_rechazadas=visitas_rechazadas,
-        visitas_expiradas=visitas_expiradas,
-        total_escaneos_hoy=total_escaneos_hoy,
-        escaneos_entrada_hoy=escaneos_entrada_hoy,
-        escaneos_salida_hoy=escaneos_salida_hoy
+        total_visitas=sum(por_estado.values()),
+        visitas_pendientes=por_estado.get("pendiente", 0),
+        visitas_aprobadas=por_estado.get("aprobado", 0),
+        visitas_completadas=por_estado.get("completado", 0),
+        visitas_rechazadas=por_estado.get("rechazado", 0),
+        visitas_expiradas=por_estado.get("expirado", 0),
+        total_escaneos_hoy=escaneos.entradas + escaneos.salidas,
+        escaneos_entrada_hoy=escaneos.entradas,
+        escaneos_salida_hoy=escaneos.salidas
     )
 
 def obtener_estadisticas_estados(db: Session, residencial_id: int) -> List[EstadisticaEstado]:
-    resultados = db.query(
-        Visita.estado,
-        func.count(Visita.id).label('cantidad')
-    ).join(
-        Residente, Visita.residente_id == Residente.id
-    ).filter(
-        Residente.residencial_id == residencial_id
-    ).group_by(Visita.estado).all()
+    resultados = _visitas_por_estado(db, residencial_id)
     
-    total_visitas = sum(r.cantidad for r in resultados)
+    total_visitas = sum(resultados.values())
     
     estadisticas = []
-    for estado, cantidad in resultados:
+    for estado, cantidad in resultados.items():
         porcentaje = (cantidad / total_visitas * 100) if total_visitas > 0 else 0
         estadisticas.append(EstadisticaEstado(
             estado=estado,
@@ -101,32 +88,22 @@ def obtener_estadisticas_estados(db: Session, residencial_id: int) -> List[Estad
 
 def obtener_estadisticas_horarios(db: Session, residencial_id: int) -> List[EstadisticaHorario]:
     """Obtiene estadísticas de actividad por hora filtradas por residencial"""
-    now_utc = datetime.now(timezone.utc)
-    fecha_inicio = now_utc.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=7)
+    fecha_inicio = _inicio_dia_local() - timedelta(days=7)
     
-    # Obtener escaneos de la última semana filtrados por residencial
-    escaneos = db.query(EscaneoQR, Visita).join(
-        Visita, EscaneoQR.visita_id == Visita.id
-    ).join(
-        Residente, Visita.residente_id == Residente.id
+    # Hora del día en Honduras, calculada en SQL sobre el rollup por hora
+    hora = extract('hour', func.timezone(ZONA_HORARIA, EstadisticaEscaneoHora.hora))
+    resultados = db.query(
+        hora.label('hora'),
+        func.sum(EstadisticaEscaneoHora.entradas).label('entradas'),
+        func.sum(EstadisticaEscaneoHora.salidas).label('salidas')
     ).filter(
-        EscaneoQR.fecha_escaneo >= fecha_inicio,
-        Residente.residencial_id == residencial_id
-    ).all()
-    
-    # Agrupar por hora
-    horarios = {}
-    for i in range(24):
-        horarios[i] = {"entradas": 0, "salidas": 0}
+        EstadisticaEscaneoHora.residencial_id == residencial_id,
+        EstadisticaEscaneoHora.hora >= fecha_inicio
+    ).group_by(hora).all()
     
-    for escaneo, visita in escaneos:
-        fecha_escaneo_utc = to_utc(escaneo.fecha_escaneo)
-        hora = fecha_escaneo_utc.hour
-        
-        if visita.fecha_salida and fecha_escaneo_utc >= to_utc(visita.fecha_salida):
-            horarios[hora]["salidas"] += 1
-        else:
-            horarios[hora]["entradas"] += 1
+    horarios = {i: {"entradas": 0, "salidas": 0} for i in range(24)}
+    for fila in resultados:
+        horarios[int(fila.hora)] = {"entradas": int(fila.entradas), "salidas": int(fila.salidas)}
     
     return [
         EstadisticaHorario(
@@ -139,73 +116,45 @@ def obtener_estadisticas_horarios(db: Session, residencial_id: int) -> List[Esta
 
 def obtener_estadisticas_guardias(db: Session, residencial_id: int) -> List[EstadisticaGuardia]:
     """Obtiene estadísticas de actividad por guardia filtradas por residencial"""
-    now_utc = datetime.now(timezone.utc)
-    fecha_inicio = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
+    fecha_inicio = _inicio_dia_local()
     
-    # Obtener escaneos del día por guardia filtrados por residencial
     resultados = db.query(
-        EscaneoQR.guardia_id,
-        func.count(EscaneoQR.id).label('total_escaneos')
-    ).join(
-        Visita, EscaneoQR.visita_id == Visita.id
-    ).join(
-        Residente, Visita.residente_id == Residente.id
+        EstadisticaEscaneoHora.guardia_id,
+        Usuario.nombre.label('nombre_guardia'),
+        func.sum(EstadisticaEscaneoHora.entradas).label('entradas'),
+        func.sum(EstadisticaEscaneoHora.salidas).label('salidas')
+    ).outerjoin(
+        Guardia, EstadisticaEscaneoHora.guardia_id == Guardia.id
+    ).outerjoin(
+        Usuario, Guardia.usuario_id == Usuario.id
     ).filter(
-        EscaneoQR.fecha_escaneo >= fecha_inicio,
-        Residente.residencial_id == residencial_id
-    ).group_by(EscaneoQR.guardia_id).all()
-    
-    estadisticas = []
-    for guardia_id, total_escaneos in resultados:
-        # Obtener nombre del guardia
-        guardia = db.query(Guardia).filter(Guardia.id == guardia_id).first()
-        nombre_guardia = guardia.usuario.nombre if guardia and guardia.usuario else f"Guardia {guardia_id}"
-        
-        # Calcular entradas vs salidas
-        escaneos_guardia = db.query(EscaneoQR, Visita).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Residente, Visita.residente_id == Residente.id
-        ).filter(
-            EscaneoQR.guardia_id == guardia_id,
-            EscaneoQR.fecha_escaneo >= fecha_inicio,
-            Residente.residencial_id == residencial_id
-        ).all()
-        
-        escaneos_entrada = 0
-        escaneos_salida = 0
-        
-        for escaneo, visita in escaneos_guardia:
-            fecha_escaneo_utc = to_utc(escaneo.fecha_escaneo)
-            if visita.fecha_salida and fecha_escaneo_utc >= to_utc(visita.fecha_salida):
-                escaneos_salida += 1
-            else:
-                escaneos_entrada += 1
-        
-        estadisticas.append(EstadisticaGuardia(
-            guardia_id=guardia_id,
-            nombre_guardia=nombre_guardia,
-            total_escaneos=total_escaneos,
-            escaneos_entrada=escaneos_entrada,
-            escaneos_salida=escaneos_salida
-        ))
+        EstadisticaEscaneoHora.residencial_id == residencial_id,
+        EstadisticaEscaneoHora.hora >= fecha_inicio
+    ).group_by(EstadisticaEscaneoHora.guardia_id, Usuario.nombre).all()
     
-    return estadisticas
+    return [
+        EstadisticaGuardia(
+            guardia_id=fila.guardia_id,
+            nombre_guardia=fila.nombre_guardia or f"Guardia {fila.guardia_id}",
+            total_escaneos=int(fila.entradas + fila.salidas),
+            escaneos_entrada=int(fila.entradas),
+            escaneos_salida=int(fila.salidas)
+        )
+        for fila in resultados
+        if fila.entradas + fila.salidas > 0
+    ]
 
 def obtener_estadisticas_vehiculos(db: Session, residencial_id: int) -> List[EstadisticaVehiculo]:
     """Obtiene estadísticas de tipos de vehículos filtradas por residencial"""
     resultados = db.query(
-        Visitante.tipo_vehiculo,
-        func.count(Visitante.id).label('cantidad')
-    ).join(
-        Visita, Visitante.id == Visita.visitante_id
-    ).join(
-        Residente, Visita.residente_id == Residente.id
+        EstadisticaVisitaDia.tipo_vehiculo,
+        func.sum(EstadisticaVisitaDia.cantidad).label('cantidad')
     ).filter(
-        Residente.residencial_id == residencial_id
-    ).group_by(Visitante.tipo_vehiculo).all()
+        EstadisticaVisitaDia.residencial_id == residencial_id
+    ).group_by(EstadisticaVisitaDia.tipo_vehiculo).all()
+    resultados = [(tipo, int(cantidad)) for tipo, cantidad in resultados if cantidad]
     
-    total_vehiculos = sum(r.cantidad for r in resultados)
+    total_vehiculos = sum(cantidad for _, cantidad in resultados)
     
     estadisticas = []
     for tipo_vehiculo, cantidad in resultados:
@@ -222,27 +171,58 @@ def obtener_estadisticas_residentes(db: Session, residencial_id: int) -> List[Es
     """Obtiene estadísticas de residentes más activos filtradas por residencial"""
     resultados = db.query(
         Residente.id,
-        func.count(Visita.id).label('total_visitas')
-    ).filter(
-        Residente.residencial_id == residencial_id
+        Residente.unidad_residencial,
+        Usuario.nombre,
+        EstadisticaVisitasResidente.total_visitas
     ).join(
-        Visita, Residente.id == Visita.residente_id
-    ).group_by(Residente.id).order_by(
-        func.count(Visita.id).desc()
+        Residente, EstadisticaVisitasResidente.residente_id == Residente.id
+    ).outerjoin(
+        Usuario, Residente.usuario_id == Usuario.id
+    ).filter(
+        EstadisticaVisitasResidente.residencial_id == residencial_id,
+        EstadisticaVisitasResidente.total_visitas > 0
+    ).order_by(
+        EstadisticaVisitasResidente.total_visitas.desc()
     ).limit(10).all()
     
-    estadisticas = []
-    for residente_id, total_visitas in resultados:
-        residente = db.query(Residente).filter(Residente.id == residente_id).first()
-        if residente:
-            estadisticas.append(EstadisticaResidente(
-                residente_id=residente_id,
-                nombre_residente=residente.usuario.nombre if residente.usuario else f"Residente {residente_id}",
-                unidad_residencial=residente.unidad_residencial,
-                total_visitas=total_visitas
-            ))
-    
-    return estadisticas
+    return [
+        EstadisticaResidente(
+            residente_id=residente_id,
+            nombre_residente=nombre or f"Residente {residente_id}",
+            unidad_residencial=unidad_residencial,
+            total_visitas=total_visitas
+        )
+        for residente_id, unidad_residencial, nombre, total_visitas in resultados
+    ]
+
+def obtener_serie_actividad(db: Session, residencial_id: int, desde: date, hasta: date, granularidad: str = "hora") -> SerieActividad:
+    """
+    Entradas/salidas agrupadas por hora, día o semana (hora de Honduras) entre
+    `desde` y `hasta` inclusive. El agrupado corre en SQL; solo viajan los buckets
+    con actividad, como arreglos paralelos.
+    """
+    bucket = func.date_trunc(GRANULARIDADES[granularidad], func.timezone(ZONA_HORARIA, EstadisticaEscaneoHora.hora))
+    resultados = db.query(
+        bucket.label('bucket'),
+        func.sum(EstadisticaEscaneoHora.entradas).label('entradas'),
+        func.sum(EstadisticaEscaneoHora.salidas).label('salidas')
+    ).filter(
+        EstadisticaEscaneoHora.residencial_id == residencial_id,
+        EstadisticaEscaneoHora.hora >= _inicio_dia_local(desde),
+        EstadisticaEscaneoHora.hora < _inicio_dia_local(hasta + timedelta(days=1))
+    ).group_by(bucket).order_by(bucket).all()
+    
+    tz = pytz.timezone(ZONA_HORARIA)
+    filas = [fila for fila in resultados if fila.entradas or fila.salidas]
+    return SerieActividad(
+        granularidad=granularidad,
+        zona_horaria=ZONA_HORARIA,
+        desde=desde,
+        hasta=hasta,
+        buckets=[tz.localize(fila.bucket) for fila in filas],
+        entradas=[int(fila.entradas) for fila in filas],
+        salidas=[int(fila.salidas) for fila in filas]
+    )
 
 def obtener_estadisticas_completas(db: Session, residencial_id: int) -> Dict:
     """Obtiene todas las estadísticas del sistema filtradas por residencial"""
@@ -0,0 +1,126 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import update
+from app.database import SessionLocal
+from app.models.visita import Visita
+from app.utils.time import get_honduras_time
+from app.services.estadisticas_cache import invalidar_estadisticas
+from app.services.rollup_service import cambiar_estado_visitas
+from app.utils.lider_cluster import LiderCluster
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock de Postgres que elige al worker líder de la expiración
+LOCK_EXPIRACION_VISITAS = 731_205_001
+
+class MetricasExpiracion:
+    """Conteos y duraciones de las corridas de expiración de este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ejecuciones = 0
+        self.omitidas = 0  # otro worker es el líder
+        self.errores = 0
+        self.visitas_expiradas = 0
+        self.ultima_ejecucion = None
+        self.ultima_duracion_ms = None
+        self.ultimas_filas = None
+
+    def registrar(self, filas: int, duracion_ms: float):
+        with self._lock:
+            self.ejecuciones += 1
+            self.visitas_expiradas += filas
+            self.ultimas_filas = filas
+            self.ultima_duracion_ms = round(duracion_ms, 2)
+            self.ultima_ejecucion = get_honduras_time().isoformat()
+
+    def registrar_omitida(self):
+        with self._lock:
+            self.omitidas += 1
+
+    def registrar_error(self):
+        with self._lock:
+            self.errores += 1
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "lider": lider_expiracion.activo,
+                "ejecuciones": self.ejecuciones,
+                "omitidas": self.omitidas,
+                "errores": self.errores,
+                "visitas_expiradas": self.visitas_expiradas,
+                "ultima_ejecucion": self.ultima_ejecucion,
+                "ultima_duracion_ms": self.ultima_duracion_ms,
+                "ultimas_filas": self.ultimas_filas
+            }
+
+metricas_expiracion = MetricasExpiracion()
+
+lider_expiracion = LiderCluster(LOCK_EXPIRACION_VISITAS)
+
+def visita_expirada(visita: Visita, ahora: datetime = None) -> bool:
+    """
+    Expiración perezosa en lectura: cubre el intervalo entre corridas del job,
+    sin esperar a que la bandera `expiracion` se marque en BD.
+    """
+    if visita.expiracion == "S":
+        return True
+    if not visita.qr_expiracion:
+        return False
+    return visita.qr_expiracion <= (ahora or get_honduras_time())
+
+def marcar_visitas_expiradas(db: Session) -> int:
+    """
+    Marca expiracion='S' solo en las visitas que cruzaron qr_expiracion desde la última corrida.
+    Las ya marcadas salen del conjunto expiracion='N', así que el rango sobre
+    ix_visitas_expiracion_qr_expiracion contiene únicamente filas nuevas.
+    Las que seguían pendientes (nunca se escanearon) pasan además a estado='expirado':
+    los QR v2 vencidos se rechazan antes de leer la visita, así que el escaneo no las marca.
+    """
+    filas = db.execute(
+        update(Visita).where(
+            Visita.expiracion == "N",
+            Visita.qr_expiracion <= get_honduras_time()
+        ).values(expiracion="S").returning(Visita.id, Visita.estado)
+    ).all()
+    # El UPDATE deja las filas bloqueadas hasta el commit: el estado no cambia en medio
+    cambiar_estado_visitas(db, [visita_id for visita_id, estado in filas if estado == "pendiente"], "expirado")
+    return len(filas)
+
+def ejecutar_expiracion_visitas():
+    """
+    Tarea programada (APScheduler en cada worker). Solo el worker líder
+    (lider_expiracion) procesa; los demás omiten la corrida.
+    """
+    try:
+        if not lider_expiracion.es_lider():
+            metricas_expiracion.registrar_omitida()
+            return 0
+    except Exception as e:
+        metricas_expiracion.registrar_error()
+        logger.error(f"Error al verificar el liderazgo de la expiración: {str(e)}")
+        return 0
+
+    db: Session = SessionLocal()
+    inicio = time.perf_counter()
+    try:
+        filas = marcar_visitas_expiradas(db)
+        db.commit()
+        if filas:
+            invalidar_estadisticas()
+
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        metricas_expiracion.registrar(filas, duracion_ms)
+        logger.info(f"Expiración de visitas: {filas} marcadas en {duracion_ms:.1f} ms")
+        return filas
+    except Exception as e:
+        db.rollback()
+        metricas_expiracion.registrar_error()
+        logger.error(f"Error en expiración de visitas: {str(e)}")
+        return 0
+    finally:
+        db.close()
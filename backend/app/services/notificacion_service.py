@@ -8,9 +8,12 @@ from app.models.usuario import Usuario
 from app.models.notificacion import Notificacion
 from app.schemas.usuario_schema import UsuarioCreate
 from app.utils.notificaciones import enviar_correo
+from app.utils.async_notifications import enviar_correo_masivo
+from app.utils.plantillas_correo import renderizar_correo, PlantillaDifusion
 from app.utils.time import get_honduras_time
 from app.utils.push_helpers import (
     enviar_push_nueva_visita_guardia,
+    enviar_push_lote_visitas_guardia,
     enviar_push_escaneo_visita,
     enviar_push_visita_actualizada,
     enviar_push_solicitud_visita,
@@ -46,113 +49,14 @@ def enviar_notificacion_usuario_creado(usuario: Usuario, datos_creacion: Usuario
         }.get(usuario.rol, usuario.rol)
         
         asunto = "¡Bienvenido a Porto Pass!"
-        # Datos comunes
-        mensaje_html = f"""
-            <html>
-                <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                    <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                        <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                            <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
-                                🏠 ¡Bienvenido a Porto Pass!
-                            </h1>
-                            <div style="background-color: #f8f9fa; padding: 15px; border-radius: 8px; margin-bottom: 20px; border-left: 4px solid #007bff;">
-                                <h3 style="color: #007bff; margin-top: 0; margin-bottom: 10px;">🏢 Información de la Entidad</h3>
-                                <p style="margin: 0; font-size: 16px;"><strong>Entidad:</strong> {entidad_nombre}</p>
-                            </div>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                Hola <strong>{usuario.nombre}</strong>,
-                            </p>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                Tu cuenta ha sido creada exitosamente y ya puedes utilizar la aplicación Porto Pass.
-                            </p>
-        """
-
-        # Datos según rol
-        if usuario.rol == "residente":
-            mensaje_html += f"""
-                <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #2980b9; margin-top: 0;">📋 Tus Datos de Acceso</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li style="margin-bottom: 10px;"><strong>ID: </strong> {usuario.id}</li>
-                        <li style="margin-bottom: 10px;"><strong>Email: </strong> {usuario.email}</li>
-                        <li style="margin-bottom: 10px;"><strong>Rol: </strong> {rol_display}</li>
-                        <li style="margin-bottom: 10px;"><strong>Unidad/Área: </strong> {datos_creacion.unidad_residencial}</li>
-                        <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {datos_creacion.telefono}</li>
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #155724; margin-top: 0;">✅ ¿Qué puedes hacer ahora?</h3>
-                    <ul style="margin-bottom: 0;">
-                        <li>Iniciar sesión en la aplicación</li>
-                        <li>Crear accesos para tus visitantes</li>
-                        <li>Recibir notificaciones de accesos</li>
-                        <li>Ver el historial de tus accesos</li>
-                    </ul>
-                </div>
-            """
-        elif usuario.rol == "admin":
-            mensaje_html += f"""
-                <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #2980b9; margin-top: 0;">📋 Tus Datos de Acceso</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li style="margin-bottom: 10px;"><strong>ID: </strong> {usuario.id}</li>
-                        <li style="margin-bottom: 10px;"><strong>Email: </strong> {usuario.email}</li>
-                        <li style="margin-bottom: 10px;"><strong>Rol: </strong> {rol_display}</li>
-                        <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {getattr(datos_creacion, 'telefono', '-')}</li>
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #155724; margin-top: 0;">⚠️ Permisos de Administrador</h3>
-                    <ul style="margin-bottom: 0;">
-                        <li>Tienes acceso total al sistema</li>
-                        <li>Puedes crear y gestionar usuarios, accesos y notificaciones</li>
-                        <li>Por favor, usa tu cuenta con responsabilidad</li>
-                    </ul>
-                </div>
-            """
-        elif usuario.rol == "guardia":
-            mensaje_html += f"""
-                <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #2980b9; margin-top: 0;">📋 Tus Datos de Acceso</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li style="margin-bottom: 10px;"><strong>ID: </strong> {usuario.id}</li>
-                        <li style="margin-bottom: 10px;"><strong>Email: </strong> {usuario.email}</li>
-                        <li style="margin-bottom: 10px;"><strong>Rol: </strong> {rol_display}</li>
-                        <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {getattr(datos_creacion, 'telefono', '-')}</li>
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #155724; margin-top: 0;">🚨 Permisos de Operador</h3>
-                    <ul style="margin-bottom: 0;">
-                        <li>Puedes aceptar o rechazar la entrada de visitantes</li>
-                        <li>Puedes registrar la salida de los visitantes</li>
-                        <li>Debes verificar la identidad de los visitantes</li>
-                    </ul>
-                </div>
-            """
-
-        # Información de seguridad común
-        mensaje_html += """
-            <div style="background-color: #fff3cd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                <h3 style="color: #856404; margin-top: 0;">🔒 Seguridad de tu cuenta</h3>
-                <p style="font-size: 14px; color: #856404;">
-                    <strong>Importante:</strong> Por seguridad, no almacenamos tu contraseña en texto plano. 
-                    Si la olvidas, contacta al administrador del sistema.
-                </p>
-            </div>
-            <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
-                Si tienes alguna pregunta o necesitas ayuda, no dudes en contactar al administrador.
-            </p>
-            <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-            <p style="text-align: center; font-size: 12px; color: #999;">
-                Este es un mensaje automático del sistema Porto Pass.<br>
-                <strong>No respondas a este correo.</strong>
-            </p>
-            </div>
-        </div>
-        </body>
-        </html>
-        """
+        mensaje_html = renderizar_correo(
+            "bienvenida.html",
+            usuario=usuario,
+            entidad_nombre=entidad_nombre,
+            rol_display=rol_display,
+            unidad_residencial=getattr(datos_creacion, 'unidad_residencial', '-'),
+            telefono=getattr(datos_creacion, 'telefono', '-')
+        )
 
         # Enviar el correo (sin imagen QR)
         exito = enviar_correo(usuario.email, asunto, mensaje_html)
@@ -186,60 +90,12 @@ def enviar_notificacion_residente(db: Session, visita, qr_img_b64: str, acompana
             email_destinatario = residente.usuario.email
 
         asunto = "Nueva visita programada"
-        mensaje_html = f"""
-            <html>
-                <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                    <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                        <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                            <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
-                                📝 ¡Tu acceso fue creado exitosamente!
-                            </h1>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                Hola <strong>{nombre_destinatario}</strong>,
-                            </p>
-                            <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #2980b9; margin-top: 0;">👤 Datos del visitante</h3>
-                                <ul style="list-style: none; padding: 0;">
-                                    <li style="margin-bottom: 10px;"><strong>Nombre:</strong> {visita.visitante.nombre_conductor}</li>
-                                    <li style="margin-bottom: 10px;"><strong>DNI:</strong> {visita.visitante.dni_conductor}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Teléfono:</strong> {visita.visitante.telefono}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Tipo de vehículo:</strong> {visita.visitante.tipo_vehiculo}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Marca:</strong> {visita.visitante.marca_vehiculo}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Color:</strong> {visita.visitante.color_vehiculo}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Placa:</strong> {visita.visitante.placa_vehiculo}</li>
-                                </ul>
-                            </div>
-                            <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #155724; margin-top: 0;">📝 Detalles del acceso</h3>
-                                <ul style="list-style: none; padding: 0;">
-                                    <li style="margin-bottom: 10px;"><strong>Motivo:</strong> {visita.notas}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Fecha de entrada:</strong> {(visita.fecha_entrada.astimezone(get_honduras_time().tzinfo) if visita.fecha_entrada.tzinfo else visita.fecha_entrada).strftime('%Y-%m-%d %H:%M:%S')}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Fecha de Expiración:</strong> {(visita.qr_expiracion.astimezone(get_honduras_time().tzinfo) if visita.qr_expiracion.tzinfo else visita.qr_expiracion).strftime('%Y-%m-%d %H:%M:%S')}</li>
-                                </ul>
-                            </div>
-        """
-        if acompanantes:
-            mensaje_html += f"""
-                            <div style="background-color: #fff3cd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #856404; margin-top: 0;">👥 Acompañantes</h3>
-                                <p>{", ".join(acompanantes)}</p>
-                            </div>
-            """
-
-        mensaje_html += """
-                            <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
-                                Si tienes alguna pregunta o necesitas ayuda, no dudes en contactar al administrador.
-                            </p>
-                            <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-                            <p style="text-align: center; font-size: 12px; color: #999;">
-                                Este es un mensaje automático del sistema Porto Pass.<br>
-                                <strong>No respondas a este correo.</strong>
-                            </p>
-                        </div>
-                    </div>
-                </body>
-            </html>
-        """
+        mensaje_html = renderizar_correo(
+            "visita_creada.html",
+            nombre_destinatario=nombre_destinatario,
+            visita=visita,
+            acompanantes=acompanantes
+        )
 
         exito = enviar_correo(email_destinatario, asunto, mensaje_html, qr_img_b64)
         estado = "enviado" if exito else "fallido"
@@ -256,6 +112,8 @@ def enviar_notificacion_residente(db: Session, visita, qr_img_b64: str, acompana
         db.rollback()
         print(f"Error al enviar notificación: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
 
 #Enviar notificación al guardia cuando se crea una visita        
 def enviar_notificacion_guardia(db: Session, visita):
@@ -296,50 +154,55 @@ def enviar_notificacion_guardia(db: Session, visita):
             residente = db.query(Residente).filter(Residente.id == visita.residente_id).first()
             nombre_creador = residente.usuario.nombre if residente else "Residente"
         asunto = "Nueva visita programada"
+        # Lo común se renderiza una vez; por guardia solo cambia el saludo
+        plantilla = PlantillaDifusion(
+            "visita_guardia.html", ("nombre_destinatario",),
+            visita=visita, nombre_creador=nombre_creador
+        )
         for guardia in guardias:
             if guardia.usuario and guardia.usuario.email:
-                mensaje_html = f"""
-                    <html>
-                        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                            <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                                <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                                    <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
-                                        🚨 ¡Notificación de nuevo acceso!
-                                    </h1>
-                                    <p style="font-size: 16px; margin-bottom: 20px;">
-                                        Hola <strong>{guardia.usuario.nombre}</strong>,
-                                    </p>
-                                    <p style="font-size: 16px; margin-bottom: 20px;">
-                                        Se ha creado un nuevo acceso para el miembro <strong>{nombre_creador}</strong>.
-                                    </p>
-                                    <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                        <h3 style="color: #2980b9; margin-top: 0;">👤 Datos del visitante</h3>
-                                        <ul style="list-style: none; padding: 0;">
-                                            <li style="margin-bottom: 10px;"><strong>Nombre:</strong> {visita.visitante.nombre_conductor}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Tipo de vehículo:</strong> {visita.visitante.tipo_vehiculo}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Marca:</strong> {visita.visitante.marca_vehiculo}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Color:</strong> {visita.visitante.color_vehiculo}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Placa:</strong> {visita.visitante.placa_vehiculo}</li>
-                                        </ul>
-                                    </div>
-                                    <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
-                                        Por favor, verifica la identidad y los datos del visitante al momento de su ingreso.
-                                    </p>
-                                    <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-                                    <p style="text-align: center; font-size: 12px; color: #999;">
-                                        Este es un mensaje automático del sistema Porto Pass.<br>
-                                        <strong>No respondas a este correo.</strong>
-                                    </p>
-                                </div>
-                            </div>
-                        </body>
-                    </html>
-                """
+                mensaje_html = plantilla.para(nombre_destinatario=guardia.usuario.nombre)
                 enviar_correo(guardia.usuario.email, asunto, mensaje_html)
     except Exception as e:
         db.rollback()
         logger.error(f"Error al enviar notificación: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
+
+def enviar_notificacion_lote_guardia(db: Session, lote_id: str, total: int, fecha_entrada, motivo: str, admin_id: int, residencial_id: int):
+    # Un solo aviso a los guardias por lote masivo, con el total en lugar de una visita
+    try:
+        admin = db.query(Administrador).filter(Administrador.id == admin_id).first()
+        nombre_creador = admin.usuario.nombre if admin and admin.usuario else "Administrador"
+
+        # 🔔 ENVIAR NOTIFICACIÓN PUSH PRIMERO
+        resultado_push = enviar_push_lote_visitas_guardia(db, lote_id, total, nombre_creador, residencial_id)
+        logger.info(f"Push de lote {lote_id} a guardias: {resultado_push['usuarios_notificados']} notificados")
+
+        if resultado_push.get('usuarios_notificados', 0) > 0:
+            logger.info(f"✅ Notificaciones push de lote enviadas a guardias, omitiendo emails")
+            return
+
+        # FALLBACK: Si no hay suscripciones push, enviar emails
+        logger.warning("⚠️ No se enviaron push notifications de lote, usando fallback a email")
+
+        guardias = db.query(Guardia).filter(Guardia.residencial_id == residencial_id).all()
+        asunto = f"Nuevo lote de {total} visitas programadas"
+        plantilla = PlantillaDifusion(
+            "visitas_lote_guardia.html", ("nombre_destinatario",),
+            total=total, fecha_entrada=fecha_entrada, motivo=motivo, nombre_creador=nombre_creador
+        )
+        for guardia in guardias:
+            if guardia.usuario and guardia.usuario.email:
+                mensaje_html = plantilla.para(nombre_destinatario=guardia.usuario.nombre)
+                enviar_correo(guardia.usuario.email, asunto, mensaje_html)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al enviar notificación de lote: {str(e)}")
+        print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
 
 def enviar_notificacion_escaneo(db: Session, visita, guardia_nombre: str, es_salida: bool = False):
     try:
@@ -390,32 +253,19 @@ def enviar_notificacion_escaneo(db: Session, visita, guardia_nombre: str, es_sal
 
         if es_salida:
             asunto = "🚪 Visitante ha salido de la entidad"
-            mensaje_html = f"""
-                <html>
-                    <body>
-                        <p>Hola <strong>{nombre_destinatario}</strong>,</p>
-                        <p>El visitante <strong>{visitante.nombre_conductor}</strong> ha <strong>SALIDO</strong> de la entidad.</p>
-                        <p>La salida fue registrada por el operador <strong>{guardia_nombre}</strong> el <strong>{get_honduras_time().strftime('%Y-%m-%d %H:%M:%S')}</strong>.</p>
-                        <p>El acceso ha sido marcado como <strong>COMPLETADO</strong>.</p>
-                        <p>Gracias por usar nuestro sistema de control de acceso.</p>
-                    </body>
-                </html>
-            """
             mensaje_notificacion = f"Visitante {visitante.nombre_conductor} ha salido - registrado por operador {guardia_nombre}"
         else:
             asunto = "📍 Estado de acceso actualizado"
-            mensaje_html = f"""
-                <html>
-                    <body>
-                        <h2>¡Hola {nombre_destinatario}!</h2>
-                        <h2>¡Actualización de tu acceso {visitante.nombre_conductor}!</h2>
-                        <p>El visitante <strong>{visitante.nombre_conductor}</strong> ha sido <strong>{visita.estado.upper()}</strong>.</p>
-                        <p>El escaneo fue realizado por el operador <strog>{guardia_nombre}</strogng> el <strong>{get_honduras_time().strftime('%Y-%m-%d %H:%M:%S')}</strong>.</p>
-                        <p>Gracias por usar nuestro sistema de control de acceso.</p>
-                    </body>
-                </html>
-            """
             mensaje_notificacion = f"Acceso {visita.estado} por operador {guardia_nombre}"
+        mensaje_html = renderizar_correo(
+            "escaneo.html",
+            es_salida=es_salida,
+            nombre_destinatario=nombre_destinatario,
+            visitante=visitante,
+            estado=visita.estado,
+            guardia_nombre=guardia_nombre,
+            fecha_registro=get_honduras_time()
+        )
 
         exito = enviar_correo(email_destinatario, asunto, mensaje_html)
 
@@ -436,6 +286,8 @@ def enviar_notificacion_escaneo(db: Session, visita, guardia_nombre: str, es_sal
         db.rollback()
         logger.error(f"Error al enviar notificación de escaneo: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
 
 def enviar_notificacion_visita_actualizada(db: Session, visita):
     try:
@@ -482,32 +334,12 @@ def enviar_notificacion_visita_actualizada(db: Session, visita):
         if not visitante:
             return
         asunto = "✅ Visita actualizada exitosamente"
-        mensaje_html = f"""
-            <html>
-                <body>
-                    <h2>¡Hola {nombre_destinatario}!</h2>
-                    <p>Tu visita ha sido <strong>actualizada exitosamente</strong>.</p>
-                    <h3>👤 Datos del visitante</h3>
-                    <ul>
-                        <li><strong>Nombre del Visitante:</strong> {visitante.nombre_conductor}</li>
-                        <li><strong>DNI del Visitante:</strong> {visitante.dni_conductor}</li>
-                        <li><strong>Teléfono del Visitante:</strong> {visitante.telefono}</li>
-                        <li><strong>Tipo de vehículo:</strong> {visitante.tipo_vehiculo}</li>
-                        <li><strong>Marca del Vehiculo:</strong> {visitante.marca_vehiculo}</li>
-                        <li><strong>Color del Vehiculo:</strong> {visitante.color_vehiculo}</li>
-                        <li><strong>Placa del Vehiculo:</strong> {visitante.placa_vehiculo}</li>
-                    </ul>
-                    <h3>📝 Detalles de la visita actualizada</h3>
-                    <ul>
-                        <li><strong>Motivo:</strong> {visita.notas}</li>
-                        <li><strong>Nueva fecha de entrada:</strong> {(visita.fecha_entrada.astimezone(get_honduras_time().tzinfo) if visita.fecha_entrada.tzinfo else visita.fecha_entrada).strftime('%Y-%m-%d %H:%M:%S')}</li>
-                        <li><strong>Fecha de Expiración:</strong> {(visita.qr_expiracion.astimezone(get_honduras_time().tzinfo) if visita.qr_expiracion.tzinfo else visita.qr_expiracion).strftime('%Y-%m-%d %H:%M:%S')}</li>
-                    </ul>
-                    <p>Se mantiene el mismo código QR, revisa la notificación anterior.</p>
-                    <p><br>Si no realizaste este cambio, por favor contacta al administrador.</br></p>
-                </body>
-            </html>
-        """
+        mensaje_html = renderizar_correo(
+            "visita_actualizada.html",
+            nombre_destinatario=nombre_destinatario,
+            visitante=visitante,
+            visita=visita
+        )
         exito = enviar_correo(email_destinatario, asunto, mensaje_html)
         estado = "enviado" if exito else "fallido"
         notificacion = Notificacion(
@@ -561,76 +393,14 @@ def enviar_notificacion_solicitud_visita(db: Session, visita, residente):
 
         asunto = "📋 Nueva solicitud de visita pendiente"
         
+        # Lo común se renderiza una vez; por administrador solo cambia el saludo
+        plantilla = PlantillaDifusion(
+            "solicitud_visita.html", ("nombre_destinatario",),
+            residente=residente, visitante=visitante, visita=visita
+        )
         for admin in admins:
             if admin.usuario and admin.usuario.email:
-                mensaje_html = f"""
-                    <html>
-                        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                            <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                                <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                                    <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
-                                        📋 Nueva Solicitud de Visita
-                                    </h1>
-                                    <p style="font-size: 16px; margin-bottom: 20px;">
-                                        Hola <strong>{admin.usuario.nombre}</strong>,
-                                    </p>
-                                    <p style="font-size: 16px; margin-bottom: 20px;">
-                                        El residente <strong>{residente.usuario.nombre}</strong> ha enviado una solicitud de visita que requiere tu aprobación.
-                                    </p>
-                                    
-                                    <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                        <h3 style="color: #2980b9; margin-top: 0;">👤 Datos del Residente</h3>
-                                        <ul style="list-style: none; padding: 0;">
-                                            <li style="margin-bottom: 10px;"><strong>Nombre: </strong> {residente.usuario.nombre}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Email: </strong> {residente.usuario.email}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Unidad Residencial: </strong> {residente.unidad_residencial}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {residente.telefono}</li>
-                                        </ul>
-                                    </div>
-                                    
-                                    <div style="background-color: #fff3cd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                        <h3 style="color: #856404; margin-top: 0;">👥 Datos del Visitante</h3>
-                                        <ul style="list-style: none; padding: 0;">
-                                            <li style="margin-bottom: 10px;"><strong>Nombre: </strong> {visitante.nombre_conductor}</li>
-                                            <li style="margin-bottom: 10px;"><strong>DNI: </strong> {visitante.dni_conductor}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {visitante.telefono}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Tipo de Vehículo: </strong> {visitante.tipo_vehiculo}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Marca: </strong> {visitante.marca_vehiculo or 'No especificado'}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Color: </strong> {visitante.color_vehiculo or 'No especificado'}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Placa: </strong> {visitante.placa_vehiculo}</li>
-                                        </ul>
-                                    </div>
-                                    
-                                    <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                        <h3 style="color: #155724; margin-top: 0;">📅 Detalles de la Visita</h3>
-                                        <ul style="list-style: none; padding: 0;">
-                                            <li style="margin-bottom: 10px;"><strong>Fecha de Entrada: </strong> {(visita.fecha_entrada.astimezone(get_honduras_time().tzinfo) if visita.fecha_entrada.tzinfo else visita.fecha_entrada).strftime('%Y-%m-%d %H:%M:%S')}</li>
-                                            <li style="margin-bottom: 10px;"><strong>Motivo: </strong> {visita.notas}</li>
-                                            <li style="margin-bottom: 10px;"><strong>ID de Solicitud: </strong> {visita.id}</li>
-                                        </ul>
-                                    </div>
-                                    
-                                    <div style="background-color: #f8d7da; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                        <h3 style="color: #721c24; margin-top: 0;">⚠️ Acción Requerida</h3>
-                                        <p style="font-size: 14px; color: #721c24;">
-                                            <strong>Importante:</strong> Esta solicitud requiere tu aprobación para convertirse en una visita activa. 
-                                            Por favor, revisa los datos y aprueba o rechaza la solicitud desde el panel de administración.
-                                        </p>
-                                    </div>
-                                    
-                                    <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
-                                        Accede al panel de administración para gestionar esta solicitud.
-                                    </p>
-                                    <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-                                    <p style="text-align: center; font-size: 12px; color: #999;">
-                                        Este es un mensaje automático del sistema Porto Pass.<br>
-                                        <strong>No respondas a este correo.</strong>
-                                    </p>
-                                </div>
-                            </div>
-                        </body>
-                    </html>
-                """
+                mensaje_html = plantilla.para(nombre_destinatario=admin.usuario.nombre)
                 
                 exito = enviar_correo(admin.usuario.email, asunto, mensaje_html)
                 estado = "enviado" if exito else "fallido"
@@ -649,6 +419,8 @@ def enviar_notificacion_solicitud_visita(db: Session, visita, residente):
         db.rollback()
         logger.error(f"Error al enviar notificación de solicitud de visita: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
 
 def enviar_notificacion_solicitud_aprobada(db: Session, visita, qr_img_b64: str):
     try:
@@ -659,80 +431,7 @@ def enviar_notificacion_solicitud_aprobada(db: Session, visita, qr_img_b64: str)
             return
 
         asunto = "✅ Tu solicitud de visita ha sido aprobada"
-        mensaje_html = f"""
-            <html>
-                <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                    <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                        <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                            <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
-                                ✅ Solicitud Aprobada
-                            </h1>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                ¡Hola <strong>{residente.usuario.nombre}</strong>!
-                            </p>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                Tu solicitud de visita ha sido <strong>APROBADA</strong> por el administrador. 
-                                Ya puedes usar el código QR para que tu visitante ingrese al residencial.
-                            </p>
-                            
-                            <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #155724; margin-top: 0;">👤 Datos del Visitante</h3>
-                                <ul style="list-style: none; padding: 0;">
-                                    <li style="margin-bottom: 10px;"><strong>Nombre: </strong> {visita.visitante.nombre_conductor}</li>
-                                    <li style="margin-bottom: 10px;"><strong>DNI: </strong> {visita.visitante.dni_conductor}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {visita.visitante.telefono}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Tipo de Vehículo: </strong> {visita.visitante.tipo_vehiculo}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Marca: </strong> {visita.visitante.marca_vehiculo or 'No especificado'}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Color: </strong> {visita.visitante.color_vehiculo or 'No especificado'}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Placa: </strong> {visita.visitante.placa_vehiculo}</li>
-                                </ul>
-                            </div>
-                            
-                            <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #2980b9; margin-top: 0;">📅 Detalles de la Visita</h3>
-                                <ul style="list-style: none; padding: 0;">
-                                    <li style="margin-bottom: 10px;"><strong>Fecha de Entrada: </strong> {(visita.fecha_entrada.astimezone(get_honduras_time().tzinfo) if visita.fecha_entrada.tzinfo else visita.fecha_entrada).strftime('%Y-%m-%d %H:%M:%S')}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Motivo: </strong> {visita.notas}</li>
-                                    <li style="margin-bottom: 10px;"><strong>Estado: </strong> <span style="color: #155724; font-weight: bold;">APROBADA</span></li>
-                                </ul>
-                            </div>
-                            
-                            <div style="background-color: #fff3cd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #856404; margin-top: 0;">🔐 Código QR de Acceso</h3>
-                                <p style="font-size: 14px; color: #856404;">
-                                    <strong>Importante:</strong> Presenta este código QR al guardia en la entrada para que tu visitante pueda ingresar.
-                                </p>
-                                <div style="text-align: center; margin: 20px 0;">
-                                    <img src="cid:qrimage" alt="Código QR" width="200" height="200" style="border: 2px solid #ddd; border-radius: 8px;"/>
-                                </div>
-                                <p style="font-size: 12px; color: #856404; text-align: center;">
-                                    <strong>⚠️ No compartas este código QR con personas no autorizadas</strong>
-                                </p>
-                            </div>
-                            
-                            <div style="background-color: #f8d7da; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                                <h3 style="color: #721c24; margin-top: 0;">📋 Instrucciones</h3>
-                                <ol style="margin-bottom: 0;">
-                                    <li>Comparte el código QR con tu visitante</li>
-                                    <li>El visitante debe presentarlo al guardia en la entrada</li>
-                                    <li>El guardia escaneará el código para verificar la autorización</li>
-                                    <li>Una vez aprobado, el visitante podrá ingresar</li>
-                                </ol>
-                            </div>
-                            
-                            <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
-                                Gracias por usar nuestro sistema de control de acceso.
-                            </p>
-                            <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-                            <p style="text-align: center; font-size: 12px; color: #999;">
-                                Este es un mensaje automático del sistema Porto Pass.<br>
-                                <strong>No respondas a este correo.</strong>
-                            </p>
-                        </div>
-                    </div>
-                </body>
-            </html>
-        """
+        mensaje_html = renderizar_correo("solicitud_aprobada.html", residente=residente, visita=visita)
         
         exito = enviar_correo(residente.usuario.email, asunto, mensaje_html, qr_img_b64)
         estado = "enviado" if exito else "fallido"
@@ -785,64 +484,39 @@ def enviar_notificacion_nueva_publicacion(
         logger.warning("⚠️ No se enviaron push notifications de publicación, usando fallback a email")
         
         asunto = "Nueva Publicación"
-        mensaje_html = f"""
-            <html>
-                <body style='font-family: Arial, sans-serif; color: #333;'>
-                    <div style='max-width: 600px; margin: 0 auto; background: #f9f9f9; padding: 24px; border-radius: 10px;'>
-                        <p>Se ha creado una nueva publicación por <b>{creador}</b>:</p>
-                        <div style='background: #e3eafc; border-radius: 8px; padding: 16px; margin: 18px 0;'>
-                            <h3 style='color: #1976d2; margin: 0 0 8px 0;'>{titulo_publicacion}</h3>
-                            <div style='color: #333;'>{contenido}</div>
-                        </div>
-                        <p>Puedes visualizar y comentar esta publicación en la sección <b>Social</b> de la plataforma.</p>
-                        <p style='margin-top: 24px; color: #888; font-size: 0.95em;'>Este es un mensaje automático del sistema Porto Pass.<br>No respondas a este correo.</p>
-                    </div>
-                </body>
-            </html>
-        """
-        usuarios_notificados = []
+        mensaje_html = renderizar_correo(
+            "nueva_publicacion.html",
+            creador=creador,
+            titulo_publicacion=titulo_publicacion,
+            contenido=contenido
+        )
+        # Se juntan los correos de todos los destinatarios y se envían en lotes
+        correos = []
 
         # Notificar a administradores si es para todos o específicamente a admins
         if notificar_a in ('todos', 'admin'):
-            admin_query = db.query(Administrador)
+            admin_query = db.query(Usuario.email).join(Administrador, Administrador.usuario_id == Usuario.id)
             if residencial_id:
                 admin_query = admin_query.filter(Administrador.residencial_id == residencial_id)
-            admins = admin_query.all()
-            for admin in admins:
-                if admin.usuario and admin.usuario.email:
-                    exito = enviar_correo(admin.usuario.email, asunto, mensaje_html)
-                    if exito:
-                        usuarios_notificados.append(admin.usuario.email)
+            correos.extend(email for (email,) in admin_query.all())
 
         # Notificar a residentes
         if notificar_a in ('todos', 'residente'):
+            residente_query = db.query(Usuario.email).join(Residente, Residente.usuario_id == Usuario.id)
+            if residencial_id:
+                residente_query = residente_query.filter(Residente.residencial_id == residencial_id)
             if residentes_especificos and isinstance(residentes_especificos, list) and len(residentes_especificos) > 0:
                 # Notificar solo a los residentes específicos seleccionados de la residencial
-                for residente_id in residentes_especificos:
-                    residente_query = db.query(Residente).filter(Residente.id == residente_id)
-                    if residencial_id:
-                        residente_query = residente_query.filter(Residente.residencial_id == residencial_id)
-                    residente = residente_query.first()
-                    if residente and residente.usuario and residente.usuario.email:
-                        exito = enviar_correo(residente.usuario.email, asunto, mensaje_html)
-                        if exito:
-                            usuarios_notificados.append(residente.usuario.email)
-            else:
-                # Notificar a todos los residentes de la residencial (si se especifica)
-                residente_query = db.query(Residente)
-                if residencial_id:
-                    residente_query = residente_query.filter(Residente.residencial_id == residencial_id)
-                residentes = residente_query.all()
-                for residente in residentes:
-                    if residente.usuario and residente.usuario.email:
-                        exito = enviar_correo(residente.usuario.email, asunto, mensaje_html)
-                        if exito:
-                            usuarios_notificados.append(residente.usuario.email)
-
-        logger.info(f"Alertas de nueva publicación enviadas a: {usuarios_notificados}")
+                residente_query = residente_query.filter(Residente.id.in_(residentes_especificos))
+            correos.extend(email for (email,) in residente_query.all())
+
+        usuarios_notificados = enviar_correo_masivo(correos, asunto, mensaje_html)
+        logger.info(f"Alertas de nueva publicación enviadas a {len(usuarios_notificados)} de {len(correos)} destinatarios")
     except Exception as e:
         logger.error(f"Error al enviar alerta de nueva publicación: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
 
 def notificar_admin_ticket_creado_email(db: Session, ticket: Ticket, residente_nombre: str):
     try:
@@ -876,22 +550,17 @@ def notificar_admin_ticket_creado_email(db: Session, ticket: Ticket, residente_n
             return
         
         asunto = "Nuevo ticket de soporte creado"
-        mensaje_html = f"""
-            <h2>Nuevo ticket creado</h2>
-            <p>El residente <b>{residente_nombre}</b> ha creado un ticket:</p>
-            <ul>
-                <li><b>Título:</b> {ticket.titulo}</li>
-                <li><b>Descripción:</b> {ticket.descripcion}</li>
-                <li><b>Fecha:</b> {ticket.fecha_creacion.strftime('%Y-%m-%d %H:%M:%S')}</li>
-            </ul>
-        """
-        for admin in admins:
-            if admin.usuario and admin.usuario.email:
-                enviar_correo(admin.usuario.email, asunto, mensaje_html)
+        mensaje_html = renderizar_correo("ticket_creado.html", ticket=ticket, residente_nombre=residente_nombre)
+        enviar_correo_masivo(
+            [admin.usuario.email for admin in admins if admin.usuario and admin.usuario.email],
+            asunto, mensaje_html
+        )
                 
     except Exception as e:
         logger.error(f"Error al notificar admins de ticket creado: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
 
 def notificar_residente_ticket_actualizado_email(db: Session, ticket: Ticket):
     try:
@@ -912,16 +581,11 @@ def notificar_residente_ticket_actualizado_email(db: Session, ticket: Ticket):
         logger.warning("⚠️ No se envió push notification de ticket actualizado, usando fallback a email")
         
         asunto = f"Actualización de tu ticket: {ticket.titulo}"
-        mensaje_html = f"""
-            <h2>Tu ticket ha sido actualizado</h2>
-            <ul>
-                <li><b>Estado:</b> {ticket.estado}</li>
-                <li><b>Respuesta del administrador:</b> {ticket.respuesta_admin or 'Sin respuesta'}</li>
-                <li><b>Fecha de respuesta:</b> {ticket.fecha_respuesta.strftime('%Y-%m-%d %H:%M:%S') if ticket.fecha_respuesta else 'N/A'}</li>
-            </ul>
-        """
+        mensaje_html = renderizar_correo("ticket_actualizado.html", ticket=ticket)
         enviar_correo(residente.usuario.email, asunto, mensaje_html)
         
     except Exception as e:
         logger.error(f"Error al notificar residente de ticket actualizado: {str(e)}")
         print(traceback.format_exc())
+        # Se relanza para que el despachador del outbox reintente
+        raise
@@ -0,0 +1,340 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, func
+from sqlalchemy.dialects.postgresql import insert
+from app.database import SessionLocal
+from app.core.config import settings
+from app.models.notificacion_outbox import NotificacionOutbox
+from app.models.visita import Visita
+from app.models.residente import Residente
+from app.models.residencial import Residencial
+from app.models.ticket import Ticket
+from app.services.notificacion_service import (
+    enviar_notificacion_residente,
+    enviar_notificacion_guardia,
+    enviar_notificacion_lote_guardia,
+    enviar_notificacion_escaneo,
+    enviar_notificacion_solicitud_visita,
+    enviar_notificacion_nueva_publicacion,
+    notificar_admin_ticket_creado_email,
+    notificar_residente_ticket_actualizado_email
+)
+from app.services.qr_render_service import servicio_render_qr, trabajo_render_visita
+from app.utils.qr import png_a_base64
+from app.utils.time import get_honduras_time
+import logging
+import random
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Hilos que ejecutan los envíos (push/correo) de cada tanda del despachador
+outbox_executor = ThreadPoolExecutor(
+    max_workers=settings.NOTIF_OUTBOX_WORKERS,
+    thread_name_prefix="outbox"
+)
+
+# Mientras una fila está en 'procesando', proximo_intento es el fin del lease:
+# si el worker muere, otra corrida la vuelve a tomar al vencer.
+LEASE_SEGUNDOS = 300
+# Espera máxima por los envíos de una tanda, por debajo del lease: al vencer, los
+# que no terminaron se registran como error (reintento con backoff) antes de que
+# otra corrida pueda volver a reclamar sus filas
+TIMEOUT_TANDA_SEGUNDOS = LEASE_SEGUNDOS - 60
+
+# --- Encolado -----------------------------------------------------------------
+
+def _insert_outbox(tipo: str, payload: dict, clave_dedup: str = None):
+    return insert(NotificacionOutbox).values(
+        tipo=tipo,
+        payload=payload,
+        clave_dedup=clave_dedup,
+        estado="pendiente",
+        intentos=0,
+        proximo_intento=func.now(),
+        fecha_creacion=func.now()
+    ).on_conflict_do_nothing(index_elements=["clave_dedup"])
+
+def encolar_notificacion(db: Session, tipo: str, payload: dict, clave_dedup: str = None):
+    """
+    Agrega la notificación a la transacción en curso (no hace commit): se envía solo
+    si el cambio que la origina se confirma. Con la misma clave_dedup se encola una vez.
+    """
+    db.execute(_insert_outbox(tipo, payload, clave_dedup))
+
+async def encolar_notificacion_async(db: AsyncSession, tipo: str, payload: dict, clave_dedup: str = None):
+    """Versión para AsyncSession de encolar_notificacion()."""
+    await db.execute(_insert_outbox(tipo, payload, clave_dedup))
+
+# --- Manejadores por tipo -----------------------------------------------------
+# Reciben una sesión propia y el payload; si lanzan excepción la fila se reintenta.
+# Si la entidad ya no existe (se borró antes del envío) no hay nada que notificar.
+
+def _visita_creador(db: Session, payload: dict):
+    visita = db.get(Visita, payload["visita_id"])
+    if not visita or not visita.qr_code:
+        return
+    residencial = db.get(Residencial, visita.residencial_id) if visita.residencial_id else None
+    # Si la emisión ya la renderizó, la imagen sale de cache_imagenes_qr sin volver a renderizar
+    qr_png = servicio_render_qr.renderizar(
+        trabajo_render_visita(visita, residencial.nombre if residencial else "Residencial")
+    )
+    enviar_notificacion_residente(db, visita, png_a_base64(qr_png), acompanantes=payload.get("acompanantes"))
+
+def _visita_guardia(db: Session, payload: dict):
+    visita = db.get(Visita, payload["visita_id"])
+    if visita:
+        enviar_notificacion_guardia(db, visita)
+
+def _visitas_lote_guardia(db: Session, payload: dict):
+    enviar_notificacion_lote_guardia(
+        db, payload["lote_id"], payload["total"], datetime.fromisoformat(payload["fecha_entrada"]),
+        payload.get("motivo"), payload["admin_id"], payload["residencial_id"]
+    )
+
+def _visita_escaneo(db: Session, payload: dict):
+    visita = db.get(Visita, payload["visita_id"])
+    if visita:
+        enviar_notificacion_escaneo(db, visita, payload["guardia_nombre"], es_salida=payload.get("es_salida", False))
+
+def _solicitud_visita(db: Session, payload: dict):
+    visita = db.get(Visita, payload["visita_id"])
+    residente = db.get(Residente, visita.residente_id) if visita and visita.residente_id else None
+    if visita and residente:
+        enviar_notificacion_solicitud_visita(db, visita, residente)
+
+def _ticket_creado(db: Session, payload: dict):
+    ticket = db.get(Ticket, payload["ticket_id"])
+    if ticket:
+        notificar_admin_ticket_creado_email(db, ticket, payload["residente_nombre"])
+
+def _ticket_actualizado(db: Session, payload: dict):
+    ticket = db.get(Ticket, payload["ticket_id"])
+    if ticket:
+        notificar_residente_ticket_actualizado_email(db, ticket)
+
+def _nueva_publicacion(db: Session, payload: dict):
+    enviar_notificacion_nueva_publicacion(db, **payload)
+
+MANEJADORES = {
+    "visita_creador": _visita_creador,
+    "visita_guardia": _visita_guardia,
+    "visitas_lote_guardia": _visitas_lote_guardia,
+    "visita_escaneo": _visita_escaneo,
+    "solicitud_visita": _solicitud_visita,
+    "ticket_creado": _ticket_creado,
+    "ticket_actualizado": _ticket_actualizado,
+    "nueva_publicacion": _nueva_publicacion,
+}
+
+# --- Despacho -----------------------------------------------------------------
+
+class MetricasOutbox:
+    """Conteos del despachador de notificaciones de este proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ejecuciones = 0
+        self.errores = 0
+        self.enviadas = 0
+        self.reintentos = 0
+        self.fallidas = 0
+        self.ultima_ejecucion = None
+        self.ultima_duracion_ms = None
+        self.ultimas_filas = None
+
+    def registrar(self, enviadas: int, reintentos: int, fallidas: int, duracion_ms: float):
+        with self._lock:
+            self.ejecuciones += 1
+            self.enviadas += enviadas
+            self.reintentos += reintentos
+            self.fallidas += fallidas
+            self.ultimas_filas = enviadas + reintentos + fallidas
+            self.ultima_duracion_ms = round(duracion_ms, 2)
+            self.ultima_ejecucion = get_honduras_time().isoformat()
+
+    def registrar_error(self):
+        with self._lock:
+            self.errores += 1
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "ejecuciones": self.ejecuciones,
+                "errores": self.errores,
+                "enviadas": self.enviadas,
+                "reintentos": self.reintentos,
+                "fallidas": self.fallidas,
+                "ultima_ejecucion": self.ultima_ejecucion,
+                "ultima_duracion_ms": self.ultima_duracion_ms,
+                "ultimas_filas": self.ultimas_filas
+            }
+
+metricas_outbox = MetricasOutbox()
+
+# Leases vencidos que ya agotaron sus intentos (el worker murió en el último):
+# pasan a fallido en lugar de volver a enviarse sin límite
+_SQL_ABANDONAR = text("""
+    UPDATE notificaciones_outbox
+    SET estado = 'fallido',
+        ultimo_error = 'Lease vencido sin resultado en el último intento'
+    WHERE id IN (
+        SELECT id FROM notificaciones_outbox
+        WHERE estado = 'procesando' AND proximo_intento <= now() AND intentos >= :max_intentos
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+
+# Toma una tanda vencida; SKIP LOCKED deja que varios workers despachen sin pisarse
+_SQL_RECLAMAR = text("""
+    UPDATE notificaciones_outbox
+    SET estado = 'procesando',
+        intentos = intentos + 1,
+        proximo_intento = now() + make_interval(secs => :lease)
+    WHERE id IN (
+        SELECT id FROM notificaciones_outbox
+        WHERE estado IN ('pendiente', 'procesando') AND proximo_intento <= now()
+          AND intentos < :max_intentos
+        ORDER BY proximo_intento
+        LIMIT :limite
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, tipo, payload, intentos
+""")
+
+def _reclamar(limite: int) -> tuple[list, int]:
+    """Tanda a enviar y cantidad de leases vencidos marcados como fallidos."""
+    db: Session = SessionLocal()
+    try:
+        parametros = {"max_intentos": settings.NOTIF_OUTBOX_MAX_INTENTOS}
+        abandonadas = db.execute(_SQL_ABANDONAR, parametros).rowcount
+        filas = db.execute(_SQL_RECLAMAR, {**parametros, "lease": LEASE_SEGUNDOS, "limite": limite}).all()
+        db.commit()
+        if abandonadas:
+            logger.warning(f"Outbox: {abandonadas} notificaciones con lease vencido en su último intento marcadas como fallidas")
+        return filas, abandonadas
+    finally:
+        db.close()
+
+def _esperar_tanda(futures: list, limite: float) -> list[tuple]:
+    """Resultados de la tanda, esperando a lo sumo hasta `limite` (time.monotonic)."""
+    resultados = []
+    for fila, future in futures:
+        try:
+            error = future.result(timeout=max(0, limite - time.monotonic()))
+        except FutureTimeoutError:
+            # El envío que sigue corriendo no se puede interrumpir; los que no
+            # empezaron se cancelan. Ambos quedan para reintento con backoff.
+            future.cancel()
+            error = f"Tiempo de envío agotado ({TIMEOUT_TANDA_SEGUNDOS} s)"
+            logger.error(f"Notificación {fila.id} ({fila.tipo}): {error}")
+        resultados.append((fila.id, fila.tipo, fila.intentos, error))
+    return resultados
+
+def _ejecutar(tipo: str, payload: dict):
+    """Corre el manejador con sesión propia; devuelve None si se envió o el error."""
+    manejador = MANEJADORES.get(tipo)
+    if manejador is None:
+        return f"Tipo de notificación desconocido: {tipo}"
+    db: Session = SessionLocal()
+    try:
+        manejador(db, payload)
+        db.commit()
+        return None
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al enviar notificación {tipo}: {str(e)}")
+        print(traceback.format_exc())
+        return str(e) or e.__class__.__name__
+    finally:
+        db.close()
+
+def _espera_reintento(intentos: int) -> float:
+    # Backoff exponencial con jitter, acotado
+    espera = min(settings.NOTIF_OUTBOX_BACKOFF_MAX, settings.NOTIF_OUTBOX_BACKOFF_BASE * 2 ** (intentos - 1))
+    return espera * random.uniform(0.5, 1.0)
+
+def _registrar_resultados(resultados: list[tuple]) -> tuple[int, int, int]:
+    enviadas = [id for id, _, _, error in resultados if error is None]
+    db: Session = SessionLocal()
+    try:
+        if enviadas:
+            db.query(NotificacionOutbox).filter(NotificacionOutbox.id.in_(enviadas)).update({
+                "estado": "enviado",
+                "fecha_envio": func.now(),
+                "ultimo_error": None
+            }, synchronize_session=False)
+
+        reintentos = fallidas = 0
+        for id, tipo, intentos, error in resultados:
+            if error is None:
+                continue
+            if intentos >= settings.NOTIF_OUTBOX_MAX_INTENTOS or tipo not in MANEJADORES:
+                cambios = {"estado": "fallido", "ultimo_error": error[:2000]}
+                fallidas += 1
+            else:
+                cambios = {
+                    "estado": "pendiente",
+                    "ultimo_error": error[:2000],
+                    "proximo_intento": func.now() + timedelta(seconds=_espera_reintento(intentos))
+                }
+                reintentos += 1
+            db.query(NotificacionOutbox).filter(NotificacionOutbox.id == id).update(cambios, synchronize_session=False)
+        db.commit()
+        return len(enviadas), reintentos, fallidas
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def despachar_outbox() -> int:
+    """
+    Tarea programada: envía las notificaciones pendientes en tandas de
+    NOTIF_OUTBOX_LOTE, con NOTIF_OUTBOX_WORKERS envíos en paralelo.
+    Sigue mientras las tandas salgan llenas (acotado a unas rondas por corrida).
+    """
+    inicio = time.perf_counter()
+    totales = [0, 0, 0]
+    try:
+        for _ in range(10):
+            filas, abandonadas = _reclamar(settings.NOTIF_OUTBOX_LOTE)
+            totales[2] += abandonadas
+            if not filas:
+                break
+            limite = time.monotonic() + TIMEOUT_TANDA_SEGUNDOS
+            futures = [(fila, outbox_executor.submit(_ejecutar, fila.tipo, fila.payload)) for fila in filas]
+            resultados = _esperar_tanda(futures, limite)
+            for i, cantidad in enumerate(_registrar_resultados(resultados)):
+                totales[i] += cantidad
+            if len(filas) < settings.NOTIF_OUTBOX_LOTE:
+                break
+        if any(totales):
+            metricas_outbox.registrar(*totales, (time.perf_counter() - inicio) * 1000)
+            logger.info(f"Outbox: {totales[0]} enviadas, {totales[1]} reintentos, {totales[2]} fallidas")
+        return totales[0]
+    except Exception as e:
+        metricas_outbox.registrar_error()
+        logger.error(f"Error al despachar notificaciones: {str(e)}")
+        return 0
+
+def purgar_outbox(dias: int = 7) -> int:
+    """Tarea programada: borra las notificaciones ya enviadas hace más de `dias` días."""
+    db: Session = SessionLocal()
+    try:
+        borradas = db.query(NotificacionOutbox).filter(
+            NotificacionOutbox.estado == "enviado",
+            NotificacionOutbox.fecha_envio < func.now() - timedelta(days=dias)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return borradas
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al purgar el outbox de notificaciones: {str(e)}")
+        return 0
+    finally:
+        db.close()
@@ -1,8 +1,11 @@
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from pywebpush import webpush, WebPushException
+from pywebpush import WebPushException
 from app.models.push_subscription import PushSubscription
 from app.models.usuario import Usuario
 from app.models.admin import Administrador
@@ -10,17 +13,55 @@ from app.models.residente import Residente
 from app.models.guardia import Guardia
 from app.core.config import settings
 from app.utils.time import get_honduras_time
+from app.utils.push_crypto import enviar_webpush, resumen_push_crypto
 
 logger = logging.getLogger(__name__)
 
-class PushNotificationService:
-    """Servicio para gestionar notificaciones push"""
+# Hilos para los envíos web push: cada envío es una petición HTTP al servicio push
+# del navegador, así que una difusión a toda una residencial se hace en paralelo
+push_executor = ThreadPoolExecutor(
+    max_workers=settings.PUSH_WORKERS,
+    thread_name_prefix="push"
+)
+
+class MetricasPush:
+    """Conteos de envíos web push de este proceso"""
     
     def __init__(self):
-        self.vapid_claims = {
-            "sub": settings.VAPID_EMAIL
-        }
-        self.vapid_private_key = settings.VAPID_PRIVATE_KEY
+        self._lock = threading.Lock()
+        self.difusiones = 0
+        self.enviados = 0
+        self.fallidos = 0
+        self.desactivadas = 0
+        self.ultima_duracion_ms = None
+        self.ultimo_total = None
+    
+    def registrar(self, enviados: int, fallidos: int, desactivadas: int, duracion_ms: float):
+        with self._lock:
+            self.difusiones += 1
+            self.enviados += enviados
+            self.fallidos += fallidos
+            self.desactivadas += desactivadas
+            self.ultimo_total = enviados + fallidos
+            self.ultima_duracion_ms = round(duracion_ms, 2)
+    
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "workers": settings.PUSH_WORKERS,
+                "difusiones": self.difusiones,
+                "enviados": self.enviados,
+                "fallidos": self.fallidos,
+                "desactivadas": self.desactivadas,
+                "ultimo_total": self.ultimo_total,
+                "ultima_duracion_ms": self.ultima_duracion_ms,
+                **resumen_push_crypto()
+            }
+
+metricas_push = MetricasPush()
+
+class PushNotificationService:
+    """Servicio para gestionar notificaciones push"""
     
     def crear_suscripcion(
         self,
@@ -135,6 +176,121 @@ class PushNotificationService:
             PushSubscription.is_active == 1
         ).all()
     
+    def _preparar_payload(self, payload: Dict[str, Any]) -> str:
+        """Completa title/body si faltan y serializa una sola vez para todo el envío"""
+        # ✅ BACKEND VALIDATION: Ensure required fields exist
+        if 'title' not in payload:
+            logger.warning(f"Payload missing 'title' field, adding default: {payload}")
+            payload['title'] = '🔔 Notificación'
+        
+        if 'body' not in payload:
+            logger.warning(f"Payload missing 'body' field, adding default: {payload}")
+            payload['body'] = 'Nueva actualización'
+        
+        return json.dumps(payload)
+    
+    def _webpush(self, subscription_info: Dict[str, Any], data: str) -> str:
+        """
+        Envía un push (corre en push_executor, sin tocar la BD)
+        
+        Returns:
+            "enviado", "invalida" (404/410: el endpoint ya no existe) o "error"
+        """
+        try:
+            enviar_webpush(subscription_info, data)
+            return "enviado"
+        except WebPushException as e:
+            logger.error(f"Error enviando push: {e}")
+            if e.response is not None and e.response.status_code in [404, 410]:
+                logger.warning(
+                    f"Endpoint inválido (status {e.response.status_code}): "
+                    f"{subscription_info['endpoint'][:50]}..."
+                )
+                return "invalida"
+            return "error"
+        except Exception as e:
+            logger.error(f"Error inesperado enviando push: {str(e)}")
+            return "error"
+    
+    def _enviar_lote(
+        self,
+        db: Session,
+        suscripciones: List[PushSubscription],
+        payload: Dict[str, Any]
+    ) -> Dict[int, tuple]:
+        """
+        Envía el mismo payload a varias suscripciones en paralelo (push_executor)
+        y registra el resultado con dos UPDATE y un solo commit
+        
+        Args:
+            db: Sesión de base de datos
+            suscripciones: Suscripciones activas destino
+            payload: Datos de la notificación
+            
+        Returns:
+            {usuario_id: (enviados, fallidos)}
+        """
+        if not suscripciones:
+            return {}
+        
+        inicio = time.perf_counter()
+        data = self._preparar_payload(payload)
+        # Los hilos solo reciben datos simples; la sesión se usa únicamente en este hilo
+        destinos = [
+            (
+                suscripcion.id,
+                suscripcion.usuario_id,
+                {
+                    "endpoint": suscripcion.endpoint,
+                    "keys": {
+                        "p256dh": suscripcion.p256dh_key,
+                        "auth": suscripcion.auth_key
+                    }
+                }
+            )
+            for suscripcion in suscripciones
+        ]
+        futures = [
+            (suscripcion_id, usuario_id, push_executor.submit(self._webpush, info, data))
+            for suscripcion_id, usuario_id, info in destinos
+        ]
+        
+        enviadas, invalidas = [], []
+        por_usuario: Dict[int, tuple] = {}
+        for suscripcion_id, usuario_id, future in futures:
+            resultado = future.result()
+            enviados, fallidos = por_usuario.get(usuario_id, (0, 0))
+            if resultado == "enviado":
+                enviadas.append(suscripcion_id)
+                por_usuario[usuario_id] = (enviados + 1, fallidos)
+            else:
+                if resultado == "invalida":
+                    invalidas.append(suscripcion_id)
+                por_usuario[usuario_id] = (enviados, fallidos + 1)
+        
+        try:
+            if enviadas:
+                db.query(PushSubscription).filter(
+                    PushSubscription.id.in_(enviadas)
+                ).update({"last_used": get_honduras_time()}, synchronize_session=False)
+            if invalidas:
+                # Soft-delete de los endpoints que el servicio push ya no reconoce
+                db.query(PushSubscription).filter(
+                    PushSubscription.id.in_(invalidas)
+                ).update({"is_active": 0}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error actualizando suscripciones push: {str(e)}")
+        
+        metricas_push.registrar(len(enviadas), len(destinos) - len(enviadas), len(invalidas),
+                                (time.perf_counter() - inicio) * 1000)
+        logger.info(
+            f"Push: {len(enviadas)}/{len(destinos)} enviados a {len(por_usuario)} usuarios, "
+            f"{len(invalidas)} suscripciones desactivadas"
+        )
+        return por_usuario
+    
     def enviar_push(
         self,
         db: Session,
@@ -152,68 +308,8 @@ class PushNotificationService:
         Returns:
             True si se envió correctamente, False en caso contrario
         """
-        try:
-            subscription_info = {
-                "endpoint": suscripcion.endpoint,
-                "keys": {
-                    "p256dh": suscripcion.p256dh_key,
-                    "auth": suscripcion.auth_key
-                }
-            }
-            
-            # Convertir payload a JSON
-            data = json.dumps(payload)
-            
-            # ✅ BACKEND VALIDATION: Ensure required fields exist
-            if 'title' not in payload:
-                logger.warning(f"Payload missing 'title' field, adding default: {payload}")
-                payload['title'] = '🔔 Notificación'
-            
-            if 'body' not in payload:
-                logger.warning(f"Payload missing 'body' field, adding default: {payload}")
-                payload['body'] = 'Nueva actualización'
-            
-            # Re-encode with validated payload
-            data = json.dumps(payload)
-            
-            # Enviar notificación push
-            webpush(
-                subscription_info=subscription_info,
-                data=data,
-                vapid_private_key=self.vapid_private_key,
-                vapid_claims=self.vapid_claims.copy()
-            )
-            
-            # Actualizar last_used
-            suscripcion.last_used = get_honduras_time()
-            db.commit()
-            
-            logger.info(f"Push enviado a usuario {suscripcion.usuario_id}")
-            return True
-            
-        except WebPushException as e:
-            logger.error(f"Error enviando push: {e}")
-            
-            # Si el endpoint ya no es válido (410 Gone o 404), eliminar suscripción
-            if e.response and e.response.status_code in [404, 410]:
-                logger.warning(
-                    f"Endpoint inválido (status {e.response.status_code}), "
-                    f"eliminando suscripción del usuario {suscripcion.usuario_id}: "
-                    f"{suscripcion.endpoint[:50]}..."
-                )
-                try:
-                    suscripcion.is_active = 0 # Soft-delete
-                    db.commit()
-                    logger.info(f"Suscripción desactivada exitosamente (soft-delete)")
-                except Exception as delete_error:
-                    logger.error(f"Error eliminando suscripción inválida: {delete_error}")
-                    db.rollback()
-            
-            return False
-            
-        except Exception as e:
-            logger.error(f"Error inesperado enviando push: {str(e)}")
-            return False
+        enviados, _ = self._enviar_lote(db, [suscripcion], payload).get(suscripcion.usuario_id, (0, 0))
+        return enviados > 0
     
     def enviar_push_a_usuario(
         self,
@@ -238,14 +334,7 @@ class PushNotificationService:
             logger.warning(f"Usuario {usuario_id} no tiene suscripciones push")
             return {"enviados": 0, "fallidos": 0, "total": 0}
         
-        enviados = 0
-        fallidos = 0
-        
-        for suscripcion in suscripciones:
-            if self.enviar_push(db, suscripcion, payload):
-                enviados += 1
-            else:
-                fallidos += 1
+        enviados, fallidos = self._enviar_lote(db, suscripciones, payload).get(usuario_id, (0, 0))
         
         return {
             "enviados": enviados,
@@ -273,29 +362,23 @@ class PushNotificationService:
         Returns:
             Diccionario con estadísticas de envío
         """
-        total_enviados = 0
-        total_fallidos = 0
-        usuarios_notificados = 0
+        # Todas las suscripciones destino en una sola consulta
+        query = db.query(PushSubscription).filter(
+            PushSubscription.usuario_id.in_(set(usuario_ids)),
+            PushSubscription.is_active == 1
+        )
+        if residencial_id:
+            query = query.join(Usuario, Usuario.id == PushSubscription.usuario_id).filter(
+                Usuario.residencial_id == residencial_id
+            )
+        suscripciones = query.all()
         
-        for usuario_id in usuario_ids:
-            # Validar residencial si se especifica
-            if residencial_id:
-                usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
-                if not usuario or usuario.residencial_id != residencial_id:
-                    logger.warning(f"Usuario {usuario_id} no pertenece al residencial {residencial_id}")
-                    continue
-            
-            resultado = self.enviar_push_a_usuario(db, usuario_id, payload)
-            total_enviados += resultado["enviados"]
-            total_fallidos += resultado["fallidos"]
-            
-            if resultado["enviados"] > 0:
-                usuarios_notificados += 1
+        por_usuario = self._enviar_lote(db, suscripciones, payload)
         
         return {
-            "usuarios_notificados": usuarios_notificados,
-            "total_enviados": total_enviados,
-            "total_fallidos": total_fallidos,
+            "usuarios_notificados": sum(1 for enviados, _ in por_usuario.values() if enviados > 0),
+            "total_enviados": sum(enviados for enviados, _ in por_usuario.values()),
+            "total_fallidos": sum(fallidos for _, fallidos in por_usuario.values()),
             "total_usuarios": len(usuario_ids)
         }
     
@@ -316,25 +399,17 @@ class PushNotificationService:
         Returns:
             Lista de IDs de usuarios
         """
-        if rol == "admin":
-            admins = db.query(Administrador).filter(
-                Administrador.residencial_id == residencial_id
-            ).all()
-            return [admin.usuario_id for admin in admins if admin.usuario_id]
-        
-        elif rol == "guardia":
-            guardias = db.query(Guardia).filter(
-                Guardia.residencial_id == residencial_id
-            ).all()
-            return [guardia.usuario_id for guardia in guardias if guardia.usuario_id]
+        modelos = {"admin": Administrador, "guardia": Guardia, "residente": Residente}
+        modelo = modelos.get(rol)
+        if modelo is None:
+            return []
         
-        elif rol == "residente":
-            residentes = db.query(Residente).filter(
-                Residente.residencial_id == residencial_id
-            ).all()
-            return [residente.usuario_id for residente in residentes if residente.usuario_id]
-        
-        return []
+        # Solo la columna usuario_id, sin cargar las entidades
+        filas = db.query(modelo.usuario_id).filter(
+            modelo.residencial_id == residencial_id,
+            modelo.usuario_id.isnot(None)
+        ).all()
+        return [usuario_id for (usuario_id,) in filas]
     
     def notificar_por_rol(
         self,
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from typing import Optional
+from app.core.config import settings
+from app.utils.qr import VERSION_PLANTILLA_QR
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+def clave_imagen_qr(
+    qr_data: str,
+    nombre_residente: str,
+    nombre_visitante: str,
+    nombre_residencial: str,
+    unidad_residencial: str,
+    fecha_expiracion
+) -> str:
+    """
+    Hash de todo lo que se dibuja en la imagen (payload, plantilla y textos de la
+    residencial/visita). fecha_creacion no se dibuja, así que no forma parte de la clave.
+    """
+    partes = (
+        VERSION_PLANTILLA_QR, qr_data, nombre_residente, nombre_visitante,
+        nombre_residencial, unidad_residencial, fecha_expiracion.isoformat()
+    )
+    return hashlib.sha256("\x1f".join(partes).encode()).hexdigest()
+
+class CacheImagenesQR:
+    """
+    Cache de PNG de QR direccionado por contenido, en dos niveles:
+    LRU en memoria acotado por bytes (por worker) y archivos .png en disco
+    compartidos entre workers, leídos con mmap. Como la clave es el hash del
+    contenido, una entrada nunca queda vieja: solo se desaloja por espacio.
+    """
+
+    def __init__(self, max_bytes_memoria: int, directorio: Optional[str], max_bytes_disco: int):
+        self.max_bytes_memoria = max_bytes_memoria
+        self.directorio = directorio if max_bytes_disco > 0 else None
+        self.max_bytes_disco = max_bytes_disco
+        self._memoria = OrderedDict()
+        self._bytes_memoria = 0
+        self._bytes_disco = None  # se calcula al primer uso del disco
+        self._lock = threading.Lock()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.evicciones_memoria = 0
+        self.evicciones_disco = 0
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave[:2], f"{clave}.png")
+
+    # --- memoria -------------------------------------------------------------
+
+    def _guardar_memoria(self, clave: str, png: bytes):
+        if len(png) > self.max_bytes_memoria:
+            return
+        with self._lock:
+            anterior = self._memoria.pop(clave, None)
+            if anterior is not None:
+                self._bytes_memoria -= len(anterior)
+            self._memoria[clave] = png
+            self._bytes_memoria += len(png)
+            while self._bytes_memoria > self.max_bytes_memoria:
+                _, desalojado = self._memoria.popitem(last=False)
+                self._bytes_memoria -= len(desalojado)
+                self.evicciones_memoria += 1
+
+    # --- disco ---------------------------------------------------------------
+
+    def _leer_disco(self, clave: str) -> Optional[bytes]:
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "rb") as archivo:
+                with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as vista:
+                    png = vista[:]
+            # mtime como último uso: el recorte de disco borra primero lo menos usado
+            os.utime(ruta)
+            return png
+        except (FileNotFoundError, ValueError):
+            # ValueError: archivo vacío (escritura interrumpida)
+            return None
+        except OSError as e:
+            logger.warning(f"No se pudo leer el QR cacheado {clave}: {e}")
+            return None
+
+    def _escribir_disco(self, clave: str, png: bytes):
+        ruta = self._ruta(clave)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            # Escritura atómica: otro worker nunca ve un PNG a medias
+            fd, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+            with os.fdopen(fd, "wb") as archivo:
+                archivo.write(png)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el QR {clave} en disco: {e}")
+            return
+        with self._lock:
+            if self._bytes_disco is not None:
+                self._bytes_disco += len(png)
+            excedido = self._bytes_disco is None or self._bytes_disco > self.max_bytes_disco
+        if excedido:
+            self._recortar_disco()
+
+    def _archivos_disco(self) -> list[tuple[float, int, str]]:
+        archivos = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in nombres:
+                if not nombre.endswith(".png"):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                archivos.append((estado.st_mtime, estado.st_size, ruta))
+        return archivos
+
+    def _recortar_disco(self):
+        """Recalcula el tamaño real (otros workers también escriben) y borra los más antiguos."""
+        archivos = self._archivos_disco()
+        total = sum(tamano for _, tamano, _ in archivos)
+        evicciones = 0
+        if total > self.max_bytes_disco:
+            # Se baja al 90% para no recorrer el directorio en cada escritura
+            objetivo = self.max_bytes_disco * 0.9
+            for _, tamano, ruta in sorted(archivos):
+                if total <= objetivo:
+                    break
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+                total -= tamano
+                evicciones += 1
+        with self._lock:
+            self._bytes_disco = total
+            self.evicciones_disco += evicciones
+
+    # --- API -----------------------------------------------------------------
+
+    def obtener(self, clave: str) -> Optional[bytes]:
+        with self._lock:
+            png = self._memoria.get(clave)
+            if png is not None:
+                self._memoria.move_to_end(clave)
+                self.hits_memoria += 1
+                return png
+        png = self._leer_disco(clave) if self.directorio else None
+        with self._lock:
+            if png is None:
+                self.misses += 1
+                return None
+            self.hits_disco += 1
+        self._guardar_memoria(clave, png)
+        return png
+
+    def guardar(self, clave: str, png: bytes):
+        self._guardar_memoria(clave, png)
+        if self.directorio:
+            self._escribir_disco(clave, png)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "entradas_memoria": len(self._memoria),
+                "bytes_memoria": self._bytes_memoria,
+                "max_bytes_memoria": self.max_bytes_memoria,
+                "bytes_disco": self._bytes_disco,
+                "max_bytes_disco": self.max_bytes_disco if self.directorio else 0,
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "evicciones_memoria": self.evicciones_memoria,
+                "evicciones_disco": self.evicciones_disco
+            }
+
+cache_imagenes_qr = CacheImagenesQR(
+    settings.QR_CACHE_MEMORIA_MB * 1024 * 1024,
+    settings.QR_CACHE_DIR or os.path.join(tempfile.gettempdir(), "qr_cache"),
+    settings.QR_CACHE_DISCO_MB * 1024 * 1024
+)
@@ -0,0 +1,226 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update
+from fastapi import HTTPException
+from app.database import SessionLocal
+from app.core.config import settings
+from app.models.visita import Visita
+from app.models.residencial import Residencial
+from app.models.residente import Residente
+from app.models.admin import Administrador
+from app.services.qr_render_service import servicio_render_qr, trabajo_render_visita
+from app.services.cloudinary_service import upload_image
+from app.utils.lider_cluster import LiderCluster
+from app.utils.time import get_honduras_time
+import logging
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Pool acotado para emitir las imagenes QR fuera del request HTTP (el render va a servicio_render_qr)
+qr_executor = ThreadPoolExecutor(
+    max_workers=settings.QR_WORKERS,
+    thread_name_prefix="qr_emision"
+)
+
+# Pool propio de los lotes masivos: miles de visitas no hacen fila delante de la
+# emisión de una visita creada desde el formulario
+qr_executor_lotes = ThreadPoolExecutor(
+    max_workers=settings.QR_LOTE_WORKERS,
+    thread_name_prefix="qr_emision_lote"
+)
+
+# Clave del advisory lock de Postgres que elige al worker líder de la reemisión de QR
+LOCK_REEMISION_QR = 731_205_003
+
+lider_reemision_qr = LiderCluster(LOCK_REEMISION_QR)
+
+# lote_id -> última vez (monotonic) que se renovó qr_programado_en de sus pendientes
+_latidos_lotes: dict[str, float] = {}
+_latidos_lock = threading.Lock()
+
+def _renovar_lotes(db: Session, lote_ids: set):
+    """
+    Un lote grande tarda más que QR_REEMISION_MINUTOS en vaciarse de qr_executor_lotes:
+    mientras avanza, renueva qr_programado_en de sus visitas aún en cola (a lo sumo
+    una vez por media ventana) para que el barrido no las vuelva a encolar.
+    """
+    ahora = time.monotonic()
+    intervalo = settings.QR_REEMISION_MINUTOS * 60 / 2
+    with _latidos_lock:
+        vencidos = [lote_id for lote_id in lote_ids if ahora - _latidos_lotes.get(lote_id, 0) >= intervalo]
+        for lote_id in vencidos:
+            _latidos_lotes[lote_id] = ahora
+        for lote_id, marca in list(_latidos_lotes.items()):
+            if ahora - marca > intervalo * 4:
+                del _latidos_lotes[lote_id]
+    if not vencidos:
+        return
+    db.query(Visita).filter(
+        Visita.lote_id.in_(vencidos),
+        Visita.qr_estado == "pendiente"
+    ).update({"qr_programado_en": get_honduras_time()}, synchronize_session=False)
+    db.commit()
+
+def _marcar_fallidas(db: Session, visita_ids: list[int]):
+    try:
+        db.query(Visita).filter(Visita.id.in_(visita_ids)).update({"qr_estado": "fallido"}, synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+
+def _emitir_qr_lote(visita_ids: list[int]):
+    """
+    Renderiza las imágenes QR de visitas ya confirmadas en BD (un envío al pool de
+    procesos por lote), las sube a Cloudinary y guarda qr_url de cada una.
+    Corre en qr_executor o qr_executor_lotes con su propia sesión. Las que ya
+    tienen QR generado se omiten, así que el barrido de reemisión puede volver a
+    enviarlas sin duplicar.
+    """
+    db: Session = SessionLocal()
+    try:
+        visitas = db.query(Visita).options(
+            joinedload(Visita.visitante),
+            joinedload(Visita.residente).joinedload(Residente.usuario),
+            joinedload(Visita.admin).joinedload(Administrador.usuario)
+        ).filter(Visita.id.in_(visita_ids)).order_by(Visita.id).all()
+        existentes = {visita.id for visita in visitas}
+        for visita_id in visita_ids:
+            if visita_id not in existentes:
+                logger.warning(f"Visita {visita_id} no encontrada para emitir QR")
+        visitas = [visita for visita in visitas if visita.qr_estado != "generado"]
+        if not visitas:
+            return
+        encontradas = {visita.id for visita in visitas}
+        lote_ids = {visita.lote_id for visita in visitas if visita.lote_id}
+
+        residencial_ids = {visita.residencial_id for visita in visitas if visita.residencial_id}
+        nombres_residencial = dict(
+            db.query(Residencial.id, Residencial.nombre).filter(Residencial.id.in_(residencial_ids)).all()
+        ) if residencial_ids else {}
+
+        try:
+            pngs = servicio_render_qr.renderizar_lote([
+                trabajo_render_visita(visita, nombres_residencial.get(visita.residencial_id, "Residencial"))
+                for visita in visitas
+            ])
+        except Exception as e:
+            logger.error(f"Error al renderizar QR de las visitas {sorted(encontradas)}: {str(e)}")
+            print(traceback.format_exc())
+            _marcar_fallidas(db, list(encontradas))
+            return
+
+        for visita, qr_png in zip(visitas, pngs):
+            try:
+                # Subir el PNG a Cloudinary directo desde memoria
+                public_id = f"qr_{visita.id}_{visita.visitante_id}"
+                result = upload_image(qr_png, folder="qr", public_id=public_id)
+
+                visita.qr_url = result["secure_url"]
+                visita.qr_estado = "generado"
+                db.commit()
+                logger.info(f"QR emitido para visita {visita.id}")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error al emitir QR de la visita {visita.id}: {str(e)}")
+                print(traceback.format_exc())
+                _marcar_fallidas(db, [visita.id])
+
+        if lote_ids:
+            _renovar_lotes(db, lote_ids)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al emitir QR de las visitas {visita_ids}: {str(e)}")
+        print(traceback.format_exc())
+        _marcar_fallidas(db, visita_ids)
+    finally:
+        db.close()
+
+def programar_emision_qr(visita_ids: list[int]):
+    """
+    Encola la emisión de QR de visitas ya confirmadas, repartida en lotes para que
+    los QR_WORKERS hilos suban en paralelo y cada lote cruce una sola vez al pool de render.
+    Los futures viven solo en memoria: si el proceso cae, reprogramar_emisiones_qr
+    retoma las visitas que quedaron en 'pendiente'.
+    """
+    return _programar(qr_executor, settings.QR_WORKERS, visita_ids)
+
+def programar_emision_qr_lote(visita_ids: list[int]):
+    """
+    Igual que programar_emision_qr para las visitas de un lote masivo, en
+    qr_executor_lotes: sus trabajos no retrasan la emisión interactiva.
+    """
+    return _programar(qr_executor_lotes, settings.QR_LOTE_WORKERS, visita_ids)
+
+def _programar(executor: ThreadPoolExecutor, hilos: int, visita_ids: list[int]):
+    if not visita_ids:
+        return []
+    tamano = min(settings.QR_RENDER_CHUNK, max(1, -(-len(visita_ids) // hilos)))
+    futures = []
+    for i in range(0, len(visita_ids), tamano):
+        futures.append(executor.submit(_emitir_qr_lote, visita_ids[i:i + tamano]))
+    return futures
+
+def reprogramar_emisiones_qr():
+    """
+    Tarea programada (APScheduler en cada worker). Solo el worker líder
+    (lider_reemision_qr) procesa: vuelve a encolar las visitas vigentes cuyo QR
+    sigue 'pendiente' (el proceso que lo emitía se reinició) o quedó 'fallido'
+    tras más de QR_REEMISION_MINUTOS, hasta QR_MAX_REINTENTOS veces por visita.
+    """
+    try:
+        if not lider_reemision_qr.es_lider():
+            return 0
+    except Exception as e:
+        logger.error(f"Error al verificar el liderazgo de la reemisión de QR: {str(e)}")
+        return 0
+
+    db: Session = SessionLocal()
+    try:
+        ahora = get_honduras_time()
+        atascadas = select(Visita.id).where(
+            Visita.qr_estado.in_(["pendiente", "fallido"]),
+            Visita.qr_programado_en <= ahora - timedelta(minutes=settings.QR_REEMISION_MINUTOS),
+            Visita.qr_reintentos < settings.QR_MAX_REINTENTOS,
+            Visita.qr_expiracion > ahora
+        ).order_by(Visita.qr_programado_en).limit(settings.QR_REEMISION_LOTE).with_for_update(skip_locked=True)
+
+        filas = db.execute(
+            update(Visita).where(Visita.id.in_(atascadas.scalar_subquery())).values(
+                qr_estado="pendiente",
+                qr_programado_en=ahora,
+                qr_reintentos=Visita.qr_reintentos + 1
+            ).returning(Visita.id, Visita.lote_id)
+        ).all()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al buscar emisiones de QR atascadas: {str(e)}")
+        return 0
+    finally:
+        db.close()
+
+    if filas:
+        logger.warning(f"Reemisión de QR: {len(filas)} visitas vueltas a encolar")
+        programar_emision_qr(sorted(visita_id for visita_id, lote_id in filas if lote_id is None))
+        programar_emision_qr_lote(sorted(visita_id for visita_id, lote_id in filas if lote_id is not None))
+    return len(filas)
+
+def obtener_estado_qr_visita(db: Session, visita_id: int, usuario_id: int) -> dict:
+    """Estado de emisión del QR de una visita, solo visible para su creador."""
+    visita = db.query(Visita).filter(Visita.id == visita_id).first()
+    if not visita:
+        raise HTTPException(status_code=404, detail="Visita no encontrada")
+
+    creador = visita.residente if visita.residente_id else visita.admin
+    if not creador or creador.usuario_id != usuario_id:
+        raise HTTPException(status_code=403, detail="No tienes permiso para consultar esta visita")
+
+    return {
+        "visita_id": visita.id,
+        "qr_estado": visita.qr_estado,
+        "qr_url": visita.qr_url
+    }
@@ -0,0 +1,144 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import NamedTuple
+from app.core.config import settings
+from app.utils.qr import renderizar_imagen_qr_personalizada, precargar_render_qr
+from app.services.qr_cache import cache_imagenes_qr, clave_imagen_qr
+import io
+import logging
+import multiprocessing
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class TrabajoRenderQR(NamedTuple):
+    """Argumentos de renderizar_imagen_qr_personalizada; solo tipos simples para cruzar al proceso."""
+    qr_data: str
+    nombre_residente: str
+    nombre_visitante: str
+    nombre_residencial: str
+    unidad_residencial: str
+    fecha_creacion: datetime
+    fecha_expiracion: datetime
+
+def trabajo_render_visita(visita, nombre_residencial: str) -> TrabajoRenderQR:
+    """Trabajo de render de una visita con visitante y creador (residente/admin) cargados."""
+    residente = visita.residente
+    creador = residente if residente else visita.admin
+    return TrabajoRenderQR(
+        qr_data=visita.qr_code,
+        nombre_residente=creador.usuario.nombre if creador else "-",
+        nombre_visitante=visita.visitante.nombre_conductor,
+        nombre_residencial=nombre_residencial,
+        unidad_residencial=residente.unidad_residencial if residente else "-",
+        fecha_creacion=datetime.now(timezone.utc),
+        fecha_expiracion=visita.qr_expiracion
+    )
+
+def _inicializar_worker():
+    precargar_render_qr()
+
+def _renderizar_trabajo(trabajo: TrabajoRenderQR) -> bytes:
+    return renderizar_imagen_qr_personalizada(*trabajo).getvalue()
+
+class ServicioRenderQR:
+    """
+    Renderiza imágenes QR en un pool de procesos para no competir por el GIL con los
+    requests. El pool se crea al primer uso (spawn: los workers no heredan hilos ni
+    conexiones del proceso web). Con QR_RENDER_PROCESOS=0 se renderiza en el hilo llamador.
+    """
+
+    def __init__(self, procesos: int, chunk: int):
+        self.procesos = procesos
+        self.chunk = chunk
+        self._executor = None
+        self._lock = threading.Lock()
+        self.trabajos = 0
+        self.errores = 0
+        self.tiempo_total_ms = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.procesos,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_inicializar_worker
+                )
+            return self._executor
+
+    def _descartar_pool(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def renderizar_lote(self, trabajos: list[TrabajoRenderQR]) -> list[io.BytesIO]:
+        """
+        PNGs en el mismo orden de los trabajos. Los que ya están en cache_imagenes_qr
+        no se vuelven a renderizar; el resto va al pool en bloques de `chunk`.
+        """
+        if not trabajos:
+            return []
+        claves = [
+            clave_imagen_qr(t.qr_data, t.nombre_residente, t.nombre_visitante,
+                            t.nombre_residencial, t.unidad_residencial, t.fecha_expiracion)
+            for t in trabajos
+        ]
+        pngs = [cache_imagenes_qr.obtener(clave) for clave in claves]
+        faltantes = [i for i, png in enumerate(pngs) if png is None]
+        if faltantes:
+            renderizados = self._renderizar([trabajos[i] for i in faltantes])
+            for i, png in zip(faltantes, renderizados):
+                cache_imagenes_qr.guardar(claves[i], png)
+                pngs[i] = png
+        return [io.BytesIO(png) for png in pngs]
+
+    def _renderizar(self, trabajos: list[TrabajoRenderQR]) -> list[bytes]:
+        inicio = time.perf_counter()
+        try:
+            if self.procesos <= 0:
+                pngs = [_renderizar_trabajo(trabajo) for trabajo in trabajos]
+            else:
+                pngs = self._renderizar_en_pool(trabajos)
+        except Exception:
+            with self._lock:
+                self.errores += len(trabajos)
+            raise
+        with self._lock:
+            self.trabajos += len(trabajos)
+            self.tiempo_total_ms += (time.perf_counter() - inicio) * 1000
+        return pngs
+
+    def _renderizar_en_pool(self, trabajos: list[TrabajoRenderQR]) -> list[bytes]:
+        executor = self._pool()
+        try:
+            return list(executor.map(_renderizar_trabajo, trabajos, chunksize=self.chunk))
+        except BrokenProcessPool:
+            # Un worker murió (OOM, señal): se recrea el pool y se reintenta una vez
+            logger.warning("Pool de render QR roto, recreando")
+            self._descartar_pool(executor)
+            return list(self._pool().map(_renderizar_trabajo, trabajos, chunksize=self.chunk))
+
+    def renderizar(self, trabajo: TrabajoRenderQR) -> io.BytesIO:
+        return self.renderizar_lote([trabajo])[0]
+
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "procesos": self.procesos,
+                "activo": self._executor is not None,
+                "trabajos": self.trabajos,
+                "errores": self.errores,
+                "promedio_ms": round(self.tiempo_total_ms / self.trabajos, 2) if self.trabajos else 0.0
+            }
+
+servicio_render_qr = ServicioRenderQR(settings.QR_RENDER_PROCESOS, settings.QR_RENDER_CHUNK)
@@ -0,0 +1,262 @@
+from datetime import date
+from sqlalchemy.orm import Session
+from sqlalchemy import event, func, select, and_, or_, case, cast, inspect, text, Date, Integer
+from sqlalchemy.dialects.postgresql import insert
+from app.database import SessionLocal
+from app.models.visita import Visita
+from app.models.visitante import Visitante
+from app.models.escaneo_qr import EscaneoQR
+from app.models.residente import Residente
+from app.services.estadisticas_cache import invalidar_estadisticas
+from app.models.estadistica_rollup import EstadisticaVisitaDia, EstadisticaEscaneoHora, EstadisticaVisitasResidente
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock para la reconciliación nocturna (ver expiracion_service)
+LOCK_ROLLUP_ESTADISTICAS = 731_205_002
+
+# Atributos que cambian la fila de rollup a la que pertenece una visita
+_CAMPOS_VISITA = ("estado", "fecha_entrada", "visitante_id", "residente_id", "residencial_id")
+
+def _select_visitas_dia(signo: int, condicion=None):
+    """Visitas agrupadas por (residencial, día UTC, estado, tipo de vehículo), multiplicadas por signo."""
+    fecha = cast(func.timezone('UTC', Visita.fecha_entrada), Date)
+    tipo_vehiculo = func.coalesce(Visitante.tipo_vehiculo, '')
+    stmt = select(
+        Visita.residencial_id, fecha, Visita.estado, tipo_vehiculo, func.count(Visita.id) * signo
+    ).join(
+        Visitante, Visita.visitante_id == Visitante.id
+    ).where(
+        Visita.residencial_id.isnot(None),
+        Visita.fecha_entrada.isnot(None)
+    )
+    if condicion is not None:
+        stmt = stmt.where(condicion)
+    return stmt.group_by(Visita.residencial_id, fecha, Visita.estado, tipo_vehiculo)
+
+def _select_escaneos_hora(signo: int, condicion=None):
+    """Escaneos agrupados por (residencial, hora UTC, guardia) separando entradas y salidas."""
+    # date_trunc sobre la hora UTC y de vuelta a timestamptz, independiente del TimeZone de la sesión
+    hora = func.timezone('UTC', func.date_trunc('hour', func.timezone('UTC', EscaneoQR.fecha_escaneo)))
+    es_salida = EscaneoQR.tipo == "salida"
+    stmt = select(
+        EscaneoQR.residencial_id,
+        hora,
+        EscaneoQR.guardia_id,
+        func.sum(case((es_salida, 0), else_=1)).cast(Integer) * signo,
+        func.sum(case((es_salida, 1), else_=0)).cast(Integer) * signo
+    ).where(
+        EscaneoQR.residencial_id.isnot(None)
+    )
+    if condicion is not None:
+        stmt = stmt.where(condicion)
+    return stmt.group_by(EscaneoQR.residencial_id, hora, EscaneoQR.guardia_id)
+
+def _select_residentes(signo: int, condicion=None):
+    """Total de visitas por residente creador."""
+    stmt = select(
+        Visita.residente_id, Residente.residencial_id, func.count(Visita.id) * signo
+    ).join(
+        Residente, Visita.residente_id == Residente.id
+    )
+    if condicion is not None:
+        stmt = stmt.where(condicion)
+    return stmt.group_by(Visita.residente_id, Residente.residencial_id)
+
+def _sumar_visitas_dia(conn, signo: int, condicion=None):
+    stmt = insert(EstadisticaVisitaDia).from_select(
+        ["residencial_id", "fecha", "estado", "tipo_vehiculo", "cantidad"],
+        _select_visitas_dia(signo, condicion)
+    )
+    conn.execute(stmt.on_conflict_do_update(
+        constraint="uq_estadisticas_visitas_dia",
+        set_={"cantidad": EstadisticaVisitaDia.cantidad + stmt.excluded.cantidad}
+    ))
+
+def _sumar_escaneos_hora(conn, signo: int, condicion=None):
+    stmt = insert(EstadisticaEscaneoHora).from_select(
+        ["residencial_id", "hora", "guardia_id", "entradas", "salidas"],
+        _select_escaneos_hora(signo, condicion)
+    )
+    conn.execute(stmt.on_conflict_do_update(
+        constraint="uq_estadisticas_escaneos_hora",
+        set_={
+            "entradas": EstadisticaEscaneoHora.entradas + stmt.excluded.entradas,
+            "salidas": EstadisticaEscaneoHora.salidas + stmt.excluded.salidas
+        }
+    ))
+
+def _sumar_residentes(conn, signo: int, condicion=None):
+    stmt = insert(EstadisticaVisitasResidente).from_select(
+        ["residente_id", "residencial_id", "total_visitas"],
+        _select_residentes(signo, condicion)
+    )
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["residente_id"],
+        set_={"total_visitas": EstadisticaVisitasResidente.total_visitas + stmt.excluded.total_visitas}
+    ))
+
+def _visitas_afectadas(visita_ids: set, visitante_ids: set):
+    condiciones = []
+    if visita_ids:
+        condiciones.append(Visita.id.in_(visita_ids))
+    if visitante_ids:
+        condiciones.append(Visita.visitante_id.in_(visitante_ids))
+    return or_(*condiciones)
+
+# --- Mantenimiento incremental ------------------------------------------------
+# Cada flush que toca visitas/visitantes/escaneos resta la contribución de las
+# filas afectadas leyendo su estado en BD antes del flush (before_flush) y suma
+# la nueva después (after_flush), dentro de la misma transacción. Aplica a
+# Session y a AsyncSession (que usa una Session sync por debajo).
+# Los UPDATE/DELETE masivos (query().update/delete) y los CASCADE de la BD no
+# pasan por aquí: quien los use debe llamar a recalcular_rollups o esperar la
+# reconciliación nocturna.
+
+@event.listens_for(Session, "before_flush")
+def _rollup_antes_de_flush(session, flush_context, instances):
+    visita_ids, visitante_ids, visitas_eliminadas = set(), set(), set()
+
+    for obj in session.dirty:
+        if isinstance(obj, Visita):
+            estado = inspect(obj)
+            if any(estado.attrs[campo].history.has_changes() for campo in _CAMPOS_VISITA):
+                visita_ids.add(obj.id)
+        elif isinstance(obj, Visitante):
+            if inspect(obj).attrs.tipo_vehiculo.history.has_changes():
+                visitante_ids.add(obj.id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Visita):
+            visitas_eliminadas.add(obj.id)
+
+    if not (visita_ids or visitante_ids or visitas_eliminadas):
+        return
+
+    conn = session.connection()
+    condicion = _visitas_afectadas(visita_ids | visitas_eliminadas, visitante_ids)
+    _sumar_visitas_dia(conn, -1, condicion)
+    _sumar_residentes(conn, -1, condicion)
+    if visitas_eliminadas:
+        # Los escaneos se borran por ON DELETE CASCADE
+        _sumar_escaneos_hora(conn, -1, EscaneoQR.visita_id.in_(visitas_eliminadas))
+
+    # Las visitas modificadas se vuelven a sumar con su estado nuevo en after_flush
+    session.info["_rollup_pendiente"] = (visita_ids, visitante_ids)
+
+@event.listens_for(Session, "after_flush")
+def _rollup_despues_de_flush(session, flush_context):
+    visita_ids, visitante_ids = session.info.pop("_rollup_pendiente", (set(), set()))
+    visita_ids = set(visita_ids)
+    escaneo_ids = set()
+
+    for obj in session.new:
+        if isinstance(obj, Visita):
+            visita_ids.add(obj.id)
+        elif isinstance(obj, EscaneoQR):
+            escaneo_ids.add(obj.id)
+
+    if not (visita_ids or visitante_ids or escaneo_ids):
+        return
+
+    conn = session.connection()
+    if visita_ids or visitante_ids:
+        condicion = _visitas_afectadas(visita_ids, visitante_ids)
+        _sumar_visitas_dia(conn, 1, condicion)
+        _sumar_residentes(conn, 1, condicion)
+    if escaneo_ids:
+        _sumar_escaneos_hora(conn, 1, EscaneoQR.id.in_(escaneo_ids))
+
+@event.listens_for(Session, "after_rollback")
+def _rollup_descartar(session):
+    session.info.pop("_rollup_pendiente", None)
+
+def sumar_visitas_insertadas(db: Session, visita_ids: list[int]):
+    """
+    Suma a los rollups visitas creadas con INSERT masivo (no pasan por el flush).
+    Debe llamarse en la misma transacción del INSERT.
+    """
+    if not visita_ids:
+        return
+    conn = db.connection()
+    condicion = Visita.id.in_(visita_ids)
+    _sumar_visitas_dia(conn, 1, condicion)
+    _sumar_residentes(conn, 1, condicion)
+
+def cambiar_estado_visitas(db: Session, visita_ids: list[int], estado: str):
+    """
+    UPDATE masivo del estado de visitas manteniendo los rollups: resta la contribución
+    de las filas, las actualiza y la vuelve a sumar, en la transacción del llamador.
+    """
+    if not visita_ids:
+        return
+    conn = db.connection()
+    condicion = Visita.id.in_(visita_ids)
+    _sumar_visitas_dia(conn, -1, condicion)
+    db.query(Visita).filter(condicion).update({Visita.estado: estado}, synchronize_session=False)
+    _sumar_visitas_dia(conn, 1, condicion)
+
+# --- Backfill / reconciliación ------------------------------------------------
+
+def recalcular_rollups(db: Session, residencial_id: int = None, desde: date = None):
+    """
+    Reconstruye los rollups desde las tablas crudas, completo o acotado a una
+    residencial y/o a los días a partir de `desde` (UTC). No hace commit.
+    El total por residente es histórico y siempre se recalcula completo.
+    """
+    filtro_visitas = []
+    filtro_escaneos = []
+    borrar_dia = db.query(EstadisticaVisitaDia)
+    borrar_hora = db.query(EstadisticaEscaneoHora)
+    borrar_residentes = db.query(EstadisticaVisitasResidente)
+
+    if residencial_id is not None:
+        filtro_visitas.append(Visita.residencial_id == residencial_id)
+        filtro_escaneos.append(EscaneoQR.residencial_id == residencial_id)
+        borrar_dia = borrar_dia.filter(EstadisticaVisitaDia.residencial_id == residencial_id)
+        borrar_hora = borrar_hora.filter(EstadisticaEscaneoHora.residencial_id == residencial_id)
+        borrar_residentes = borrar_residentes.filter(EstadisticaVisitasResidente.residencial_id == residencial_id)
+    if desde is not None:
+        filtro_visitas.append(cast(func.timezone('UTC', Visita.fecha_entrada), Date) >= desde)
+        filtro_escaneos.append(cast(func.timezone('UTC', EscaneoQR.fecha_escaneo), Date) >= desde)
+        borrar_dia = borrar_dia.filter(EstadisticaVisitaDia.fecha >= desde)
+        borrar_hora = borrar_hora.filter(cast(func.timezone('UTC', EstadisticaEscaneoHora.hora), Date) >= desde)
+
+    borrar_dia.delete(synchronize_session=False)
+    borrar_hora.delete(synchronize_session=False)
+    borrar_residentes.delete(synchronize_session=False)
+
+    conn = db.connection()
+    _sumar_visitas_dia(conn, 1, and_(*filtro_visitas) if filtro_visitas else None)
+    _sumar_escaneos_hora(conn, 1, and_(*filtro_escaneos) if filtro_escaneos else None)
+    _sumar_residentes(conn, 1, Residente.residencial_id == residencial_id if residencial_id is not None else None)
+
+def ejecutar_reconciliacion_rollups(desde: date = None) -> bool:
+    """
+    Tarea programada: reconstruye los rollups para corregir la deriva de
+    operaciones masivas. Un solo worker por cluster (advisory lock).
+    """
+    db: Session = SessionLocal()
+    inicio = time.perf_counter()
+    try:
+        lider = db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:clave)"),
+            {"clave": LOCK_ROLLUP_ESTADISTICAS}
+        ).scalar()
+        if not lider:
+            db.rollback()
+            return False
+
+        recalcular_rollups(db, desde=desde)
+        db.commit()
+        invalidar_estadisticas()
+        logger.info(f"Rollups de estadísticas recalculados en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error al recalcular rollups de estadísticas: {str(e)}")
+        return False
+    finally:
+        db.close()
@@ -8,7 +8,7 @@ from fastapi import HTTPException
 from fastapi import UploadFile
 from sqlalchemy.orm import joinedload
 import uuid
-from app.services.notificacion_service import enviar_notificacion_nueva_publicacion
+from app.services.outbox_service import encolar_notificacion
 from app.utils.cloudinary_utils import upload_file_to_cloudinary, delete_from_cloudinary_by_url
 
 async def save_uploaded_images(imagenes: List[UploadFile]) -> List[str]:
@@ -320,19 +320,20 @@ async def crear_publicacion_service(db: Session, social_data: SocialCreate, imag
             residentes_especificos = [dest.residente_id for dest in social_data.destinatarios] if social_data.destinatarios else []
         
         try:
-            enviar_notificacion_nueva_publicacion(
-                db=db,
-                titulo_publicacion=social_data.titulo,
-                contenido=social_data.contenido,
-                creador=current_user.nombre,
-                notificar_a=notificar_a,
-                residencial_id=current_user.residencial_id,
-                residentes_especificos=residentes_especificos,
-                publicacion_id=social.id
-            )
-                
+            # create_social ya confirmó la publicación: el aviso se encola en su propia transacción
+            encolar_notificacion(db, "nueva_publicacion", {
+                "titulo_publicacion": social_data.titulo,
+                "contenido": social_data.contenido,
+                "creador": current_user.nombre,
+                "notificar_a": notificar_a,
+                "residencial_id": current_user.residencial_id,
+                "residentes_especificos": residentes_especificos,
+                "publicacion_id": social.id
+            }, f"nueva_publicacion:{social.id}")
+            db.commit()
         except Exception as e:
-            print(f"Error enviando alerta de nueva publicación: {e}")
+            db.rollback()
+            print(f"Error encolando alerta de nueva publicación: {e}")
         return social
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,16 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, UploadFile
 from typing import Optional, List
-from app.models import Ticket, Usuario, Residente, EstadoTicket
+from app.models import Ticket, Residente, EstadoTicket
 from app.schemas import TicketUpdate
+from app.schemas.auth_schema import Principal
 from datetime import datetime
 from app.utils.time import get_current_time
-from app.services.notificacion_service import notificar_admin_ticket_creado_email, notificar_residente_ticket_actualizado_email
+from app.services.outbox_service import encolar_notificacion
 from app.utils.cloudinary_utils import upload_file_to_cloudinary, delete_from_cloudinary_by_url
 import uuid
 
-def crear_ticket_service(titulo: str, descripcion: str, imagen: Optional[UploadFile], db: Session, usuario_actual: Usuario) -> Ticket:
+def crear_ticket_service(titulo: str, descripcion: str, imagen: Optional[UploadFile], db: Session, usuario_actual: Principal) -> Ticket:
     # Obtener el residente asociado al usuario autenticado
     residente = db.query(Residente).filter(Residente.usuario_id == usuario_actual.id).first()
     if not residente:
@@ -36,11 +37,16 @@ def crear_ticket_service(titulo: str, descripcion: str, imagen: Optional[UploadF
         fecha_creacion=get_current_time()
     )
     db.add(ticket)
+    db.flush()
+
+    # Notificar a los administradores (outbox, en la misma transacción del ticket)
+    encolar_notificacion(
+        db, "ticket_creado",
+        {"ticket_id": ticket.id, "residente_nombre": residente.usuario.nombre},
+        f"ticket_creado:{ticket.id}"
+    )
     db.commit()
     db.refresh(ticket)
-
-    # Notificar a los administradores por correo
-    notificar_admin_ticket_creado_email(db, ticket, residente.usuario.nombre)
     return ticket
 
 def listar_tickets_service(estado: Optional[EstadoTicket], skip: int, limit: int, db: Session, residencial_id: int = None) -> List[dict]:
@@ -72,7 +78,7 @@ def listar_tickets_service(estado: Optional[EstadoTicket], skip: int, limit: int
         })
     return {"total": total, "data": tickets}
 
-def listar_tickets_residente_service(db: Session, usuario_actual: Usuario, page: int = 1, limit: int = 15):
+def listar_tickets_residente_service(db: Session, usuario_actual: Principal, page: int = 1, limit: int = 15):
     residente = db.query(Residente).filter(Residente.usuario_id == usuario_actual.id).first()
     if not residente:
         raise HTTPException(status_code=404, detail="Residente no encontrado para este usuario")
@@ -83,7 +89,7 @@ def listar_tickets_residente_service(db: Session, usuario_actual: Usuario, page:
     
     return {"total": total, "data": results}
 
-def obtener_ticket_service(ticket_id: int, db: Session, usuario_actual: Usuario) -> dict:
+def obtener_ticket_service(ticket_id: int, db: Session, usuario_actual: Principal) -> dict:
     ticket = db.query(Ticket).filter(Ticket.id == ticket_id).first()
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
@@ -128,15 +134,15 @@ def actualizar_ticket_service(ticket_id: int, datos: TicketUpdate, db: Session)
     if datos.imagen_url is not None:
         ticket.imagen_url = datos.imagen_url
 
+    # Notificar al residente si hay respuesta o cambio de estado (outbox, misma transacción)
+    if datos.estado is not None or datos.respuesta_admin is not None:
+        encolar_notificacion(db, "ticket_actualizado", {"ticket_id": ticket.id})
+
     db.commit()
     db.refresh(ticket)
 
-    # Notificar al residente por correo si hay respuesta o cambio de estado
-    if datos.estado is not None or datos.respuesta_admin is not None:
-        notificar_residente_ticket_actualizado_email(db, ticket)
-
     return ticket
-def eliminar_ticket_service(ticket_id: int, db: Session, usuario_actual: Usuario) -> dict:
+def eliminar_ticket_service(ticket_id: int, db: Session, usuario_actual: Principal) -> dict:
     """
     Elimina un ticket. 
     - Super admin: puede eliminar cualquier ticket
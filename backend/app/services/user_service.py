@@ -4,7 +4,7 @@ from app.models.residente import Residente
 from app.models.guardia import Guardia
 from app.models.admin import Administrador
 from app.schemas.usuario_schema import UsuarioCreate
-from app.utils.security import get_password_hash
+from app.utils.security import get_password_hash, invalidar_usuario
 from app.utils.validators import validar_email_unico, validar_email_creacion_actualizacion, validar_formato_telefono_internacional, validar_telefono_no_vacio, normalizar_telefono_internacional
 from app.services.notificacion_service import enviar_notificacion_usuario_creado
 from app.utils.async_notifications import enviar_notificacion_usuario_creado_async
@@ -15,6 +15,8 @@ from datetime import datetime, timezone
 import traceback
 from app.models.visita import Visita
 from app.utils.time import get_honduras_time
+from app.services.rollup_service import recalcular_rollups
+from app.services.estadisticas_cache import invalidar_estadisticas
 
 
 def crear_usuario(db: Session, usuario: UsuarioCreate, usuario_actual=None) -> Usuario:
@@ -338,6 +340,8 @@ def actualizar_usuario(db: Session, user_id: int, usuario, usuario_actual=None)
         db_usuario.fecha_actualizacion = get_honduras_time()
         db.commit()
         db.refresh(db_usuario)
+        # Rol, residencial o estado pudieron cambiar: la cache de autenticación deja de ser válida
+        invalidar_usuario(user_id)
         
         # Si se cambió la contraseña, invalidar todos los tokens del usuario por seguridad
         if password_changed:
@@ -402,8 +406,15 @@ def eliminar_usuario(db: Session, user_id: int, usuario_actual=None) -> bool:
                 db.query(Guardia).filter(Guardia.usuario_id == user_id).delete(synchronize_session=False)
         elif db_usuario.rol == "admin":
             db.query(Administrador).filter(Administrador.usuario_id == user_id).delete(synchronize_session=False)
+        # Las visitas se borraron en bloque (o por CASCADE), sin pasar por el mantenimiento incremental
+        residencial_estadisticas = db_usuario.residencial_id if db_usuario.rol in ("residente", "admin") else None
+        if residencial_estadisticas:
+            recalcular_rollups(db, residencial_id=residencial_estadisticas)
         db.delete(db_usuario)
         db.commit()
+        invalidar_usuario(user_id)
+        if residencial_estadisticas:
+            invalidar_estadisticas(residencial_estadisticas)
         return True
     except HTTPException as e:
         db.rollback()
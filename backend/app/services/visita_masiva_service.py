@@ -0,0 +1,184 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, func, case, text
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from datetime import timedelta
+from app.models.visita import Visita
+from app.models.visitante import Visitante
+from app.models.admin import Administrador
+from app.models.residencial import Residencial
+from app.schemas.visita_schema import VisitaMasivaCreate, LoteVisitasResponse, EstadoLoteResponse, MAX_VISITAS_MASIVAS
+from app.schemas.visitante_schema import VisitanteCreate
+from app.services.visita_service import validar_visitantes_entidad, normalizar_fecha_entrada
+from app.services.outbox_service import encolar_notificacion
+from app.services.qr_emision_service import programar_emision_qr_lote
+from app.services.rollup_service import sumar_visitas_insertadas
+from app.services.estadisticas_cache import invalidar_estadisticas
+from app.utils.qr import generar_payloads_qr
+import csv
+import io
+import logging
+import time
+import traceback
+import uuid
+
+logger = logging.getLogger(__name__)
+
+def leer_csv_visitantes(contenido: bytes, motivo: str = None) -> list[VisitanteCreate]:
+    """
+    Convierte un CSV (con encabezados = campos de VisitanteCreate) en visitantes.
+    Si falta la columna motivo_visita se usa el motivo del lote.
+    """
+    try:
+        texto = contenido.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo CSV debe estar codificado en UTF-8")
+
+    lector = csv.DictReader(io.StringIO(texto))
+    if not lector.fieldnames:
+        raise HTTPException(status_code=400, detail="El archivo CSV está vacío")
+    lector.fieldnames = [campo.strip().lower() for campo in lector.fieldnames]
+
+    campos = VisitanteCreate.model_fields.keys()
+    visitantes = []
+    # La fila 1 es el encabezado
+    for numero, fila in enumerate(lector, start=2):
+        if len(visitantes) >= MAX_VISITAS_MASIVAS:
+            raise HTTPException(status_code=400, detail=f"Máximo {MAX_VISITAS_MASIVAS} visitantes por carga")
+        datos = {campo: (fila.get(campo) or "").strip() for campo in campos if campo in fila}
+        if not any(datos.values()):
+            continue
+        if not datos.get("motivo_visita") and motivo:
+            datos["motivo_visita"] = motivo
+        try:
+            visitantes.append(VisitanteCreate(**datos))
+        except ValidationError as e:
+            errores = ", ".join(f"{'.'.join(str(c) for c in err['loc'])}: {err['msg']}" for err in e.errors())
+            raise HTTPException(status_code=400, detail=f"Fila {numero}: {errores}")
+
+    if not visitantes:
+        raise HTTPException(status_code=400, detail="El archivo CSV no contiene visitantes")
+    return visitantes
+
+def crear_visitas_masivas(db: Session, datos: VisitaMasivaCreate, admin_usuario_id: int) -> LoteVisitasResponse:
+    """
+    Crea un lote de visitas de admin (eventos, invitados recurrentes) en pocas sentencias:
+    un INSERT de visitantes con RETURNING, los ids de visita reservados de la secuencia,
+    los payloads firmados en una pasada y un INSERT de visitas. Las imágenes QR se
+    emiten en segundo plano; el avance se consulta con obtener_estado_lote.
+    """
+    inicio = time.perf_counter()
+    try:
+        admin = db.query(Administrador).filter(Administrador.usuario_id == admin_usuario_id).first()
+        if not admin:
+            raise HTTPException(status_code=404, detail="Administrador no encontrado")
+        if not admin.residencial_id:
+            raise HTTPException(
+                status_code=400,
+                detail="El creador de la visita debe tener una residencial asignada."
+            )
+        residencial = db.query(Residencial).filter(Residencial.id == admin.residencial_id).first()
+        if not residencial:
+            raise HTTPException(status_code=404, detail="Residencial no encontrada.")
+
+        validar_visitantes_entidad(residencial, datos.visitantes, desplazamiento=1)
+        fecha_entrada = normalizar_fecha_entrada(datos.fecha_entrada)
+        expiracion = fecha_entrada + timedelta(days=1)
+        total = len(datos.visitantes)
+        lote_id = uuid.uuid4().hex
+
+        # 1. Visitantes en un solo executemany; RETURNING en el orden de los parámetros
+        visitante_ids = db.execute(
+            insert(Visitante).returning(Visitante.id, sort_by_parameter_order=True),
+            [visitante.dict() for visitante in datos.visitantes]
+        ).scalars().all()
+
+        # 2. Ids de visita reservados antes del INSERT para que el payload firmado vaya en la misma fila
+        visita_ids = db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('visitas', 'id')) FROM generate_series(1, :total)"),
+            {"total": total}
+        ).scalars().all()
+        payloads = generar_payloads_qr(visita_ids, expiracion)
+
+        db.execute(insert(Visita), [
+            {
+                "id": visita_id,
+                "visitante_id": visitante_id,
+                "admin_id": admin.id,
+                "residente_id": None,
+                "residencial_id": admin.residencial_id,
+                "tipo_creador": "admin",
+                "notas": datos.notas,
+                "fecha_entrada": fecha_entrada,
+                "qr_expiracion": expiracion,
+                "qr_code": payload,
+                "qr_estado": "pendiente",
+                "estado": "pendiente",
+                "expiracion": "N",
+                "lote_id": lote_id
+            }
+            for visita_id, visitante_id, payload in zip(visita_ids, visitante_ids, payloads)
+        ])
+
+        # El INSERT masivo no pasa por los listeners de flush
+        sumar_visitas_insertadas(db, visita_ids)
+        # Una sola notificación a guardias por lote, con el total del lote
+        encolar_notificacion(db, "visitas_lote_guardia", {
+            "lote_id": lote_id,
+            "total": total,
+            "fecha_entrada": fecha_entrada.isoformat(),
+            "motivo": datos.notas,
+            "admin_id": admin.id,
+            "residencial_id": admin.residencial_id
+        }, f"visitas_lote_guardia:{lote_id}")
+        db.commit()
+        invalidar_estadisticas(admin.residencial_id)
+        logger.info(f"Lote {lote_id}: {total} visitas creadas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    except HTTPException as e:
+        db.rollback()
+        raise e
+    except Exception as e:
+        db.rollback()
+        print(f"Error al crear las visitas masivas: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al crear las visitas masivas: {str(e)}"
+        )
+
+    # 3. Imágenes en el pool de emisión, sin un correo por visita
+    programar_emision_qr_lote(visita_ids)
+
+    return LoteVisitasResponse(
+        lote_id=lote_id,
+        total=total,
+        visita_ids=visita_ids,
+        fecha_entrada=fecha_entrada,
+        qr_expiracion=expiracion
+    )
+
+def obtener_estado_lote(db: Session, lote_id: str, residencial_id: int) -> EstadoLoteResponse:
+    """Avance de la emisión de QR de un lote (se lee de la BD, vale para cualquier worker)."""
+    fila = db.execute(
+        select(
+            func.count(Visita.id),
+            func.count(case((Visita.qr_estado == "generado", 1))),
+            func.count(case((Visita.qr_estado == "fallido", 1)))
+        ).where(
+            Visita.lote_id == lote_id,
+            Visita.residencial_id == residencial_id
+        )
+    ).one()
+    total, generados, fallidos = fila
+    if not total:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+
+    pendientes = total - generados - fallidos
+    return EstadoLoteResponse(
+        lote_id=lote_id,
+        total=total,
+        pendientes=pendientes,
+        generados=generados,
+        fallidos=fallidos,
+        completado=pendientes == 0
+    )
@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from app.models.escaneo_qr import EscaneoQR
 from app.models.guardia import Guardia
@@ -10,22 +11,27 @@ from app.models.admin import Administrador
 from app.models.residencial import Residencial
 from app.models.notificacion import Notificacion
 from app.utils.notificaciones import enviar_correo
+from app.utils.plantillas_correo import renderizar_correo
 from app.models.visita_imagen import VisitaImagen
 from sqlalchemy import literal
-from app.services.notificacion_service import enviar_notificacion_residente, enviar_notificacion_guardia, enviar_notificacion_visita_actualizada, enviar_notificacion_solicitud_visita, enviar_notificacion_solicitud_aprobada, enviar_notificacion_escaneo
+from app.services.notificacion_service import enviar_notificacion_visita_actualizada, enviar_notificacion_solicitud_aprobada
+from app.services.outbox_service import encolar_notificacion, encolar_notificacion_async
 from app.schemas.visita_schema import VisitaCreate, VisitaQRResponse, VisitaUpdate, SolicitudVisitaCreate
 from app.schemas.visitante_schema import VisitanteCreate, VisitanteResponse
-from app.utils.qr import validar_payload_qr, generar_payload_qr, generar_qr_completo, generar_imagen_qr_personalizada
+from app.utils.qr import validar_payload_qr, verificar_firma_qr, generar_payload_qr, png_a_base64
 from app.utils.validators import validar_dni_visita_unico
 from datetime import datetime, timedelta, timezone
 import traceback
+import time
 from app.utils.time import get_honduras_time
-import base64
-import os
-from app.utils.cloudinary_utils import save_bytes_to_temp
-from app.services.cloudinary_service import upload_image
-from sqlalchemy import case, and_, literal
-from sqlalchemy.orm import aliased
+from app.services.qr_emision_service import programar_emision_qr
+from app.services.qr_render_service import servicio_render_qr, TrabajoRenderQR
+from app.services.escaneo_service import resolver_escaneo, metricas_escaneo
+from app.services.expiracion_service import visita_expirada
+from app.services.estadisticas_cache import invalidar_estadisticas
+from app.utils.paginacion import condicion_keyset, cortar_pagina, contar, contar_async
+from sqlalchemy import case, select, func
+from sqlalchemy.orm import aliased, selectinload
 
 def to_utc(dt: datetime) -> datetime:
     if dt is None:
@@ -35,6 +41,45 @@ def to_utc(dt: datetime) -> datetime:
     return dt.astimezone(timezone.utc)
 
 # Creacion de visita y visitante, generacion codigo QR con validacion de fecha y hora 
+def validar_visitantes_entidad(residencial: Residencial, visitantes: list[VisitanteCreate], desplazamiento: int = None):
+    """
+    Campos obligatorios según el tipo de entidad de la residencial.
+    Con `desplazamiento` el error indica el número de fila (carga masiva).
+    """
+    tipo_entidad = getattr(residencial, "tipo_entidad", "residencial")
+
+    for i, visitante_data in enumerate(visitantes):
+        fila = f"Fila {i + desplazamiento}: " if desplazamiento is not None else ""
+        # Validación para Predio e Industrial: Placa/Chasis obligatoria
+        if tipo_entidad in ["predio", "industrial"]:
+            if not visitante_data.placa_chasis:
+                 raise HTTPException(
+                     status_code=400, 
+                     detail=f"{fila}Para el tipo de entidad '{tipo_entidad}', el número de placa o chasis es obligatorio."
+                 )
+        
+        # Validación para Instituto, Empresa, Industrial: Destino de Visita obligatorio
+        if tipo_entidad in ["instituto", "empresa", "industrial"]:
+            if not visitante_data.destino_visita:
+                 raise HTTPException(
+                     status_code=400, 
+                     detail=f"{fila}Para el tipo de entidad '{tipo_entidad}', el destino de visita es obligatorio."
+                 )
+
+def normalizar_fecha_entrada(fecha_entrada: datetime = None) -> datetime:
+    """Lleva la fecha a la zona horaria de Honduras (ahora si no viene) y rechaza fechas pasadas."""
+    fecha_entrada = fecha_entrada or get_honduras_time()
+    if fecha_entrada.tzinfo is None:
+        fecha_entrada = get_honduras_time().tzinfo.localize(fecha_entrada)
+    else:
+        fecha_entrada = fecha_entrada.astimezone(get_honduras_time().tzinfo)
+    if fecha_entrada < get_honduras_time():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No se puede crear una visita con fecha/hora pasada"
+        )
+    return fecha_entrada
+
 def crear_visita_con_qr(db: Session, visita_data: VisitaCreate, admin_id: int = None, residente_id: int = None, tipo_creador: str = None, guardia_id: int = None) -> list[VisitaQRResponse]:
     try:
         # Validación de tipo_creador y asignación de ids
@@ -77,24 +122,7 @@ def crear_visita_con_qr(db: Session, visita_data: VisitaCreate, admin_id: int =
         if not residencial_obj:
              raise HTTPException(status_code=404, detail="Residencial no encontrada.")
         
-        tipo_entidad = getattr(residencial_obj, "tipo_entidad", "residencial")
-        
-        for visitante_data in visita_data.visitantes:
-            # Validación para Predio e Industrial: Placa/Chasis obligatoria
-            if tipo_entidad in ["predio", "industrial"]:
-                if not visitante_data.placa_chasis:
-                     raise HTTPException(
-                         status_code=400, 
-                         detail=f"Para el tipo de entidad '{tipo_entidad}', el número de placa o chasis es obligatorio."
-                     )
-            
-            # Validación para Instituto, Empresa, Industrial: Destino de Visita obligatorio
-            if tipo_entidad in ["instituto", "empresa", "industrial"]:
-                if not visitante_data.destino_visita:
-                     raise HTTPException(
-                         status_code=400, 
-                         detail=f"Para el tipo de entidad '{tipo_entidad}', el destino de visita es obligatorio."
-                     )
+        validar_visitantes_entidad(residencial_obj, visita_data.visitantes)
 
         acompanantes = getattr(visita_data, "acompanantes", None)
         if acompanantes is not None:
@@ -120,123 +148,75 @@ def crear_visita_con_qr(db: Session, visita_data: VisitaCreate, admin_id: int =
                     )
                     
         # 2. Asegurar que esté en zona horaria de Honduras
-        fecha_entrada = visita_data.fecha_entrada or get_honduras_time()
-        if fecha_entrada.tzinfo is None:
-            fecha_entrada = get_honduras_time().tzinfo.localize(fecha_entrada)
-        else:
-            fecha_entrada = fecha_entrada.astimezone(get_honduras_time().tzinfo)
-        if fecha_entrada < get_honduras_time():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No se puede crear una visita con fecha/hora pasada"
-            )
+        fecha_entrada = normalizar_fecha_entrada(visita_data.fecha_entrada)
         
         visitas = []
-        visitas_respuestas = []
+        visitantes = []
+        expiracion = fecha_entrada + timedelta(days=1)
         
+        # 1. Confirmar filas de visita y payloads firmados; la imagen se emite después
         for visitante_data in visita_data.visitantes:
             visitante_dict = visitante_data.dict()
             visitante = Visitante(**visitante_dict)
             db.add(visitante)
             db.flush()
 
-            expiracion = fecha_entrada + timedelta(days=1)
-
             visita = Visita(
                 admin_id=admin.id if admin else None,
                 residente_id=residente.id if residente else None,
+                residencial_id=creador_residencial_id,
                 visitante_id=visitante.id,
                 notas=visita_data.notas,
                 fecha_entrada=fecha_entrada,
                 qr_expiracion=expiracion,
                 qr_code="TEMPORAL",
+                qr_estado="pendiente",
                 tipo_creador=tipo_creador,
                 estado="pendiente"
             )
             db.add(visita)
             db.flush()
             
-            # Actualizar el QR con el id real de la visita (opcional, pero aquí lo dejamos igual para todos)
-            qr_code, qr_img_b64 = generar_qr_completo(visita.id, minutos_validez=1440)
-            visita.qr_code = qr_code
-            
-            # Generar QR personalizado con información del residente y visitante
-            # Obtener nombre de la residencial
-            residencial_nombre = None
-            if admin:
-                residencial = db.query(Residencial).filter(Residencial.id == admin.residencial_id).first()
-                residencial_nombre = residencial.nombre if residencial else "Residencial"
-            elif residente:
-                residencial = db.query(Residencial).filter(Residencial.id == residente.residencial_id).first()
-                residencial_nombre = residencial.nombre if residencial else "Residencial"
-            else:
-                residencial_nombre = "Residencial"
-
-            qr_img_personalizado = generar_imagen_qr_personalizada(
-                qr_data=qr_code,
-                nombre_residente=residente.usuario.nombre if residente else admin.usuario.nombre,
-                nombre_visitante=visitante.nombre_conductor,
-                nombre_residencial=residencial_nombre,
-                unidad_residencial=residente.unidad_residencial if residente else "-",
-                fecha_creacion=datetime.now(timezone.utc),
-                fecha_expiracion=expiracion
-            )
-
-            # Guardar QR en Cloudinary
-            qr_bytes = base64.b64decode(qr_img_personalizado)
-            
-            # Guardar bytes en archivo temporal
-            temp_path = save_bytes_to_temp(qr_bytes, extension=".png")
-            
-            try:
-                # Subir a Cloudinary
-                public_id = f"qr_{visita.id}_{visitante.id}"
-                result = upload_image(temp_path, folder="qr", public_id=public_id)
-                qr_url = result["secure_url"]
-            finally:
-                # Limpiar archivo temporal
-                if os.path.exists(temp_path):
-                    try:
-                        os.remove(temp_path)
-                    except Exception as e:
-                        print(f"Error eliminando archivo temporal {temp_path}: {e}")
-
-            visitas_respuestas.append(
-                VisitaQRResponse(
-                    id=visita.id,
-                    residente_id=visita.residente_id,
-                    admin_id=visita.admin_id,
-                    visitante=visitante,
-                    estado=visita.estado,
-                    qr_expiracion=expiracion,
-                    qr_code=visita.qr_code,
-                    qr_code_img_base64=qr_img_personalizado,
-                    fecha_entrada=visita.fecha_entrada,
-                    notas=visita.notas,
-                    tipo_creador=tipo_creador,
-                    fecha_salida=visita.fecha_salida,
-                    guardia_id=visita.guardia_id,
-                    qr_url=qr_url
-                )
-            )
+            # Actualizar el QR con el id real de la visita
+            visita.qr_code = generar_payload_qr(visita.id, expiracion)
             visitas.append(visita)
+            visitantes.append(visitante)
+
+        # Una sola notificación a guardias y una al creador por creación, en la misma
+        # transacción: el correo con QR no depende de que la emisión en memoria termine
+        encolar_notificacion(db, "visita_guardia", {"visita_id": visitas[0].id}, f"visita_guardia:{visitas[0].id}")
+        encolar_notificacion(
+            db, "visita_creador",
+            {"visita_id": visitas[0].id, "acompanantes": acompanantes},
+            f"visita_creador:{visitas[0].id}"
+        )
         
-        # Solo enviar la notificación una vez, después del ciclo
-        try:
-            enviar_notificacion_residente(
-                db, 
-                visitas[0], 
-                visitas_respuestas[0].qr_code_img_base64,
-                acompanantes=acompanantes  # pásalos aquí
+        db.commit()
+        invalidar_estadisticas(creador_residencial_id)
+
+        visitas_respuestas = [
+            VisitaQRResponse(
+                id=visita.id,
+                residente_id=visita.residente_id,
+                admin_id=visita.admin_id,
+                visitante=visitante,
+                estado=visita.estado,
+                qr_expiracion=expiracion,
+                qr_code=visita.qr_code,
+                fecha_entrada=visita.fecha_entrada,
+                notas=visita.notas,
+                tipo_creador=tipo_creador,
+                fecha_salida=visita.fecha_salida,
+                guardia_id=visita.guardia_id,
+                qr_url=None,
+                qr_estado=visita.qr_estado
             )
-            # Llamar también a la notificación para guardias
-            enviar_notificacion_guardia(db, visitas[0])
-        except Exception as e:
-            print(f"Error al enviar notificación: {str(e)}")
+            for visita, visitante in zip(visitas, visitantes)
+        ]
+
+        # 2. Render + subida en el pool de emisión (reprogramar_emisiones_qr la retoma si se pierde)
+        programar_emision_qr([visita.id for visita in visitas])
         
-        for visita in visitas:
-            db.refresh(visita)
-        db.commit()
         return visitas_respuestas
     except HTTPException as e:
         db.rollback()
@@ -260,89 +240,70 @@ def _guardar_imagenes_visita(db: Session, visita_id: int, urls: list[str], tipo:
         imagen = VisitaImagen(visita_id=visita_id, url=url, tipo=tipo)
         db.add(imagen)
 
-def validar_qr_entrada(db: Session, qr_code: str, guardia_id: int, accion: str = None, observacion: str = None, imagenes: list[str] = [], commit: bool = True) -> dict:
+async def validar_qr_entrada(db: AsyncSession, qr_code: str, usuario_id: int, accion: str = None, observacion: str = None, imagenes: list[str] = [], dispositivo: str = None, commit: bool = True) -> dict:
+    """
+    Valida un QR de entrada y registra el escaneo en una sola transacción.
+    La visita, su visitante, la residencial del creador y el guardia (por usuario_id)
+    se resuelven en una consulta con FOR UPDATE sobre la visita.
+    """
+    inicio = time.perf_counter()
     try:
-        # Buscar la visita con el QR proporcionado
-        visitas = db.query(Visita).filter(Visita.qr_code == qr_code).all()
-        if not visitas:
+        # Verificación criptográfica antes de cualquier SQL: QR falsos o vencidos no tocan la BD
+        visita_id_qr, expiracion_qr, error_qr = verificar_firma_qr(qr_code)
+        if error_qr:
+            metricas_escaneo.registrar_rechazo("entrada")
             return {"valido": False, "error": "Código QR no identificado, no puede pasar!"}
+        if expiracion_qr and get_honduras_time() > expiracion_qr:
+            metricas_escaneo.registrar_rechazo("entrada")
+            return {"valido": False, "error": "El QR ha expirado"}
 
-        # Busca todas las visitas con ese QR que estén en estado válido para escanear
-        visita = next((v for v in visitas if v.estado == "pendiente"), None)
-        if not visita:
+        filas = await resolver_escaneo(db, qr_code, usuario_id, visita_id=visita_id_qr)
+        if not filas:
+            return await _cerrar_escaneo_invalido(db, commit, "Código QR no identificado, no puede pasar!")
+
+        # Busca la visita con ese QR que esté en estado válido para escanear
+        fila = next((f for f in filas if f[0].estado == "pendiente"), None)
+        if not fila:
             # Verificar si hay visitas ya procesadas para dar un mensaje más específico
-            visita_aprobada = next((v for v in visitas if v.estado == "aprobado"), None)
-            if visita_aprobada:
-                return {"valido": False, "error": "Este código QR ya fue escaneado y aprobado para entrada."}
-            
-            visita_rechazada = next((v for v in visitas if v.estado == "rechazado"), None)
-            if visita_rechazada:
-                return {"valido": False, "error": "Este código QR ya fue escaneado y rechazado anteriormente."}
-            
-            visita_completada = next((v for v in visitas if v.estado == "completado"), None)
-            if visita_completada:
-                return {"valido": False, "error": "Esta visita ya ha sido completada (entrada y salida registradas)."}
-            
-            visita_expirada = next((v for v in visitas if v.estado == "expirado"), None)
-            if visita_expirada:
-                return {"valido": False, "error": "Esta visita ha expirado."}
-                
-            return {"valido": False, "error": "No hay visitantes pendientes para este QR."}
+            estados = {f[0].estado for f in filas}
+            if "aprobado" in estados:
+                return await _cerrar_escaneo_invalido(db, commit, "Este código QR ya fue escaneado y aprobado para entrada.")
+            if "rechazado" in estados:
+                return await _cerrar_escaneo_invalido(db, commit, "Este código QR ya fue escaneado y rechazado anteriormente.")
+            if "completado" in estados:
+                return await _cerrar_escaneo_invalido(db, commit, "Esta visita ya ha sido completada (entrada y salida registradas).")
+            if "expirado" in estados:
+                return await _cerrar_escaneo_invalido(db, commit, "Esta visita ha expirado.")
+            return await _cerrar_escaneo_invalido(db, commit, "No hay visitantes pendientes para este QR.")
+
+        visita, visitante, guardia, guardia_nombre, visita_residencial_id = fila
 
         # Validar que el guardia y la visita pertenezcan a la misma residencial
-        guardia = db.query(Guardia).filter(Guardia.id == guardia_id).first()
         if not guardia:
-            return {"valido": False, "error": "Guardia no encontrado."}
-
-        # Obtener la residencial de la visita
-        if visita.residente_id:
-            residente = db.query(Residente).filter(Residente.id == visita.residente_id).first()
-            if not residente:
-                return {"valido": False, "error": "Residente de la visita no encontrado."}
-            visita_residencial_id = residente.residencial_id
-        elif visita.admin_id:
-            admin = db.query(Administrador).filter(Administrador.id == visita.admin_id).first()
-            if not admin:
-                return {"valido": False, "error": "Administrador de la visita no encontrado."}
-            visita_residencial_id = admin.residencial_id
-        else:
-            return {"valido": False, "error": "Visita sin creador válido."}
-
-        # Validar valores y tipos
-
-        # Validar que ambos sean int y no None
+            return await _cerrar_escaneo_invalido(db, commit, "Guardia no encontrado.")
+        if not visita.residente_id and not visita.admin_id:
+            return await _cerrar_escaneo_invalido(db, commit, "Visita sin creador válido.")
         if guardia.residencial_id is None or visita_residencial_id is None:
-            return {"valido": False, "error": f"Error interno: residencial_id no asignado (guardia: {guardia.residencial_id}, visita: {visita_residencial_id})"}
-        try:
-            guardia_residencial_id_int = int(guardia.residencial_id)
-            visita_residencial_id_int = int(visita_residencial_id)
-        except Exception as e:
-            return {"valido": False, "error": f"Error de tipo en residencial_id: {str(e)} (guardia: {guardia.residencial_id}, visita: {visita_residencial_id})"}
-
-        # Verificar que ambos pertenezcan a la misma residencial
-        if guardia_residencial_id_int != visita_residencial_id_int:
-            return {"valido": False, "error": f"No tienes autorización para validar visitas de otra residencial. (guardia: {guardia_residencial_id_int}, visita: {visita_residencial_id_int})"}
+            return await _cerrar_escaneo_invalido(db, commit, f"Error interno: residencial_id no asignado (guardia: {guardia.residencial_id}, visita: {visita_residencial_id})")
+        if int(guardia.residencial_id) != int(visita_residencial_id):
+            return await _cerrar_escaneo_invalido(db, commit, f"No tienes autorización para validar visitas de otra residencial. (guardia: {guardia.residencial_id}, visita: {visita_residencial_id})")
 
         now_hn = get_honduras_time()
 
         # Validar expiración en zona Honduras
-        if visita.qr_expiracion:
-            if now_hn > visita.qr_expiracion:
-                visita.estado = "expirado"
-                if commit:
-                    db.commit()
-                else:
-                    db.flush()
-                return {"valido": False, "error": "El QR ha expirado"}
+        if visita.qr_expiracion and now_hn > visita.qr_expiracion:
+            visita.estado = "expirado"
+            visita.expiracion = "S"
+            if commit:
+                await db.commit()
+            else:
+                await db.flush()
+            invalidar_estadisticas(visita_residencial_id)
+            return {"valido": False, "error": "El QR ha expirado"}
 
         # Verificar si la visita llega antes de la hora programada
-        entrada_anticipada = False
-        mensaje_entrada_anticipada = ""
-        
-        if visita.fecha_entrada and now_hn < visita.fecha_entrada:
-            entrada_anticipada = True
-            mensaje_entrada_anticipada = "⚠️ ENTRADA ANTICIPADA: El visitante llegó antes de la hora programada"
-        
+        entrada_anticipada = bool(visita.fecha_entrada and now_hn < visita.fecha_entrada)
+
         # Aplicar acción si se especifica, o aprobar por defecto si no se especifica
         if accion == "aprobar" or accion is None:
             visita.estado = "aprobado"
@@ -350,28 +311,25 @@ def validar_qr_entrada(db: Session, qr_code: str, guardia_id: int, accion: str =
             visita.estado = "rechazado"
         else:
             raise HTTPException(status_code=400, detail="Acción inválida.")
-        
+
         # Asignar guardia a la visita
-        visita.guardia_id = guardia_id
-        
-        # Guardar observación y generar imágenes
+        visita.guardia_id = guardia.id
+
+        # Guardar observación e imágenes
         if observacion:
             visita.observacion_entrada = observacion
-        
+
         _guardar_imagenes_visita(db, visita.id, imagenes, tipo="entrada")
-        
-        # Obtener información del visitante para la respuesta
-        visitante = db.query(Visitante).filter(Visitante.id == visita.visitante_id).first()
-        
-        # Hacer flush antes del commit para asegurar que los cambios se apliquen
-        db.flush()
-        if commit:
-            db.commit()
-        
-        # Verificar que el cambio se aplicó correctamente
-        db.refresh(visita)
-        
-        return {
+
+        # Registrar el escaneo y la notificación al creador en la misma transacción
+        db.add(EscaneoQR(visita_id=visita.id, guardia_id=guardia.id, residencial_id=visita_residencial_id, tipo="entrada", dispositivo=dispositivo))
+        await encolar_notificacion_async(
+            db, "visita_escaneo",
+            {"visita_id": visita.id, "guardia_nombre": guardia_nombre or f"Guardia {guardia.id}", "es_salida": False},
+            f"visita_escaneo:{visita.id}:entrada"
+        )
+
+        resultado = {
             "valido": True,
             "visitante": {
                 "nombre_conductor": visitante.nombre_conductor,
@@ -386,31 +344,63 @@ def validar_qr_entrada(db: Session, qr_code: str, guardia_id: int, accion: str =
             "estado": visita.estado,
             "visita_id": visita.id,
             "entrada_anticipada": entrada_anticipada,
-            "mensaje_entrada_anticipada": mensaje_entrada_anticipada if entrada_anticipada else None,
+            "mensaje_entrada_anticipada": "⚠️ ENTRADA ANTICIPADA: El visitante llegó antes de la hora programada" if entrada_anticipada else None,
             "observacion_entrada": visita.observacion_entrada,
-            "imagenes": imagenes
+            "imagenes": imagenes,
+            "guardia": {
+                "id": guardia.id,
+                "nombre": guardia_nombre or f"Guardia {guardia.id}"
+            }
         }
+
+        if commit:
+            await db.commit()
+        else:
+            await db.flush()
+        invalidar_estadisticas(visita_residencial_id)
+
+        return resultado
         
     except HTTPException as e:
         if commit:
-            db.rollback()
+            await db.rollback()
         raise e
     except Exception as e:
         if commit:
-            db.rollback()
+            await db.rollback()
         print(f"Error al validar QR de entrada: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al validar QR de entrada: {str(e)}"
         )
+    finally:
+        metricas_escaneo.registrar("entrada", (time.perf_counter() - inicio) * 1000)
 
-def registrar_salida_visita(db: Session, qr_code: str, guardia_id: int, observacion: str = None, imagenes: list[str] = [], commit: bool = True) -> dict:
+async def _cerrar_escaneo_invalido(db: AsyncSession, commit: bool, error: str) -> dict:
+    # Libera el FOR UPDATE tomado por resolver_escaneo cuando el escaneo no procede
+    if commit:
+        await db.rollback()
+    return {"valido": False, "error": error}
+
+async def registrar_salida_visita(db: AsyncSession, qr_code: str, usuario_id: int, observacion: str = None, imagenes: list[str] = [], dispositivo: str = None, commit: bool = True) -> dict:
+    """
+    Registra la salida de una visita aprobada y su escaneo en una sola transacción,
+    usando la misma consulta unificada (con FOR UPDATE) que la entrada.
+    """
+    inicio = time.perf_counter()
     try:
-        # Buscar la visita con el QR proporcionado
-        visita = db.query(Visita).filter(Visita.qr_code == qr_code).first()
-        if not visita:
+        # Solo la firma se verifica sin BD: la salida tardía (QR vencido) sí se registra
+        visita_id_qr, _, error_qr = verificar_firma_qr(qr_code)
+        if error_qr:
+            metricas_escaneo.registrar_rechazo("salida")
             raise HTTPException(status_code=404, detail="Código QR no encontrado")
+
+        filas = await resolver_escaneo(db, qr_code, usuario_id, visita_id=visita_id_qr)
+        if not filas:
+            raise HTTPException(status_code=404, detail="Código QR no encontrado")
+
+        visita, visitante, guardia, guardia_nombre, visita_residencial_id = filas[0]
         
         # Validar que la visita esté en estado "aprobado"
         if visita.estado == "completado":
@@ -425,25 +415,11 @@ def registrar_salida_visita(db: Session, qr_code: str, guardia_id: int, observac
             )
         
         # Validar que el guardia y la visita pertenezcan a la misma residencial
-        guardia = db.query(Guardia).filter(Guardia.id == guardia_id).first()
         if not guardia:
             raise HTTPException(status_code=404, detail="Guardia no encontrado.")
-
-        # Obtener la residencial de la visita
-        if visita.residente_id:
-            residente = db.query(Residente).filter(Residente.id == visita.residente_id).first()
-            if not residente:
-                raise HTTPException(status_code=404, detail="Residente de la visita no encontrado.")
-            visita_residencial_id = residente.residencial_id
-        elif visita.admin_id:
-            admin = db.query(Administrador).filter(Administrador.id == visita.admin_id).first()
-            if not admin:
-                raise HTTPException(status_code=404, detail="Administrador de la visita no encontrado.")
-            visita_residencial_id = admin.residencial_id
-        else:
+        if not visita.residente_id and not visita.admin_id:
             raise HTTPException(status_code=400, detail="Visita sin creador válido.")
 
-        # Verificar que ambos pertenezcan a la misma residencial
         if guardia.residencial_id != visita_residencial_id:
             raise HTTPException(
                 status_code=403, 
@@ -455,9 +431,7 @@ def registrar_salida_visita(db: Session, qr_code: str, guardia_id: int, observac
         now_hn = get_honduras_time()
         
         # Verificar si la salida es tardía (después de la expiración del QR)
-        salida_tardia = False
-        if visita.qr_expiracion and now_hn > visita.qr_expiracion:
-            salida_tardia = True
+        salida_tardia = bool(visita.qr_expiracion and now_hn > visita.qr_expiracion)
         
         visita.fecha_salida = now_utc
         visita.estado = "completado"
@@ -466,24 +440,20 @@ def registrar_salida_visita(db: Session, qr_code: str, guardia_id: int, observac
             visita.observacion_salida = observacion
             
         _guardar_imagenes_visita(db, visita.id, imagenes, tipo="salida")
-        
-        # Obtener información del visitante para la respuesta
-        visitante = db.query(Visitante).filter(Visitante.id == visita.visitante_id).first()
-        
-        # Obtener información del guardia para las notificaciones (si se re-habilita)
-        guardia_usuario = db.query(Usuario).filter(Usuario.id == guardia.usuario_id).first()
-        # guardia_nombre = guardia_usuario.nombre if guardia_usuario else "Guardia"
-        
-        if commit:
-            db.commit()
-        else:
-            db.flush()
+
+        # Registrar el escaneo de salida y la notificación al creador en la misma transacción
+        db.add(EscaneoQR(visita_id=visita.id, guardia_id=guardia.id, residencial_id=visita_residencial_id, tipo="salida", dispositivo=dispositivo))
+        await encolar_notificacion_async(
+            db, "visita_escaneo",
+            {"visita_id": visita.id, "guardia_nombre": guardia_nombre or f"Guardia {guardia.id}", "es_salida": True},
+            f"visita_escaneo:{visita.id}:salida"
+        )
         
         mensaje_respuesta = "Salida registrada exitosamente"
         if salida_tardia:
             mensaje_respuesta += " (SALIDA TARDÍA - QR expirado)"
         
-        return {
+        resultado = {
             "mensaje": mensaje_respuesta,
             "fecha_salida": now_utc,
             "estado": visita.estado,
@@ -498,25 +468,100 @@ def registrar_salida_visita(db: Session, qr_code: str, guardia_id: int, observac
             },
             "visita_id": visita.id,
             "observacion_salida": visita.observacion_salida,
-            "imagenes": imagenes
+            "imagenes": imagenes,
+            "guardia": {
+                "id": guardia.id,
+                "nombre": guardia_nombre or f"Guardia {guardia.id}"
+            }
         }
+
+        if commit:
+            await db.commit()
+        else:
+            await db.flush()
+        invalidar_estadisticas(visita_residencial_id)
+        
+        return resultado
         
     except HTTPException as e:
         if commit:
-            db.rollback()
+            await db.rollback()
         raise e
     except Exception as e:
         if commit:
-            db.rollback()
+            await db.rollback()
         print(f"Error al registrar salida: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error interno del servidor al registrar la salida: {str(e)}"
         )
+    finally:
+        metricas_escaneo.registrar("salida", (time.perf_counter() - inicio) * 1000)
+
+
+def _consulta_escaneos(db: Session, residencial_id: int = None, nombre_guardia: str = None):
+    """
+    Escaneos con su visita, visitante, guardia y creador (residente o admin) en una
+    sola consulta acotada por escaneos_qr.residencial_id; sin UNION de dos ramas.
+    Cada fila: (EscaneoQR, Visita, Visitante, Guardia, creador_nombre, unidad_residencial, guardia_nombre)
+    """
+    UsuarioGuardia = aliased(Usuario)
+    UsuarioCreador = aliased(Usuario)
+    query = db.query(
+        EscaneoQR,
+        Visita,
+        Visitante,
+        Guardia,
+        UsuarioCreador.nombre.label('creador_nombre'),
+        case(
+            (Visita.residente_id.isnot(None), Residente.unidad_residencial),
+            else_=literal("Admin")
+        ).label('unidad_residencial'),
+        UsuarioGuardia.nombre.label('guardia_nombre')
+    ).join(
+        Visita, EscaneoQR.visita_id == Visita.id
+    ).join(
+        Visitante, Visita.visitante_id == Visitante.id
+    ).join(
+        Guardia, EscaneoQR.guardia_id == Guardia.id
+    ).join(
+        UsuarioGuardia, Guardia.usuario_id == UsuarioGuardia.id
+    ).outerjoin(
+        Residente, Visita.residente_id == Residente.id
+    ).outerjoin(
+        Administrador, Visita.admin_id == Administrador.id
+    ).join(
+        UsuarioCreador, UsuarioCreador.id == func.coalesce(Residente.usuario_id, Administrador.usuario_id)
+    )
+
+    if residencial_id:
+        query = query.filter(EscaneoQR.residencial_id == residencial_id)
+    if nombre_guardia:
+        query = query.filter(UsuarioGuardia.nombre.ilike(f"%{nombre_guardia}%"))
+    return query
+
+def _paginar_escaneos(db: Session, query, page: int, limit: int, paginacion: str, cursor: str, conteo: str, clave_conteo) -> tuple:
+    """
+    Pagina los escaneos en orden (fecha_escaneo DESC, id DESC). En modo cursor el
+    keyset recorre ix_escaneos_qr_residencial_fecha_escaneo_id desde el cursor en
+    vez de saltar OFFSET filas. Devuelve (filas, total, total_estimado, next_cursor).
+    """
+    total, total_estimado = contar(db, query, conteo, clave_conteo)
+    query = query.order_by(EscaneoQR.fecha_escaneo.desc(), EscaneoQR.id.desc())
+
+    if paginacion == "cursor":
+        if cursor:
+            query = query.filter(condicion_keyset(EscaneoQR.fecha_escaneo, EscaneoQR.id, cursor))
+        filas, next_cursor = cortar_pagina(
+            query.limit(limit + 1).all(), limit, lambda fila: (fila[0].fecha_escaneo, fila[0].id)
+        )
+        return filas, total, total_estimado, next_cursor
 
+    filas = query.offset((page - 1) * limit).limit(limit).all()
+    return filas, total, total_estimado, None
 
-def obtener_historial_escaneos_dia(db: Session, guardia_id: int = None, residencial_id: int = None, nombre_guardia: str = None, page: int = 1, limit: int = 15) -> dict:
+def obtener_historial_escaneos_dia(db: Session, guardia_id: int = None, residencial_id: int = None, nombre_guardia: str = None, page: int = 1, limit: int = 15, paginacion: str = "offset", cursor: str = None, conteo: str = "exacto") -> dict:
     try:
         # Obtener fecha actual en Honduras
         ahora_honduras = get_honduras_time()
@@ -524,74 +569,28 @@ def obtener_historial_escaneos_dia(db: Session, guardia_id: int = None, residenc
         fecha_inicio = ahora_honduras.replace(hour=0, minute=0, second=0, microsecond=0)
         fecha_fin = ahora_honduras.replace(hour=23, minute=59, second=59, microsecond=999999)
         
-        # Consultas base
-        query_residentes = db.query(
-            EscaneoQR,
-            Visita,
-            Visitante,
-            Guardia,
-            Usuario.nombre.label('creador_nombre'),
-            Residente.unidad_residencial.label('unidad_residencial')
-        ).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Visitante, Visita.visitante_id == Visitante.id
-        ).join(
-            Guardia, EscaneoQR.guardia_id == Guardia.id
-        ).join(
-            Residente, Visita.residente_id == Residente.id
-        ).join(
-            Usuario, Residente.usuario_id == Usuario.id
-        ).filter(
-            EscaneoQR.fecha_escaneo >= fecha_inicio,
-            EscaneoQR.fecha_escaneo <= fecha_fin
-        )
-        
-        query_admins = db.query(
-            EscaneoQR,
-            Visita,
-            Visitante,
-            Guardia,
-            Usuario.nombre.label('creador_nombre'),
-            literal("Admin").label('unidad_residencial')
-        ).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Visitante, Visita.visitante_id == Visitante.id
-        ).join(
-            Guardia, EscaneoQR.guardia_id == Guardia.id
-        ).join(
-            Administrador, Visita.admin_id == Administrador.id
-        ).join(
-            Usuario, Administrador.usuario_id == Usuario.id
-        ).filter(
+        query = _consulta_escaneos(db, residencial_id).filter(
             EscaneoQR.fecha_escaneo >= fecha_inicio,
             EscaneoQR.fecha_escaneo <= fecha_fin
         )
         
         # Filtros adicionales
         if guardia_id:
-            query_residentes = query_residentes.filter(EscaneoQR.guardia_id == guardia_id)
-            query_admins = query_admins.filter(EscaneoQR.guardia_id == guardia_id)
-        
-        if residencial_id:
-            query_residentes = query_residentes.filter(Residente.residencial_id == residencial_id)
-            query_admins = query_admins.filter(Administrador.residencial_id == residencial_id)
+            query = query.filter(EscaneoQR.guardia_id == guardia_id)
 
-        # Union
-        union_query = query_residentes.union_all(query_admins)
-        
-        # Conteo total antes de paginar
-        total_escaneos = union_query.count()
-        resultados = union_query.order_by(EscaneoQR.fecha_escaneo.desc()).offset((page - 1) * limit).limit(limit).all()
+        # Paginación (offset o cursor) con el conteo pedido
+        resultados, total_escaneos, total_estimado, next_cursor = _paginar_escaneos(
+            db, query, page, limit, paginacion, cursor, conteo,
+            ("escaneos_dia", guardia_id, residencial_id, fecha_inicio.date())
+        )
         
         # Procesar resultados
         escaneos = []
         for row in resultados:
-            escaneo, visita, visitante, guardia, creador_nombre, unidad_residencial = row
+            escaneo, visita, visitante, guardia, creador_nombre, unidad_residencial, guardia_nombre = row
             
             fecha_escaneo_utc = to_utc(escaneo.fecha_escaneo)
-            tipo_escaneo = "salida" if visita.fecha_salida and fecha_escaneo_utc >= to_utc(visita.fecha_salida) else "entrada"
+            tipo_escaneo = escaneo.tipo
             
             entrada_anticipada = False
             if tipo_escaneo == "entrada" and visita.fecha_entrada:
@@ -601,7 +600,7 @@ def obtener_historial_escaneos_dia(db: Session, guardia_id: int = None, residenc
                 "id_escaneo": escaneo.id,
                 "fecha_escaneo": fecha_escaneo_utc,
                 "dispositivo": escaneo.dispositivo or "No especificado",
-                "nombre_guardia": guardia.usuario.nombre if getattr(guardia, 'usuario', None) else f"Guardia {guardia.id}",
+                "nombre_guardia": guardia_nombre or f"Guardia {guardia.id}",
                 "nombre_visitante": visitante.nombre_conductor,
                 "dni_visitante": visitante.dni_conductor,
                 "tipo_vehiculo": visitante.tipo_vehiculo,
@@ -619,6 +618,8 @@ def obtener_historial_escaneos_dia(db: Session, guardia_id: int = None, residenc
         return {
             "escaneos": escaneos,
             "total_escaneos": total_escaneos,
+            "total_estimado": total_estimado,
+            "next_cursor": next_cursor,
             "fecha_consulta": now_utc
         }
         
@@ -630,146 +631,29 @@ def obtener_historial_escaneos_dia(db: Session, guardia_id: int = None, residenc
             detail=f"Error al obtener historial de escaneos: {str(e)}"
         )
         
-def obtener_historial_escaneos_totales(db: Session, residencial_id: int = None, nombre_guardia: str = None, tipo_escaneo: str = None, estado_visita: str = None, page: int = 1, limit: int = 15) -> dict:
-    try:       
-        # Consultas base
-        query_residentes = db.query(
-            EscaneoQR,
-            Visita,
-            Visitante,
-            Guardia,
-            Usuario.nombre.label('creador_nombre'),
-            Residente.unidad_residencial.label('unidad_residencial')
-        ).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Visitante, Visita.visitante_id == Visitante.id
-        ).join(
-            Guardia, EscaneoQR.guardia_id == Guardia.id
-        ).join(
-            Residente, Visita.residente_id == Residente.id
-        ).join(
-            Usuario, Residente.usuario_id == Usuario.id
-        ).filter(
-            Visita.residente_id.isnot(None)
-        )
-        
-        query_admins = db.query(
-            EscaneoQR,
-            Visita,
-            Visitante,
-            Guardia,
-            Usuario.nombre.label('creador_nombre'),
-            literal("Admin").label('unidad_residencial')
-        ).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Visitante, Visita.visitante_id == Visitante.id
-        ).join(
-            Guardia, EscaneoQR.guardia_id == Guardia.id
-        ).join(
-            Administrador, Visita.admin_id == Administrador.id
-        ).join(
-            Usuario, Administrador.usuario_id == Usuario.id
-        ).filter(
-            Visita.admin_id.isnot(None)
-        )
-        
-        # Filtros adicionales
-        if nombre_guardia:
-            query_residentes = query_residentes.filter(Usuario.nombre.ilike(f"%{nombre_guardia}%"))
-            pass
-        
-        # FIX JOINS FOR ACCURATE FILTERING
-        UsuarioGuardia = aliased(Usuario)
-        UsuarioCreador = aliased(Usuario)
-        
-        # Re-construct queries with aliases
-        query_residentes = db.query(
-            EscaneoQR,
-            Visita,
-            Visitante,
-            Guardia,
-            UsuarioCreador.nombre.label('creador_nombre'),
-            Residente.unidad_residencial.label('unidad_residencial'),
-            UsuarioGuardia.nombre.label('guardia_nombre')
-        ).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Visitante, Visita.visitante_id == Visitante.id
-        ).join(
-            Guardia, EscaneoQR.guardia_id == Guardia.id
-        ).join(
-            UsuarioGuardia, Guardia.usuario_id == UsuarioGuardia.id
-        ).join(
-            Residente, Visita.residente_id == Residente.id
-        ).join(
-            UsuarioCreador, Residente.usuario_id == UsuarioCreador.id
-        ).filter(
-            Visita.residente_id.isnot(None)
-        )
-        
-        query_admins = db.query(
-            EscaneoQR,
-            Visita,
-            Visitante,
-            Guardia,
-            UsuarioCreador.nombre.label('creador_nombre'),
-            literal("Admin").label('unidad_residencial'),
-            UsuarioGuardia.nombre.label('guardia_nombre')
-        ).join(
-            Visita, EscaneoQR.visita_id == Visita.id
-        ).join(
-            Visitante, Visita.visitante_id == Visitante.id
-        ).join(
-            Guardia, EscaneoQR.guardia_id == Guardia.id
-        ).join(
-            UsuarioGuardia, Guardia.usuario_id == UsuarioGuardia.id
-        ).join(
-            Administrador, Visita.admin_id == Administrador.id
-        ).join(
-            UsuarioCreador, Administrador.usuario_id == UsuarioCreador.id
-        ).filter(
-            Visita.admin_id.isnot(None)
-        )
-
-        if residencial_id:
-            query_residentes = query_residentes.filter(Residente.residencial_id == residencial_id)
-            query_admins = query_admins.filter(Administrador.residencial_id == residencial_id)
+def obtener_historial_escaneos_totales(db: Session, residencial_id: int = None, nombre_guardia: str = None, tipo_escaneo: str = None, estado_visita: str = None, page: int = 1, limit: int = 15, paginacion: str = "offset", cursor: str = None, conteo: str = "exacto") -> dict:
+    try:
+        query = _consulta_escaneos(db, residencial_id, nombre_guardia)
 
-        if nombre_guardia:
-            query_residentes = query_residentes.filter(UsuarioGuardia.nombre.ilike(f"%{nombre_guardia}%"))
-            query_admins = query_admins.filter(UsuarioGuardia.nombre.ilike(f"%{nombre_guardia}%"))
-            
+        # Filtros adicionales
         if estado_visita:
-            query_residentes = query_residentes.filter(Visita.estado == estado_visita)
-            query_admins = query_admins.filter(Visita.estado == estado_visita)
+            query = query.filter(Visita.estado == estado_visita)
 
-        # Union
-        union_query = query_residentes.union_all(query_admins)
-
-        cond_salida = and_(Visita.fecha_salida.isnot(None), EscaneoQR.fecha_escaneo >= Visita.fecha_salida)
-        
-        if tipo_escaneo == "salida":
-            query_residentes = query_residentes.filter(cond_salida)
-            query_admins = query_admins.filter(cond_salida)
-        elif tipo_escaneo == "entrada":
-            query_residentes = query_residentes.filter(~cond_salida)
-            query_admins = query_admins.filter(~cond_salida)
+        if tipo_escaneo in ("entrada", "salida"):
+            query = query.filter(EscaneoQR.tipo == tipo_escaneo)
 
-        # Re-apply Union
-        union_query = query_residentes.union_all(query_admins)
-        total_escaneos = union_query.count()
-
-        # Trying direct order by if Supported
-        resultados = union_query.order_by(EscaneoQR.fecha_escaneo.desc()).offset((page - 1) * limit).limit(limit).all()
+        # Paginación (offset o cursor) con el conteo pedido
+        resultados, total_escaneos, total_estimado, next_cursor = _paginar_escaneos(
+            db, query, page, limit, paginacion, cursor, conteo,
+            ("escaneos_totales", residencial_id, nombre_guardia, tipo_escaneo, estado_visita)
+        )
 
         escaneos = []
         for row in resultados:
             escaneo, visita, visitante, guardia, creador_nombre, unidad_residencial, guardia_nombre = row
             
             fecha_escaneo_utc = to_utc(escaneo.fecha_escaneo)
-            tipo_escaneo_val = "salida" if visita.fecha_salida and fecha_escaneo_utc >= to_utc(visita.fecha_salida) else "entrada"
+            tipo_escaneo_val = escaneo.tipo
             
             escaneos.append({
                 "id_escaneo": escaneo.id,
@@ -791,6 +675,8 @@ def obtener_historial_escaneos_totales(db: Session, residencial_id: int = None,
         return {
             "escaneos": escaneos,
             "total_escaneos": total_escaneos,
+            "total_estimado": total_estimado,
+            "next_cursor": next_cursor,
             "fecha_consulta": datetime.now()
         }
     except Exception as e:
@@ -803,47 +689,64 @@ def obtener_historial_escaneos_totales(db: Session, residencial_id: int = None,
         }
 
 
-def obtener_visitas_residente(db: Session, usuario_id: int, page: int = 1, limit: int = 15):
-    residente = db.query(Residente).filter(Residente.usuario_id == usuario_id).first()
-    admin = db.query(Administrador).filter(Administrador.usuario_id == usuario_id).first()
+async def obtener_visitas_residente(db: AsyncSession, usuario_id: int, page: int = 1, limit: int = 15, paginacion: str = "offset", cursor: str = None, conteo: str = "exacto"):
+    residente = (await db.execute(select(Residente).where(Residente.usuario_id == usuario_id))).scalars().first()
+    admin = (await db.execute(select(Administrador).where(Administrador.usuario_id == usuario_id))).scalars().first()
 
     if not residente and not admin:
-        return {"total": 0, "data": []}
+        return {"total": 0, "data": [], "total_estimado": False, "next_cursor": None}
 
-    query = db.query(Visita)
     if residente and admin:
-        query = query.filter(
-            (Visita.residente_id == residente.id) | (Visita.admin_id == admin.id)
-        )
+        condicion = (Visita.residente_id == residente.id) | (Visita.admin_id == admin.id)
     elif residente:
-        query = query.filter(Visita.residente_id == residente.id)
+        condicion = Visita.residente_id == residente.id
     else:  # solo admin
-        query = query.filter(Visita.admin_id == admin.id)
+        condicion = Visita.admin_id == admin.id
         
-    total = query.count()
-    visitas = query.order_by(Visita.fecha_entrada.desc()).offset((page - 1) * limit).limit(limit).all()
+    total, total_estimado = await contar_async(
+        db, select(Visita.id).where(condicion), conteo, ("mis_visitas", usuario_id)
+    )
+    # El visitante se carga en una sola consulta extra (selectin) en vez de una por visita
+    consulta = (
+        select(Visita)
+        .options(selectinload(Visita.visitante))
+        .where(condicion)
+        .order_by(Visita.fecha_entrada.desc(), Visita.id.desc())
+    )
+    next_cursor = None
+    if paginacion == "cursor":
+        # Keyset sobre (fecha_entrada, id): ix_visitas_residente_fecha_entrada_id / ix_visitas_admin_fecha_entrada_id
+        consulta = consulta.where(Visita.fecha_entrada.isnot(None))
+        if cursor:
+            consulta = consulta.where(condicion_keyset(Visita.fecha_entrada, Visita.id, cursor))
+        visitas = (await db.execute(consulta.limit(limit + 1))).scalars().all()
+        visitas, next_cursor = cortar_pagina(visitas, limit, lambda v: (v.fecha_entrada, v.id))
+    else:
+        visitas = (await db.execute(consulta.offset((page - 1) * limit).limit(limit))).scalars().all()
 
     result = []
+    ahora = get_honduras_time()
     for v in visitas:
-        visitante = db.query(Visitante).filter(Visitante.id == v.visitante_id).first()
         tipo_creador_val = v.tipo_creador if v.tipo_creador is not None else ("admin" if v.admin_id else "residente")
         result.append({
             "id": v.id,
             "residente_id": v.residente_id,
             "guardia_id": v.guardia_id,
             "admin_id": v.admin_id,
-            "visitante": visitante,
+            "visitante": v.visitante,
             "notas": v.notas,
             "fecha_entrada": v.fecha_entrada,
             "fecha_salida": v.fecha_salida,
             "estado": v.estado,
-            "expiracion": v.expiracion,
+            "expiracion": "S" if visita_expirada(v, ahora) else "N",
             "qr_code": v.qr_code,
             "qr_expiracion": v.qr_expiracion,
             "qr_code_img_base64": getattr(v, "qr_code_img_base64", ""),
+            "qr_url": v.qr_url,
+            "qr_estado": v.qr_estado,
             "tipo_creador": tipo_creador_val,
         })
-    return {"total": total, "data": result}
+    return {"total": total, "data": result, "total_estimado": total_estimado, "next_cursor": next_cursor}
 
 def editar_visita_residente(db: Session, visita_id: int, usuario_id: int, visita_update: VisitaUpdate, rol: str = "residente"):
     try:
@@ -866,12 +769,22 @@ def editar_visita_residente(db: Session, visita_id: int, usuario_id: int, visita
         else:
             raise HTTPException(status_code=403, detail="Rol no autorizado para editar visitas")
         # Solo se puede editar si está pendiente y no expirada
-        if visita.estado != "pendiente" or getattr(visita, "expiracion", "N") == "S":
+        if visita.estado != "pendiente" or visita_expirada(visita):
             raise HTTPException(status_code=400, detail="Solo puedes editar visitas en estado pendiente y no expiradas")
         # Actualizar campos permitidos
+        reemitir_qr = False
         if visita_update.fecha_entrada is not None:
-            visita.fecha_entrada = visita_update.fecha_entrada
-            visita.qr_expiracion = visita_update.fecha_entrada + timedelta(days=1)
+            fecha_entrada = visita_update.fecha_entrada
+            if fecha_entrada.tzinfo is None:
+                fecha_entrada = get_honduras_time().tzinfo.localize(fecha_entrada)
+            visita.fecha_entrada = fecha_entrada
+            visita.qr_expiracion = fecha_entrada + timedelta(days=1)
+            # La expiración va firmada en el QR: se vuelve a firmar y a emitir la imagen
+            visita.qr_code = generar_payload_qr(visita.id, visita.qr_expiracion)
+            visita.qr_url = None
+            visita.qr_estado = "pendiente"
+            visita.qr_programado_en = get_honduras_time()
+            reemitir_qr = True
         if visita_update.notas is not None:
             visita.notas = visita_update.notas
         if visita_update.visitante is not None:
@@ -881,6 +794,8 @@ def editar_visita_residente(db: Session, visita_id: int, usuario_id: int, visita
                     setattr(visitante, field, value)
         db.commit()
         db.refresh(visita)
+        if reemitir_qr:
+            programar_emision_qr([visita.id])
         return visita
     except HTTPException as e:
         db.rollback()
@@ -971,6 +886,7 @@ def crear_solicitud_visita_residente(db: Session, solicitud_data: SolicitudVisit
         visita = Visita(
             residente_id=residente.id,
             admin_id=None,  # Se asignará cuando el admin apruebe
+            residencial_id=residente.residencial_id,
             visitante_id=visitante.id,
             notas=solicitud_data.motivo_visita,
             fecha_entrada=fecha_entrada,
@@ -982,11 +898,8 @@ def crear_solicitud_visita_residente(db: Session, solicitud_data: SolicitudVisit
         db.add(visita)
         db.flush()
 
-        # Enviar notificación a todos los administradores
-        try:
-            enviar_notificacion_solicitud_visita(db, visita, residente)
-        except Exception as e:
-            print(f"Error al enviar notificación de solicitud: {str(e)}")
+        # Notificación a los administradores, enviada por el outbox tras el commit
+        encolar_notificacion(db, "solicitud_visita", {"visita_id": visita.id}, f"solicitud_visita:{visita.id}")
 
         db.commit()
         
@@ -1037,11 +950,11 @@ def aprobar_solicitud_visita_admin(db: Session, visita_id: int, admin_id: int) -
         visita.tipo_creador = "admin"  # Cambiar a admin como creador
         
         # Generar QR real
-        qr_code, qr_img_b64 = generar_qr_completo(visita.id, minutos_validez=1440)
+        qr_code = generar_payload_qr(visita.id, visita.qr_expiracion or (get_honduras_time() + timedelta(minutes=1440)))
         visita.qr_code = qr_code
         
         # Generar QR personalizado
-        qr_img_personalizado = generar_imagen_qr_personalizada(
+        qr_img_personalizado = png_a_base64(servicio_render_qr.renderizar(TrabajoRenderQR(
             qr_data=qr_code,
             nombre_residente=visita.residente.usuario.nombre,
             nombre_visitante=visita.visitante.nombre_conductor,
@@ -1049,13 +962,10 @@ def aprobar_solicitud_visita_admin(db: Session, visita_id: int, admin_id: int) -
             unidad_residencial=visita.residente.unidad_residencial,
             fecha_creacion=datetime.now(timezone.utc),
             fecha_expiracion=visita.qr_expiracion
-        )
+        )))
 
-        # Enviar notificaciones
-        try:
-            enviar_notificacion_guardia(db, visita)
-        except Exception as e:
-            print(f"Error al enviar notificaciones: {str(e)}")
+        # Notificación a guardias, enviada por el outbox tras el commit
+        encolar_notificacion(db, "visita_guardia", {"visita_id": visita.id}, f"visita_guardia:{visita.id}")
 
         db.commit()
         
@@ -1149,28 +1059,14 @@ def enviar_notificacion_salida_tardia(db: Session, visita, guardia_nombre: str):
             else:
                 tiempo_extra = f"{minutos} minutos"
         
-        mensaje_html = f"""
-            <html>
-                <body>
-                    <h2 style="color: #ff9800;">⚠️ Salida Tardía Registrada</h2>
-                    <p>El visitante <strong>{visitante.nombre_conductor}</strong> ha <strong>SALIDO</strong> de la residencial con QR expirado.</p>
-                    
-                    <div style="background-color: #fff3e0; padding: 15px; border-left: 4px solid #ff9800; margin: 15px 0;">
-                        <h3 style="color: #e65100; margin-top: 0;">Información de la Salida Tardía:</h3>
-                        <p><strong>Visitante:</strong> {visitante.nombre_conductor}</p>
-                        <p><strong>QR expiró:</strong> {visita.qr_expiracion.strftime('%Y-%m-%d %H:%M:%S') if visita.qr_expiracion else 'N/A'}</p>
-                        <p><strong>Salida registrada:</strong> {get_honduras_time().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                        <p><strong>Tiempo de retraso:</strong> {tiempo_extra}</p>
-                        <p><strong>Guardia que registró:</strong> {guardia_nombre}</p>
-                    </div>
-                    
-                    <p>La visita ha sido marcada como <strong>COMPLETADA</strong> a pesar de la expiración del QR.</p>
-                    <p><em>Nota: Se recomienda coordinar mejor los horarios de visita para evitar inconvenientes futuros.</em></p>
-                    
-                    <p>Gracias por usar nuestro sistema de control de acceso.</p>
-                </body>
-            </html>
-        """
+        mensaje_html = renderizar_correo(
+            "salida_tardia.html",
+            visitante=visitante,
+            visita=visita,
+            fecha_salida=get_honduras_time(),
+            tiempo_extra=tiempo_extra,
+            guardia_nombre=guardia_nombre
+        )
         
         mensaje_notificacion = f"Salida tardía: {visitante.nombre_conductor} - QR expirado hace {tiempo_extra} - registrado por {guardia_nombre}"
 
@@ -0,0 +1,28 @@
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.services.rollup_service import recalcular_rollups
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+def backfill_rollups_estadisticas(residencial_id: int = None):
+    """
+    Llena (o reconstruye) las tablas de rollup de estadísticas desde visitas y escaneos.
+    Se ejecuta una vez tras la migración; luego se mantienen solas y se reconcilian cada noche.
+    """
+    db: Session = SessionLocal()
+    try:
+        recalcular_rollups(db, residencial_id=residencial_id)
+        db.commit()
+        logger.info(f"Backfill de rollups completado (residencial: {residencial_id or 'todas'})")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error en backfill de rollups: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    # Para ejecutar manualmente: python -m app.tasks.rollup_estadisticas [residencial_id]
+    backfill_rollups_estadisticas(int(sys.argv[1]) if len(sys.argv) > 1 else None)
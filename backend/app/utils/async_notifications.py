@@ -1,32 +1,134 @@
 import asyncio
 import threading
-from concurrent.futures import ThreadPoolExecutor
-from app.utils.notificaciones import enviar_correo
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from app.core.config import settings
+from app.utils.notificaciones import enviar_correo, enviar_correo_lote, limitador_brevo, LOTE_MAX_BREVO
+from app.utils.plantillas_correo import renderizar_correo
 from app.schemas.usuario_schema import UsuarioCreate
 from app.models.usuario import Usuario
 import logging
 
+class ServicioCorreo:
+    """
+    Pool propio para los correos (uno a uno y masivos) con métricas de cola y
+    de rendimiento. Las llamadas a Brevo pasan por limitador_brevo, así que
+    EMAIL_WORKERS solo define cuántas pueden estar en vuelo a la vez.
+    """
+
+    def __init__(self, workers: int, lote: int):
+        self.workers = workers
+        self.lote = min(lote, LOTE_MAX_BREVO)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="email_sender"
+        )
+        self._lock = threading.Lock()
+        self.en_cola = 0
+        self.en_curso = 0
+        self.enviados = 0
+        self.fallidos = 0
+        self.llamadas_api = 0
+        self.ultimo_masivo = None
+        # (instante, correos enviados) del último minuto, para el rendimiento
+        self._ventana = deque()
+
+    def _ejecutar(self, funcion, destinatarios: int, *args) -> bool:
+        with self._lock:
+            self.en_cola -= 1
+            self.en_curso += 1
+        exito = False
+        try:
+            exito = funcion(*args)
+            return exito
+        except Exception as e:
+            logging.error(f"Error en envío de correo: {e}")
+            return False
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+                self.llamadas_api += 1
+                if exito:
+                    self.enviados += destinatarios
+                    self._ventana.append((time.monotonic(), destinatarios))
+                    self._podar_ventana()
+                else:
+                    self.fallidos += destinatarios
+
+    def _podar_ventana(self):
+        # Llamar con self._lock tomado
+        limite = time.monotonic() - 60
+        while self._ventana and self._ventana[0][0] < limite:
+            self._ventana.popleft()
+
+    def _encolar(self, funcion, destinatarios: int, *args) -> Future:
+        with self._lock:
+            self.en_cola += 1
+        return self.executor.submit(self._ejecutar, funcion, destinatarios, *args)
+
+    def enviar(self, destinatario: str, asunto: str, html: str, qr_img_b64: str = None) -> Future:
+        return self._encolar(enviar_correo, 1, destinatario, asunto, html, qr_img_b64)
+
+    def enviar_masivo(self, destinatarios: list[str], asunto: str, html: str) -> list[str]:
+        """
+        Envía el mismo correo a todos los destinatarios en lotes de EMAIL_LOTE
+        (una llamada a Brevo por lote, en paralelo) y espera el resultado.
+        Retorna los correos aceptados por Brevo.
+        """
+        # Sin duplicados ni vacíos, conservando el orden
+        destinatarios = list(dict.fromkeys(d for d in destinatarios if d))
+        if not destinatarios:
+            return []
+        inicio = time.perf_counter()
+        lotes = [destinatarios[i:i + self.lote] for i in range(0, len(destinatarios), self.lote)]
+        futures = [(lote, self._encolar(enviar_correo_lote, len(lote), lote, asunto, html)) for lote in lotes]
+        aceptados = [correo for lote, future in futures if future.result() for correo in lote]
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            self.ultimo_masivo = {
+                "destinatarios": len(destinatarios),
+                "aceptados": len(aceptados),
+                "lotes": len(lotes),
+                "duracion_ms": round(duracion * 1000, 2),
+                "correos_por_segundo": round(len(destinatarios) / duracion, 1) if duracion else None
+            }
+        logging.info(f"Correo masivo: {len(aceptados)}/{len(destinatarios)} aceptados en {len(lotes)} lotes")
+        return aceptados
+
+    def cerrar(self):
+        self.executor.shutdown(wait=True)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            self._podar_ventana()
+            return {
+                "workers": self.workers,
+                "lote": self.lote,
+                "en_cola": self.en_cola,
+                "en_curso": self.en_curso,
+                "enviados": self.enviados,
+                "fallidos": self.fallidos,
+                "llamadas_api": self.llamadas_api,
+                "enviados_ultimo_minuto": sum(cantidad for _, cantidad in self._ventana),
+                "ultimo_masivo": self.ultimo_masivo,
+                "limitador": limitador_brevo.resumen()
+            }
+
 # Pool de hilos para envío asíncrono de correos
-# Configuración optimizada para Railway y producción
-email_executor = ThreadPoolExecutor(
-    max_workers=2,  # Reducido para Railway
-    thread_name_prefix="email_sender"
-)
+servicio_correo = ServicioCorreo(settings.EMAIL_WORKERS, settings.EMAIL_LOTE)
 
 def enviar_correo_async(destinatario: str, asunto: str, html: str, qr_img_b64: str = None):
     """
     Envía un correo de forma asíncrona sin bloquear la respuesta HTTP
     """
-    def _enviar():
-        try:
-            return enviar_correo(destinatario, asunto, html, qr_img_b64)
-        except Exception as e:
-            logging.error(f"Error en envío asíncrono de correo a {destinatario}: {e}")
-            return False
-    
-    # Enviar en un hilo separado
-    future = email_executor.submit(_enviar)
-    return future
+    return servicio_correo.enviar(destinatario, asunto, html, qr_img_b64)
+
+def enviar_correo_masivo(destinatarios: list[str], asunto: str, html: str) -> list[str]:
+    """
+    Mismo correo a muchos destinatarios en llamadas agrupadas a Brevo
+    """
+    return servicio_correo.enviar_masivo(destinatarios, asunto, html)
 
 def enviar_notificacion_usuario_creado_async(usuario: Usuario, datos_creacion: UsuarioCreate):
     """
@@ -34,109 +136,20 @@ def enviar_notificacion_usuario_creado_async(usuario: Usuario, datos_creacion: U
     """
     try:
         asunto = "¡Bienvenido a Porto Pass!"
-        # Datos comunes
-        mensaje_html = f"""
-            <html>
-                <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                    <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                        <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                            <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
-                                🏠 ¡Bienvenido a Porto Pass!
-                            </h1>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                Hola <strong>{usuario.nombre}</strong>,
-                            </p>
-                            <p style="font-size: 16px; margin-bottom: 20px;">
-                                Tu cuenta ha sido creada exitosamente y ya puedes utilizar la aplicación Porto Pass.
-                            </p>
-        """
-
-        # Datos según rol
-        if usuario.rol == "residente":
-            mensaje_html += f"""
-                <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #2980b9; margin-top: 0;">📋 Tus Datos de Acceso</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li style="margin-bottom: 10px;"><strong>ID: </strong> {usuario.id}</li>
-                        <li style="margin-bottom: 10px;"><strong>Email: </strong> {usuario.email}</li>
-                        <li style="margin-bottom: 10px;"><strong>Rol: </strong> {usuario.rol}</li>
-                        <li style="margin-bottom: 10px;"><strong>Unidad Residencial: </strong> {datos_creacion.unidad_residencial}</li>
-                        <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {datos_creacion.telefono}</li>
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #155724; margin-top: 0;">✅ ¿Qué puedes hacer ahora?</h3>
-                    <ul style="margin-bottom: 0;">
-                        <li>Iniciar sesión en la aplicación</li>
-                        <li>Crear visitas para tus invitados</li>
-                        <li>Recibir notificaciones de visitas</li>
-                        <li>Ver el historial de tus visitas</li>
-                    </ul>
-                </div>
-            """
-        elif usuario.rol == "admin":
-            mensaje_html += f"""
-                <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #2980b9; margin-top: 0;">📋 Tus Datos de Acceso</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li style="margin-bottom: 10px;"><strong>ID: </strong> {usuario.id}</li>
-                        <li style="margin-bottom: 10px;"><strong>Email: </strong> {usuario.email}</li>
-                        <li style="margin-bottom: 10px;"><strong>Rol: </strong> {usuario.rol}</li>
-                        <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {getattr(datos_creacion, 'telefono', '-')}</li>
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #155724; margin-top: 0;">⚠️ Permisos de Administrador</h3>
-                    <ul style="margin-bottom: 0;">
-                        <li>Tienes acceso total al sistema</li>
-                        <li>Puedes crear y gestionar usuarios, visitas y notificaciones</li>
-                        <li>Por favor, usa tu cuenta con responsabilidad</li>
-                    </ul>
-                </div>
-            """
-        elif usuario.rol == "guardia":
-            mensaje_html += f"""
-                <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #2980b9; margin-top: 0;">📋 Tus Datos de Acceso</h3>
-                    <ul style="list-style: none; padding: 0;">
-                        <li style="margin-bottom: 10px;"><strong>ID: </strong> {usuario.id}</li>
-                        <li style="margin-bottom: 10px;"><strong>Email: </strong> {usuario.email}</li>
-                        <li style="margin-bottom: 10px;"><strong>Rol: </strong> {usuario.rol}</li>
-                        <li style="margin-bottom: 10px;"><strong>Teléfono: </strong> {getattr(datos_creacion, 'telefono', '-')}</li>
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                    <h3 style="color: #155724; margin-top: 0;">🚨 Permisos de Guardia</h3>
-                    <ul style="margin-bottom: 0;">
-                        <li>Puedes aceptar o rechazar la entrada de visitas</li>
-                        <li>Puedes registrar la salida de los visitantes</li>
-                        <li>Debes verificar la identidad de los visitantes</li>
-                    </ul>
-                </div>
-            """
-
-        # Información de seguridad común
-        mensaje_html += """
-            <div style="background-color: #fff3cd; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                <h3 style="color: #856404; margin-top: 0;">🔒 Seguridad de tu cuenta</h3>
-                <p style="font-size: 14px; color: #856404;">
-                    <strong>Importante:</strong> Por seguridad, no almacenamos tu contraseña en texto plano. 
-                    Si la olvidas, contacta al administrador del sistema.
-                </p>
-            </div>
-            <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
-                Si tienes alguna pregunta o necesitas ayuda, no dudes en contactar al administrador.
-            </p>
-            <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-            <p style="text-align: center; font-size: 12px; color: #999;">
-                Este es un mensaje automático del sistema Porto Pass.<br>
-                <strong>No respondas a este correo.</strong>
-            </p>
-            </div>
-        </div>
-        </body>
-        </html>
-        """
+        rol_display = {
+            "residente": "Miembro",
+            "admin": "Administrador",
+            "guardia": "Operador",
+            "super_admin": "Super Administrador"
+        }.get(usuario.rol, usuario.rol)
+        mensaje_html = renderizar_correo(
+            "bienvenida.html",
+            usuario=usuario,
+            entidad_nombre=None,
+            rol_display=rol_display,
+            unidad_residencial=getattr(datos_creacion, 'unidad_residencial', '-'),
+            telefono=getattr(datos_creacion, 'telefono', '-')
+        )
 
         # Enviar el correo de forma asíncrona
         future = enviar_correo_async(usuario.email, asunto, mensaje_html)
@@ -0,0 +1,88 @@
+"""
+Elección de un worker líder por tarea programada con advisory locks de sesión
+de Postgres (expiración de visitas, reemisión de QR...).
+"""
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Motor propio sin pool: la conexión del lock vive lo que el proceso y no debe
+# restar capacidad al pool de sesiones (DB_POOL_SIZE) ni contar en sus métricas
+_engine_locks = create_engine(settings.DATABASE_URL, poolclass=NullPool)
+
+_lideres: list["LiderCluster"] = []
+
+class LiderCluster:
+    """
+    Liderazgo entre workers con un advisory lock de sesión de Postgres. El lock se
+    toma en una conexión dedicada que el proceso conserva mientras vive, así que un
+    solo worker del cluster es líder en cada tick. Si el proceso o su conexión caen,
+    Postgres libera el lock y otro worker lo toma en su siguiente tick.
+    """
+
+    def __init__(self, clave: int):
+        self._clave = clave
+        self._conexion = None
+        self._lock = threading.Lock()
+        _lideres.append(self)
+
+    def es_lider(self) -> bool:
+        with self._lock:
+            if self._conexion is not None:
+                try:
+                    self._conexion.execute(text("SELECT 1"))
+                    self._conexion.commit()
+                    return True
+                except Exception as e:
+                    logger.warning(f"Conexión del lock {self._clave} perdida, se vuelve a competir: {str(e)}")
+                    self._cerrar_conexion()
+
+            conexion = _engine_locks.connect()
+            try:
+                obtenido = conexion.execute(
+                    text("SELECT pg_try_advisory_lock(:clave)"),
+                    {"clave": self._clave}
+                ).scalar()
+                # Sin transacción abierta mientras se espera al siguiente tick
+                conexion.commit()
+            except Exception:
+                conexion.close()
+                raise
+            if not obtenido:
+                conexion.close()
+                return False
+            self._conexion = conexion
+            logger.info(f"Este worker es líder del lock {self._clave}")
+            return True
+
+    def _cerrar_conexion(self):
+        try:
+            self._conexion.invalidate()
+        except Exception:
+            pass
+        self._conexion = None
+
+    def soltar(self):
+        with self._lock:
+            if self._conexion is None:
+                return
+            try:
+                self._conexion.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": self._clave})
+                self._conexion.commit()
+                self._conexion.close()
+            except Exception:
+                self._cerrar_conexion()
+            self._conexion = None
+
+    @property
+    def activo(self) -> bool:
+        return self._conexion is not None
+
+def soltar_lideres():
+    """Libera los locks de liderazgo de este proceso (al cerrar la aplicación)."""
+    for lider in _lideres:
+        lider.soltar()
@@ -1,5 +1,7 @@
 # app/utils/notificaciones.py
 import logging
+import threading
+import time
 import sib_api_v3_sdk
 from sib_api_v3_sdk.rest import ApiException
 from app.core.config import settings
@@ -11,6 +13,69 @@ configuration.api_key["api-key"] = settings.BREVO_API_KEY
 api_client = sib_api_v3_sdk.ApiClient(configuration)
 api_instance = sib_api_v3_sdk.TransactionalEmailsApi(api_client)
 
+# Máximo de destinatarios (messageVersions) por llamada; Brevo acepta hasta 1000
+LOTE_MAX_BREVO = 1000
+# Reintentos cuando Brevo responde 429 (cuota por segundo excedida)
+REINTENTOS_429 = 2
+
+class LimitadorTasa:
+    """
+    Token bucket compartido por todos los hilos del proceso: cada llamada a la
+    API de Brevo toma un token; sin tokens, el hilo espera a que se repongan.
+    """
+
+    def __init__(self, por_segundo: float, rafaga: int):
+        self.por_segundo = por_segundo
+        self.rafaga = rafaga
+        self._tokens = float(rafaga)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+        self.esperas = 0
+        self.segundos_espera = 0.0
+
+    def esperar(self):
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.por_segundo)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.por_segundo
+                self.esperas += 1
+                self.segundos_espera += espera
+            time.sleep(espera)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "por_segundo": self.por_segundo,
+                "rafaga": self.rafaga,
+                "esperas": self.esperas,
+                "segundos_espera": round(self.segundos_espera, 2)
+            }
+
+limitador_brevo = LimitadorTasa(settings.EMAIL_RATE_POR_SEGUNDO, settings.EMAIL_RATE_RAFAGA)
+
+def _enviar_transac(email) -> None:
+    """Llamada a Brevo respetando el limitador; ante 429 espera el reset indicado y reintenta."""
+    for intento in range(REINTENTOS_429 + 1):
+        limitador_brevo.esperar()
+        try:
+            api_instance.send_transac_email(email)
+            return
+        except ApiException as e:
+            if e.status != 429 or intento == REINTENTOS_429:
+                raise
+            reset = (e.headers or {}).get("x-sib-ratelimit-reset", "1")
+            try:
+                espera = min(float(reset), 10.0)
+            except ValueError:
+                espera = 1.0
+            logging.warning(f"Brevo respondió 429, reintentando en {espera:.1f} s")
+            time.sleep(espera)
+
 def enviar_correo(destinatario: str, asunto: str, html: str, qr_img_b64: str = None) -> bool:
     """
     Envía un correo electronico usando Brevo.
@@ -55,7 +120,7 @@ def enviar_correo(destinatario: str, asunto: str, html: str, qr_img_b64: str = N
                 return False
 
         # Enviar correo
-        api_instance.send_transac_email(email)
+        _enviar_transac(email)
         return True
 
     except ApiException as e:
@@ -63,4 +128,36 @@ def enviar_correo(destinatario: str, asunto: str, html: str, qr_img_b64: str = N
         return False
     except Exception as e:
         logging.error(f"❌ Error general al enviar correo a {destinatario}: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def enviar_correo_lote(destinatarios: list[str], asunto: str, html: str) -> bool:
+    """
+    Envía el mismo correo a varios destinatarios (máximo LOTE_MAX_BREVO) en una sola
+    llamada a Brevo: una messageVersion por destinatario, así cada uno recibe su
+    propio correo y no ve las direcciones de los demás.
+    """
+    if not destinatarios:
+        return True
+    if len(destinatarios) > LOTE_MAX_BREVO:
+        raise ValueError(f"Máximo {LOTE_MAX_BREVO} destinatarios por lote")
+
+    sender = {"name": "Porto Pass", "email": settings.EMAIL_ADDRESS}
+    try:
+        email = sib_api_v3_sdk.SendSmtpEmail(
+            sender=sender,
+            subject=asunto,
+            html_content=html,
+            message_versions=[
+                sib_api_v3_sdk.SendSmtpEmailMessageVersions(to=[sib_api_v3_sdk.SendSmtpEmailTo1(email=destinatario)])
+                for destinatario in destinatarios
+            ]
+        )
+        _enviar_transac(email)
+        return True
+
+    except ApiException as e:
+        logging.error(f"❌ Error de API de Brevo al enviar lote de {len(destinatarios)} correos: {e}")
+        return False
+    except Exception as e:
+        logging.error(f"❌ Error general al enviar lote de {len(destinatarios)} correos: {e}")
+        return False
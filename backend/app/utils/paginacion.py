@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import tuple_, select, func, text
+from sqlalchemy.orm import Session, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+import base64
+import json
+import threading
+import time
+
+# Modos de paginación y de conteo aceptados por los endpoints de historial
+MODOS_PAGINACION = ("offset", "cursor")
+MODOS_CONTEO = ("exacto", "estimado", "cache", "ninguno")
+
+def codificar_cursor(fecha: datetime, id: int) -> str:
+    """Cursor opaco (base64url) con la clave de orden (fecha, id) del último registro de la página."""
+    crudo = f"{fecha.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, id = base64.urlsafe_b64decode(cursor + relleno).decode().rsplit("|", 1)
+        return datetime.fromisoformat(fecha), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+def condicion_keyset(columna_fecha, columna_id, cursor: str):
+    """
+    Registros estrictamente posteriores al cursor en orden (fecha DESC, id DESC).
+    La comparación de filas (fecha, id) < (:fecha, :id) la resuelve Postgres con
+    el índice compuesto, sin recorrer las páginas anteriores.
+    """
+    fecha, id = decodificar_cursor(cursor)
+    return tuple_(columna_fecha, columna_id) < tuple_(fecha, id)
+
+def validar_modos(paginacion: str, conteo: str, cursor: str = None):
+    """Valida los parámetros antes de entrar a los servicios (que convierten sus errores en 500)."""
+    if cursor:
+        decodificar_cursor(cursor)
+    if paginacion not in MODOS_PAGINACION:
+        raise HTTPException(status_code=400, detail="Paginación inválida. Use: offset o cursor")
+    if conteo not in MODOS_CONTEO:
+        raise HTTPException(status_code=400, detail="Conteo inválido. Use: exacto, estimado, cache o ninguno")
+
+def cortar_pagina(filas: list, limit: int, clave) -> tuple[list, Optional[str]]:
+    """
+    Recibe limit + 1 filas; devuelve la página y el cursor siguiente (None si no hay más).
+    `clave(fila)` devuelve (fecha, id) de una fila.
+    """
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    fecha, id = clave(filas[-1])
+    return filas, codificar_cursor(fecha, id)
+
+class CacheConteos:
+    """TTL corto para conteos totales de listados; evita un COUNT por cada página."""
+
+    def __init__(self, ttl: int = 30, max_entradas: int = 512):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave) -> Optional[int]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                self._entradas.pop(clave, None)
+                return None
+            return entrada[1]
+
+    def guardar(self, clave, total: int):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + self.ttl, total)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+cache_conteos = CacheConteos()
+
+def _sql_estimacion(stmt, dialect) -> Optional[str]:
+    """EXPLAIN con parámetros literales; None si algún valor no tiene representación literal."""
+    try:
+        compilado = stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    except Exception:
+        return None
+    # Los literales (p. ej. horas '07:28:49') no deben leerse como parámetros de text()
+    return f"EXPLAIN (FORMAT JSON) {compilado}".replace(":", "\\:")
+
+def _filas_plan(plan) -> int:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def contar(db: Session, query: Query, modo: str, clave=None) -> tuple[Optional[int], bool]:
+    """
+    Total de un listado según el modo: exacto (COUNT), estimado (filas del plan
+    de Postgres), cache (COUNT reutilizado por unos segundos) o ninguno.
+    Si la estimación no se puede armar se cuenta exacto. Devuelve (total, es_estimado).
+    """
+    if modo == "ninguno":
+        return None, False
+    if modo == "estimado":
+        sql = _sql_estimacion(query.statement, db.get_bind().dialect)
+        if sql:
+            return _filas_plan(db.execute(text(sql)).scalar()), True
+    if modo == "cache" and clave is not None:
+        total = cache_conteos.obtener(clave)
+        if total is None:
+            total = query.count()
+            cache_conteos.guardar(clave, total)
+        return total, False
+    return query.count(), False
+
+async def contar_async(db: AsyncSession, stmt, modo: str, clave=None) -> tuple[Optional[int], bool]:
+    """Versión para AsyncSession de contar(); `stmt` es un select() sin ORDER BY/LIMIT."""
+    if modo == "ninguno":
+        return None, False
+    if modo == "estimado":
+        sql = _sql_estimacion(stmt, db.get_bind().dialect)
+        if sql:
+            return _filas_plan((await db.execute(text(sql))).scalar()), True
+    consulta_conteo = select(func.count()).select_from(stmt.subquery())
+    if modo == "cache" and clave is not None:
+        total = cache_conteos.obtener(clave)
+        if total is None:
+            total = (await db.execute(consulta_conteo)).scalar_one()
+            cache_conteos.guardar(clave, total)
+        return total, False
+    return (await db.execute(consulta_conteo)).scalar_one(), False
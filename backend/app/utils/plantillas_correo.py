@@ -0,0 +1,69 @@
+"""
+Plantillas HTML de los correos (app/templates/correos).
+Se compilan una sola vez al importar el módulo y se renderizan con autoescape:
+nombres, notas, publicaciones y tickets vienen de usuarios y no deben inyectar HTML.
+"""
+import os
+import re
+import uuid
+from datetime import datetime
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup, escape
+from app.utils.time import get_honduras_time
+
+DIRECTORIO_PLANTILLAS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "correos")
+
+def _fecha(valor: datetime, formato: str = "%Y-%m-%d %H:%M:%S") -> str:
+    # Las fechas con zona se muestran en hora de Honduras
+    if valor is None:
+        return "N/A"
+    if valor.tzinfo:
+        valor = valor.astimezone(get_honduras_time().tzinfo)
+    return valor.strftime(formato)
+
+entorno_correos = Environment(
+    loader=FileSystemLoader(DIRECTORIO_PLANTILLAS),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    # Las plantillas no cambian en ejecución: sin stat del archivo en cada render
+    auto_reload=False,
+    cache_size=-1
+)
+entorno_correos.filters["fecha"] = _fecha
+
+def _precompilar():
+    for nombre in entorno_correos.list_templates(extensions=["html"]):
+        entorno_correos.get_template(nombre)
+
+_precompilar()
+
+def renderizar_correo(plantilla: str, **contexto) -> str:
+    """HTML del correo `plantilla` (p. ej. "visita_creada.html") con el contexto dado."""
+    return entorno_correos.get_template(plantilla).render(**contexto)
+
+class PlantillaDifusion:
+    """
+    Correo que se envía a muchos destinatarios y solo cambia en unos campos
+    (p. ej. el nombre del saludo). La plantilla se renderiza una vez con
+    marcadores únicos en esos campos; por destinatario solo se insertan los
+    valores escapados entre las partes ya renderizadas.
+    """
+
+    def __init__(self, plantilla: str, campos: tuple, **contexto):
+        token = uuid.uuid4().hex
+        marcadores = {campo: f"\x1d{token}:{campo}\x1d" for campo in campos}
+        html = renderizar_correo(plantilla, **contexto, **{c: Markup(m) for c, m in marcadores.items()})
+        patron = "(" + "|".join(re.escape(m) for m in marcadores.values()) + ")"
+        campo_de = {m: c for c, m in marcadores.items()}
+        # Partes pares: HTML fijo; impares: nombre del campo a sustituir
+        self._partes = [
+            campo_de.get(parte, parte) if i % 2 else parte
+            for i, parte in enumerate(re.split(patron, html))
+        ]
+
+    def para(self, **valores) -> str:
+        return "".join(
+            str(escape(valores[parte])) if i % 2 else parte
+            for i, parte in enumerate(self._partes)
+        )
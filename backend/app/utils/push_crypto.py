@@ -0,0 +1,122 @@
+"""
+Criptografía y transporte de web push reutilizables entre envíos.
+webpush() firma un JWT VAPID, vuelve a leer la clave privada y abre una conexión
+nueva en cada llamada; aquí esas piezas se preparan una vez y se comparten.
+"""
+import base64
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Any
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from cryptography.hazmat.primitives.asymmetric import ec
+from py_vapid import Vapid
+from pywebpush import WebPusher, WebPushException
+from app.core.config import settings
+
+# Vigencia del JWT VAPID (el máximo que aceptan los servicios push es 24 h)
+VAPID_VIGENCIA_SEGUNDOS = 12 * 60 * 60
+# Se vuelve a firmar cuando le queda menos de esto, para no enviar un token por vencer
+VAPID_MARGEN_SEGUNDOS = 60 * 60
+# Timeout de cada POST al servicio push
+PUSH_TIMEOUT_SEGUNDOS = 10
+
+def _origen(endpoint: str) -> str:
+    url = urlparse(endpoint)
+    return f"{url.scheme}://{url.netloc}"
+
+class CabecerasVapid:
+    """
+    Cabeceras VAPID firmadas por origen del servicio push (FCM, Mozilla, Apple...).
+    El claim aud es el origen, así que una difusión a miles de suscripciones
+    firma un token por servicio y no uno por envío.
+    """
+
+    def __init__(self, clave_privada: str, email: str):
+        self._clave_privada = clave_privada
+        self._email = email
+        self._vapid = None
+        self._cache: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.firmas = 0
+
+    def _clave(self) -> Vapid:
+        # La clave se lee al primer envío, no al importar el módulo
+        if self._vapid is None:
+            if os.path.isfile(self._clave_privada):
+                self._vapid = Vapid.from_file(private_key_file=self._clave_privada)
+            else:
+                self._vapid = Vapid.from_string(private_key=self._clave_privada)
+        return self._vapid
+
+    def obtener(self, endpoint: str) -> Dict[str, str]:
+        origen = _origen(endpoint)
+        ahora = int(time.time())
+        with self._lock:
+            guardado = self._cache.get(origen)
+            if guardado and guardado[1] - ahora > VAPID_MARGEN_SEGUNDOS:
+                self.hits += 1
+                return guardado[0]
+            expiracion = ahora + VAPID_VIGENCIA_SEGUNDOS
+            cabeceras = self._clave().sign({"sub": self._email, "aud": origen, "exp": expiracion})
+            self._cache[origen] = (cabeceras, expiracion)
+            self.firmas += 1
+            return cabeceras
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {"origenes": len(self._cache), "hits": self.hits, "firmas": self.firmas}
+
+cabeceras_vapid = CabecerasVapid(settings.VAPID_PRIVATE_KEY, settings.VAPID_EMAIL)
+
+@lru_cache(maxsize=settings.PUSH_CACHE_CLAVES)
+def clave_suscriptor(p256dh: str) -> ec.EllipticCurvePublicKey:
+    """
+    Clave pública P-256 del navegador ya validada. http_ece acepta el objeto,
+    así que el punto no se vuelve a decodificar y validar en cada envío.
+    """
+    crudo = base64.urlsafe_b64decode(p256dh + "=" * (-len(p256dh) % 4))
+    return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), crudo)
+
+def _crear_sesion() -> requests.Session:
+    # urllib3 mantiene un pool de conexiones keep-alive por host: cada servicio
+    # push reutiliza sus conexiones TLS entre envíos y entre difusiones
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=32, pool_maxsize=settings.PUSH_WORKERS)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+sesion_push = _crear_sesion()
+
+def enviar_webpush(subscription_info: Dict[str, Any], data: str, ttl: int = 0) -> requests.Response:
+    """
+    Equivalente a pywebpush.webpush() con VAPID, clave del suscriptor y conexión
+    reutilizadas. Lanza WebPushException si el servicio push responde > 202.
+    """
+    pusher = WebPusher(subscription_info, requests_session=sesion_push)
+    pusher.receiver_key = clave_suscriptor(subscription_info["keys"]["p256dh"])
+    respuesta = pusher.send(
+        data,
+        cabeceras_vapid.obtener(subscription_info["endpoint"]),
+        ttl=ttl,
+        content_encoding="aes128gcm",
+        timeout=PUSH_TIMEOUT_SEGUNDOS
+    )
+    if respuesta.status_code > 202:
+        raise WebPushException(
+            f"Push failed: {respuesta.status_code} {respuesta.reason}\nResponse body:{respuesta.text}",
+            response=respuesta
+        )
+    return respuesta
+
+def resumen_push_crypto() -> dict:
+    info = clave_suscriptor.cache_info()
+    return {
+        "vapid": cabeceras_vapid.resumen(),
+        "claves_suscriptor": {"hits": info.hits, "misses": info.misses, "tamano": info.currsize}
+    }
@@ -67,6 +67,57 @@ def enviar_push_nueva_visita_guardia(
         logger.error(f"Error enviando push a guardias: {str(e)}")
         return {"usuarios_notificados": 0, "total_enviados": 0, "total_fallidos": 0}
 
+def enviar_push_lote_visitas_guardia(
+    db: Session,
+    lote_id: str,
+    total: int,
+    nombre_creador: str,
+    residencial_id: int
+) -> Dict[str, Any]:
+    """
+    Envía una sola notificación push a guardias cuando se crea un lote masivo de visitas
+    
+    Args:
+        db: Sesión de base de datos
+        lote_id: ID del lote
+        total: Cantidad de visitas del lote
+        nombre_creador: Nombre del administrador que creó el lote
+        residencial_id: ID del residencial
+        
+    Returns:
+        Resultado del envío
+    """
+    try:
+        payload = {
+            "title": "🚨 Nuevo lote de visitas",
+            "body": f"{nombre_creador} creó {total} visitas",
+            "icon": "/genfavicon-180-v3.png",
+            "badge": "/genfavicon-64-v3.png",
+            "data": {
+                "url": "/visitas",
+                "tipo": "lote_visitas_creado",
+                "lote_id": lote_id,
+                "total": total,
+                "creador": nombre_creador
+            },
+            "tag": f"lote-{lote_id}",
+            "requireInteraction": True
+        }
+        
+        resultado = push_service.notificar_por_rol(
+            db=db,
+            rol="guardia",
+            residencial_id=residencial_id,
+            payload=payload
+        )
+        
+        logger.info(f"Push de lote enviado a guardias: {resultado}")
+        return resultado
+        
+    except Exception as e:
+        logger.error(f"Error enviando push de lote a guardias: {str(e)}")
+        return {"usuarios_notificados": 0, "total_enviados": 0, "total_fallidos": 0}
+
 def enviar_push_escaneo_visita(
     db: Session,
     visita,
@@ -9,44 +9,79 @@ import hashlib
 import os
 import io
 from typing import Tuple, Optional
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 
 FERNET_KEY = settings.FERNET_KEY
 fernet = Fernet(FERNET_KEY)
 HMAC_SECRET = settings.HMAC_SECRET
 
+# Versión del payload cuya expiración firmada coincide con visita.qr_expiracion.
+# Los payloads sin versión (id|expiracion) solo se usan para verificar la firma.
+VERSION_PAYLOAD_QR = "2"
+
 # Cifrar y firmar el id de la visita
 def generar_payload_qr(visita_id: int, expiracion: datetime) -> str:
-    payload = f"{visita_id}|{expiracion.isoformat()}"
+    payload = f"{VERSION_PAYLOAD_QR}|{visita_id}|{expiracion.isoformat()}"
     payload_cifrado = fernet.encrypt(payload.encode()).decode()
     firma = hmac.new(HMAC_SECRET.encode(), payload_cifrado.encode(), hashlib.sha256).hexdigest()
     return f"{payload_cifrado}.{firma}"
 
-# Validar el QR
-def validar_payload_qr(qr_code: str) -> Tuple[Optional[int], Optional[str]]:
+# Payloads de un lote con la misma expiración (creación masiva)
+def generar_payloads_qr(visita_ids: list[int], expiracion: datetime) -> list[str]:
+    # La fecha se serializa una vez y la clave HMAC se prepara una vez; por visita solo queda cifrar y firmar
+    sufijo = f"|{expiracion.isoformat()}"
+    hmac_base = hmac.new(HMAC_SECRET.encode(), digestmod=hashlib.sha256)
+    payloads = []
+    for visita_id in visita_ids:
+        payload_cifrado = fernet.encrypt(f"{VERSION_PAYLOAD_QR}|{visita_id}{sufijo}".encode())
+        firma = hmac_base.copy()
+        firma.update(payload_cifrado)
+        payloads.append(f"{payload_cifrado.decode()}.{firma.hexdigest()}")
+    return payloads
+
+# Verificar firma y descifrar el QR sin tocar la BD
+def verificar_firma_qr(qr_code: str) -> Tuple[Optional[int], Optional[datetime], Optional[str]]:
+    """
+    Devuelve (visita_id, expiracion, error). expiracion solo viene en payloads
+    versionados, donde es la misma que visita.qr_expiracion; en los antiguos es None.
+    """
     try:
-        if '.' not in qr_code:
-            return None, "Formato inválido del código QR"
+        if not qr_code or '.' not in qr_code:
+            return None, None, "Formato inválido del código QR"
         
         payload_cifrado, firma = qr_code.split('.', 1)
         
         firma_valida = hmac.new(HMAC_SECRET.encode(), payload_cifrado.encode(), hashlib.sha256).hexdigest()
         if not hmac.compare_digest(firma, firma_valida):
-            return None, "Firma inválida"
+            return None, None, "Firma inválida"
         
-        payload = fernet.decrypt(payload_cifrado.encode()).decode()
-        visita_id, expiracion = payload.split('|')
-        
-        expiracion = datetime.fromisoformat(expiracion)
-        if expiracion.tzinfo is None:
-            expiracion = expiracion.replace(tzinfo=timezone.utc)
-            
-        if datetime.now(timezone.utc) > expiracion:
-            return None, "QR expirado"
-        
-        return int(visita_id), None
+        partes = fernet.decrypt(payload_cifrado.encode()).decode().split('|')
+        if len(partes) == 3 and partes[0] == VERSION_PAYLOAD_QR:
+            expiracion = datetime.fromisoformat(partes[2])
+            if expiracion.tzinfo is None:
+                expiracion = expiracion.replace(tzinfo=timezone.utc)
+            return int(partes[1]), expiracion, None
+        if len(partes) == 2:
+            return int(partes[0]), None, None
+        return None, None, "Formato inválido del código QR"
     except Exception as e:
-        return None, f"Error al validar el QR: {str(e)}"
+        return None, None, f"Error al validar el QR: {str(e)}"
+
+# Validar el QR
+def validar_payload_qr(qr_code: str) -> Tuple[Optional[int], Optional[str]]:
+    visita_id, expiracion, error = verificar_firma_qr(qr_code)
+    if error:
+        return None, error
+    
+    if expiracion and datetime.now(timezone.utc) > expiracion:
+        return None, "QR expirado"
+    
+    return visita_id, None
+
+# Huella del QR para los paquetes de pre-validación offline (no expone el payload)
+def huella_qr(qr_code: str) -> str:
+    return hashlib.sha256(qr_code.encode()).hexdigest()
 
 # Generar imagen QR en base64
 def generar_imagen_qr_base64(data: str) -> str:
@@ -72,7 +107,58 @@ def generar_qr_completo(visita_id: int, minutos_validez: int = 60) -> Tuple[str,
     qr_img_b64 = generar_imagen_qr_base64(qr_code)
     return qr_code, qr_img_b64
 
-def generar_imagen_qr_personalizada(
+# Layout del QR personalizado
+VERSION_PLANTILLA_QR = "1"  # subir al cambiar el layout: invalida las imágenes cacheadas
+MARGEN_SUPERIOR = 140  # Más espacio para texto más grande
+MARGEN_INFERIOR = 220  # Más espacio para fechas más grandes
+BANDA_Y = 52           # Franja que ocupa el nombre de la residencial
+BANDA_ALTO = 46
+
+@lru_cache(maxsize=1)
+def _cargar_fuentes() -> dict:
+    # Las fuentes se cargan una sola vez por proceso (usa fuentes del sistema o default)
+    try:
+        return {
+            "titulo": ImageFont.truetype("arialbd.ttf", 40),  # Título más grande y legible
+            "normal": ImageFont.truetype("arial.ttf", 32),    # Texto normal más grande
+            "small": ImageFont.truetype("arial.ttf", 26),     # Texto pequeño más legible
+            "fecha": ImageFont.truetype("arialbd.ttf", 34),   # Fechas más grandes y destacadas
+        }
+    except OSError:
+        default = ImageFont.load_default()
+        return {"titulo": default, "normal": default, "small": default, "fecha": default}
+
+@lru_cache(maxsize=128)
+def _banda_residencial(nombre_residencial: str, ancho_total: int) -> Image.Image:
+    # Franja con el nombre de la entidad; se reutiliza en todos los QR de esa residencial
+    banda = Image.new("RGB", (ancho_total, BANDA_ALTO), "white")
+    ImageDraw.Draw(banda).text(
+        (ancho_total//2, 75 - BANDA_Y), nombre_residencial,
+        font=_cargar_fuentes()["titulo"], fill="#2980b9", anchor="mm"
+    )
+    return banda
+
+def _renderizar_matriz_qr(qr_data: str, box_size: int = 10, border: int = 4) -> Image.Image:
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_Q,
+        box_size=1,
+        border=border
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()
+    lado = len(matriz)
+    img = Image.new("L", (lado, lado))
+    img.putdata([0 if modulo else 255 for fila in matriz for modulo in fila])
+    return img.resize((lado * box_size, lado * box_size), Image.NEAREST).convert("RGB")
+
+def precargar_render_qr():
+    # Fuentes y tablas de qrcode listas antes del primer QR real (workers del pool de render)
+    _cargar_fuentes()
+    _renderizar_matriz_qr("precarga")
+
+def renderizar_imagen_qr_personalizada(
     qr_data: str,
     nombre_residente: str,
     nombre_visitante: str,
@@ -81,61 +167,66 @@ def generar_imagen_qr_personalizada(
     fecha_creacion: datetime,
     fecha_expiracion: datetime,
     info_extra: str = ""
-) -> str:
-    # 1. Generar QR
-    qr = qrcode.QRCode(
-        version=None,
-        error_correction=qrcode.constants.ERROR_CORRECT_Q,
-        box_size=10,
-        border=4
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color='black', back_color='white').convert("RGB")
+) -> io.BytesIO:
+    """
+    Renderiza el QR personalizado como PNG en memoria.
+    Retorna el buffer posicionado al inicio, listo para subirse sin pasar por disco.
+    """
+    fuentes = _cargar_fuentes()
+
+    # 1. Generar QR (solo la matriz; se escala sin volver a dibujar cada módulo)
+    qr_img = _renderizar_matriz_qr(qr_data)
 
     # 2. Crear imagen base
     ancho, alto = qr_img.size
-    margen_superior = 140  # Más espacio para texto más grande
-    margen_inferior = 220  # Más espacio para fechas más grandes
     ancho_total = ancho + 80  # Más ancho para texto más grande
-    alto_total = alto + margen_superior + margen_inferior
+    alto_total = alto + MARGEN_SUPERIOR + MARGEN_INFERIOR
 
     img_final = Image.new("RGB", (ancho_total, alto_total), "white")
-    draw = ImageDraw.Draw(img_final)
 
-    # 3. Pegar QR en el centro
-    img_final.paste(qr_img, (40, margen_superior))
+    # 3. Banda con el nombre de la residencial (cacheada por entidad) y QR en el centro
+    img_final.paste(_banda_residencial(nombre_residencial, ancho_total), (0, BANDA_Y))
+    img_final.paste(qr_img, (40, MARGEN_SUPERIOR))
+    draw = ImageDraw.Draw(img_final)
 
-    # 4. Cargar fuentes (usa fuentes del sistema o default)
-    try:
-        font_titulo = ImageFont.truetype("arialbd.ttf", 40)  # Título más grande y legible
-        font_normal = ImageFont.truetype("arial.ttf", 32)   # Texto normal más grande
-        font_small = ImageFont.truetype("arial.ttf", 26)    # Texto pequeño más legible
-        font_fecha = ImageFont.truetype("arialbd.ttf", 34)  # Fechas más grandes y destacadas
-    except:
-        font_titulo = ImageFont.load_default()
-        font_normal = ImageFont.load_default()
-        font_small = ImageFont.load_default()
-        font_fecha = ImageFont.load_default()
-
-    # 5. Escribir textos
+    # 4. Escribir textos propios de la visita
     # Título superior - más grande y mejor centrado
     texto_superior = f"Hola {nombre_visitante}, {nombre_residente} te ha invitado a:"
-    draw.text((ancho_total//2, 30), texto_superior, font=font_normal, fill="black", anchor="mm")
-    draw.text((ancho_total//2, 75), nombre_residencial, font=font_titulo, fill="#2980b9", anchor="mm")
+    draw.text((ancho_total//2, 30), texto_superior, font=fuentes["normal"], fill="black", anchor="mm")
 
     # Dirección (unidad residencial) - mejor centrado
-    draw.text((ancho_total//2, 110), unidad_residencial, font=font_normal, fill="black", anchor="mm")
+    draw.text((ancho_total//2, 110), unidad_residencial, font=fuentes["normal"], fill="black", anchor="mm")
 
     # Fechas - Perfectamente centrado
-    fecha_creacion_str = fecha_creacion.strftime("%d-%b-%Y - %I:%M %p")
     fecha_expiracion_str = fecha_expiracion.strftime("%d-%b-%Y - %I:%M %p")
     
     # Texto perfectamente centrado para la expiración
     texto_expiracion = f"El Codigo Expira:\n{fecha_expiracion_str}"
-    draw.text((ancho_total//2, alto + margen_superior + 50), texto_expiracion, font=font_fecha, fill="black", anchor="mm")
+    draw.text((ancho_total//2, alto + MARGEN_SUPERIOR + 50), texto_expiracion, font=fuentes["fecha"], fill="black", anchor="mm")
 
-    # 6. Convertir a base64
+    # 5. Guardar PNG en memoria
     buffered = io.BytesIO()
     img_final.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
\ No newline at end of file
+    buffered.seek(0)
+    return buffered
+
+def png_a_base64(buffered: io.BytesIO) -> str:
+    # Codifica directamente desde la vista del buffer, sin copiar los bytes
+    with buffered.getbuffer() as vista:
+        return base64.b64encode(vista).decode("utf-8")
+
+def generar_imagen_qr_personalizada(
+    qr_data: str,
+    nombre_residente: str,
+    nombre_visitante: str,
+    nombre_residencial: str,
+    unidad_residencial: str,
+    fecha_creacion: datetime,
+    fecha_expiracion: datetime,
+    info_extra: str = ""
+) -> str:
+    # Versión en base64 para respuestas/correos que necesitan la imagen embebida
+    return png_a_base64(renderizar_imagen_qr_personalizada(
+        qr_data, nombre_residente, nombre_visitante, nombre_residencial,
+        unidad_residencial, fecha_creacion, fecha_expiracion, info_extra
+    ))
\ No newline at end of file
@@ -1,15 +1,19 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from app.schemas.auth_schema import TokenData
-from app.database import get_db
+from app.schemas.auth_schema import TokenData, Principal
+from app.database import AsyncSessionLocal
 from app.models import Usuario
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from app.core.config import settings
 from app.utils.time import get_honduras_time
+import threading
+import time
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
@@ -29,17 +33,95 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = get_honduras_time() + expires_delta
     else:
         expire = get_honduras_time() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "iat": get_honduras_time(), "type": "access"})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 # Crear refresh token
 # create_refresh_token removido - ahora se maneja en RefreshTokenService
 
-# Obtener usuario desde token
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-    ) -> Usuario:
+class CacheUsuarios:
+    """
+    LRU con TTL corto de filas Usuario ya autenticadas, para no consultar la BD en
+    cada request. El rol, la residencial y el estado activo del principal salen de
+    esta fila y no de los claims del token, así que un cambio hecho en otro worker
+    se aplica aquí a más tardar al vencer el TTL. invalidar() se llama al cambiar
+    rol/datos, desactivar o eliminar un usuario y lo aplica al instante en este proceso.
+    """
+
+    def __init__(self, ttl: int, max_entradas: int):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, usuario_id: int) -> Optional[Usuario]:
+        with self._lock:
+            entrada = self._entradas.get(usuario_id)
+            if entrada is None or entrada[0] < time.monotonic():
+                self._entradas.pop(usuario_id, None)
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(usuario_id)
+            self.hits += 1
+            return entrada[1]
+
+    def guardar(self, usuario: Usuario):
+        with self._lock:
+            self._entradas[usuario.id] = (time.monotonic() + self.ttl, usuario)
+            self._entradas.move_to_end(usuario.id)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, usuario_id: int):
+        with self._lock:
+            self._entradas.pop(usuario_id, None)
+
+    def resumen(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+cache_usuarios = CacheUsuarios(settings.USUARIO_CACHE_TTL, settings.USUARIO_CACHE_MAX)
+
+def invalidar_usuario(usuario_id: int):
+    cache_usuarios.invalidar(usuario_id)
+
+async def _cargar_usuario(usuario_id: int) -> Usuario:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudieron validar las credenciales",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    usuario = cache_usuarios.obtener(usuario_id)
+    if usuario is not None:
+        return usuario
+
+    # Sesión async propia y corta: no bloquea el event loop ni retiene la conexión
+    # durante el resto del request. residencial se carga aquí porque el usuario
+    # queda desligado de la sesión al cerrarla.
+    async with AsyncSessionLocal() as db:
+        resultado = await db.execute(
+            select(Usuario).options(joinedload(Usuario.residencial)).where(Usuario.id == usuario_id)
+        )
+        usuario = resultado.scalars().first()
+    if usuario is None:
+        raise credentials_exception
+    if hasattr(usuario, "activo") and not usuario.activo:
+        raise HTTPException(status_code=401, detail="Usuario desactivado. Contacte al administrador.")
+
+    cache_usuarios.guardar(usuario)
+    return usuario
+
+# Obtener el principal: token verificado + fila del usuario desde la cache (BD como máximo una vez por TTL)
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme)
+    ) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -53,20 +135,28 @@ async def get_current_user(
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Error de JWT: {str(e)}")
 
-    user = db.query(Usuario).filter(Usuario.id == usuario_id).first()
-    if user is None:
-        raise credentials_exception
+    # Los claims pueden ser de antes de un cambio de rol, residencial o desactivación
+    # hecho en cualquier worker: se usan los de la fila, que _cargar_usuario valida
+    usuario = await _cargar_usuario(usuario_id)
+    return Principal(id=usuario.id, email=usuario.email, rol=usuario.rol, residencial_id=usuario.residencial_id)
 
-    return user
+# Obtener usuario desde token (fila completa, desde la cache o la BD)
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal)
+    ) -> Usuario:
+    return await _cargar_usuario(principal.id)
 
+# Las verificaciones de rol y residencial usan el Principal (fila en cache, sin
+# consulta en cada request). Los endpoints que necesitan la fila completa dependen
+# además de get_current_user, que reutiliza la misma entrada de la cache.
 def verify_role(required_role: list[str]):
-    def dependence(user: Usuario = Depends(get_current_user)):
+    def dependence(user: Principal = Depends(get_current_principal)) -> Principal:
         if user.rol not in required_role:
             raise HTTPException(status_code=403, detail="No tienes permiso para acceder a este recurso")
         return user
     return dependence
 
-def get_current_residencial_id(user: Usuario = Depends(get_current_user)) -> int:
+def get_current_residencial_id(user: Principal = Depends(get_current_principal)) -> int:
     """Obtener el residencial_id del usuario actual"""
     if user.rol == "super_admin":
         raise HTTPException(
@@ -80,17 +170,17 @@ def get_current_residencial_id(user: Usuario = Depends(get_current_user)) -> int
         )
     return user.residencial_id
 
-def is_super_admin(user: Usuario = Depends(get_current_user)) -> bool:
+def is_super_admin(user: Principal = Depends(get_current_principal)) -> bool:
     """Verificar si el usuario es super administrador"""
     return user.rol == "super_admin"
 
-def get_residencial_id_or_super_admin(user: Usuario = Depends(get_current_user)):
+def get_residencial_id_or_super_admin(user: Principal = Depends(get_current_principal)):
     """Obtener residencial_id o permitir super admin"""
     if user.rol == "super_admin":
         return None  # Super admin
     return user.residencial_id
 
-def verify_residencial_access(user: Usuario = Depends(get_current_user), residencial_id: int = None) -> bool:
+def verify_residencial_access(user: Principal = Depends(get_current_principal), residencial_id: int = None) -> bool:
     """Verificar que el usuario tenga acceso a la residencial especificada"""
     if not user.residencial_id:
         raise HTTPException(
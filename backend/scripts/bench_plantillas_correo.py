@@ -0,0 +1,129 @@
+"""
+Benchmark del render del correo de nueva visita a guardias (visita_guardia.html)
+para una difusión a N destinatarios:
+
+- f-string: el HTML armado con f-string por destinatario como antes de las
+  plantillas (sin escapar los datos del usuario).
+- jinja por destinatario: renderizar_correo una vez por guardia.
+- PlantillaDifusion: render único y solo el saludo por guardia.
+
+Uso (desde backend/, con el .env de la app):
+    python scripts/bench_plantillas_correo.py --destinatarios 500 --repeticiones 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.plantillas_correo import renderizar_correo, PlantillaDifusion
+from app.utils.time import get_honduras_time
+
+# Datos de usuario con HTML: las plantillas deben escaparlos
+INYECCION = "<script>alert(1)</script>"
+
+def _visita_ejemplo():
+    visitante = SimpleNamespace(
+        nombre_conductor=f"Ana López {INYECCION}", dni_conductor="0801199912345", telefono="99998888",
+        tipo_vehiculo="Carro", marca_vehiculo="Kia", color_vehiculo="Rojo", placa_vehiculo="HAA1234",
+        placa_chasis=None, destino_visita="Casa 4", motivo_visita="Visita familiar", tipo_visitante="invitado"
+    )
+    ahora = get_honduras_time()
+    return SimpleNamespace(
+        id=1, visitante=visitante, fecha_entrada=ahora, qr_expiracion=ahora + timedelta(days=1),
+        notas=f"Llega tarde {INYECCION}", estado="pendiente", fecha_salida=None
+    )
+
+def correo_fstring(nombre_guardia: str, visita, nombre_creador: str) -> str:
+    # Copia del HTML que se armaba por guardia antes de las plantillas
+    return f"""
+        <html>
+            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+                <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
+                    <div style="background-color: #ffffff; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                        <h1 style="color: #2c3e50; text-align: center; margin-bottom: 30px;">
+                            🚨 ¡Notificación de nuevo acceso!
+                        </h1>
+                        <p style="font-size: 16px; margin-bottom: 20px;">
+                            Hola <strong>{nombre_guardia}</strong>,
+                        </p>
+                        <p style="font-size: 16px; margin-bottom: 20px;">
+                            Se ha creado un nuevo acceso para el miembro <strong>{nombre_creador}</strong>.
+                        </p>
+                        <div style="background-color: #e8f4fd; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                            <h3 style="color: #2980b9; margin-top: 0;">👤 Datos del visitante</h3>
+                            <ul style="list-style: none; padding: 0;">
+                                <li style="margin-bottom: 10px;"><strong>Nombre:</strong> {visita.visitante.nombre_conductor}</li>
+                                <li style="margin-bottom: 10px;"><strong>Tipo de vehículo:</strong> {visita.visitante.tipo_vehiculo}</li>
+                                <li style="margin-bottom: 10px;"><strong>Marca:</strong> {visita.visitante.marca_vehiculo}</li>
+                                <li style="margin-bottom: 10px;"><strong>Color:</strong> {visita.visitante.color_vehiculo}</li>
+                                <li style="margin-bottom: 10px;"><strong>Placa:</strong> {visita.visitante.placa_vehiculo}</li>
+                            </ul>
+                        </div>
+                        <p style="text-align: center; margin-top: 30px; font-size: 14px; color: #666;">
+                            Por favor, verifica la identidad y los datos del visitante al momento de su ingreso.
+                        </p>
+                        <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
+                        <p style="text-align: center; font-size: 12px; color: #999;">
+                            Este es un mensaje automático del sistema Porto Pass.<br>
+                            <strong>No respondas a este correo.</strong>
+                        </p>
+                    </div>
+                </div>
+            </body>
+        </html>
+    """
+
+def _mejor_ms(funcion, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del render de correos de difusión")
+    parser.add_argument("--destinatarios", type=int, default=500, help="guardias que reciben el correo")
+    parser.add_argument("--repeticiones", type=int, default=5, help="se reporta la mejor de N corridas")
+    args = parser.parse_args()
+
+    visita = _visita_ejemplo()
+    nombre_creador = "Luis Pérez"
+    nombres = [f"Guardia {i} {INYECCION}" for i in range(args.destinatarios)]
+
+    def fstring():
+        return [correo_fstring(nombre, visita, nombre_creador) for nombre in nombres]
+
+    def jinja_por_destinatario():
+        return [
+            renderizar_correo("visita_guardia.html", nombre_destinatario=nombre, visita=visita, nombre_creador=nombre_creador)
+            for nombre in nombres
+        ]
+
+    def difusion():
+        plantilla = PlantillaDifusion(
+            "visita_guardia.html", ("nombre_destinatario",),
+            visita=visita, nombre_creador=nombre_creador
+        )
+        return [plantilla.para(nombre_destinatario=nombre) for nombre in nombres]
+
+    # Mismo HTML por ambas vías de plantilla, con los datos del usuario escapados
+    por_destinatario, por_difusion = jinja_por_destinatario(), difusion()
+    assert por_destinatario == por_difusion, "PlantillaDifusion difiere del render por destinatario"
+    assert INYECCION not in por_difusion[0] and "&lt;script&gt;" in por_difusion[0]
+
+    resultados = [
+        ("f-string por destinatario (sin escapar)", _mejor_ms(fstring, args.repeticiones)),
+        ("jinja por destinatario", _mejor_ms(jinja_por_destinatario, args.repeticiones)),
+        ("PlantillaDifusion", _mejor_ms(difusion, args.repeticiones)),
+    ]
+    print(f"Difusión a {args.destinatarios} guardias (mejor de {args.repeticiones}):")
+    for nombre, ms in resultados:
+        print(f"  {nombre:<42}{ms:>9.2f} ms")
+
+if __name__ == "__main__":
+    main()
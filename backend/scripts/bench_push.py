@@ -0,0 +1,162 @@
+"""
+Benchmark de una difusión web push a N suscripciones contra un servicio push
+local (stub) con latencia simulada, sin tocar la BD ni servicios externos:
+
+- webpush(): pywebpush.webpush por envío, como antes de push_crypto (firma el JWT
+  VAPID, lee la clave privada, valida la clave del navegador y abre una conexión
+  en cada llamada).
+- enviar_webpush: cabeceras VAPID por origen, claves de suscriptor en LRU y
+  conexiones keep-alive compartidas (app/utils/push_crypto.py).
+
+Ambas vías corren en un pool de PUSH_WORKERS hilos, como push_executor. Una de
+cada 100 suscripciones responde 410 (endpoint dado de baja).
+
+Uso (desde backend/, con el .env de la app):
+    python scripts/bench_push.py --suscripciones 10000 --latencia-ms 20
+    python scripts/bench_push.py --generar-vapid   # sin claves VAPID en el .env
+"""
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _b64(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).strip(b"=").decode()
+
+def iniciar_servicio_push(latencia: float) -> str:
+    """Servicio push falso en 127.0.0.1: 201 tras `latencia` s, 410 en /baja."""
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latencia)
+            self.send_response(410 if self.path.endswith("/baja") else 201)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 1024
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+def generar_suscripciones(base: str, total: int) -> list[dict]:
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives import serialization
+
+    suscripciones = []
+    for i in range(total):
+        publica = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        )
+        suscripciones.append({
+            "endpoint": f"{base}/push/{i}" + ("/baja" if i % 100 == 99 else ""),
+            "keys": {"p256dh": _b64(publica), "auth": _b64(os.urandom(16))}
+        })
+    return suscripciones
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, round(p / 100 * (len(valores) - 1)))]
+
+def medir(nombre: str, enviar, suscripciones: list[dict], data: str, hilos: int) -> dict:
+    from pywebpush import WebPushException
+
+    errores = []
+
+    def uno(suscripcion):
+        inicio = time.perf_counter()
+        try:
+            enviar(suscripcion, data)
+            resultado = "enviado"
+        except WebPushException as e:
+            resultado = "invalida" if e.response is not None and e.response.status_code in (404, 410) else "error"
+        except Exception as e:
+            resultado = "error"
+            errores.append(f"{e.__class__.__name__}: {e}")
+        return resultado, (time.perf_counter() - inicio) * 1000
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        inicio = time.perf_counter()
+        resultados = list(pool.map(uno, suscripciones))
+        duracion = time.perf_counter() - inicio
+
+    latencias = sorted(ms for _, ms in resultados)
+    return {
+        "via": nombre,
+        "envios_por_segundo": round(len(suscripciones) / duracion),
+        "total_ms": round(duracion * 1000),
+        "p50_ms": round(_percentil(latencias, 50), 1),
+        "p95_ms": round(_percentil(latencias, 95), 1),
+        "enviados": sum(1 for r, _ in resultados if r == "enviado"),
+        "invalidas": sum(1 for r, _ in resultados if r == "invalida"),
+        "errores": sum(1 for r, _ in resultados if r == "error"),
+        "primer_error": errores[0] if errores else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de difusión web push contra un servicio push local")
+    parser.add_argument("--suscripciones", type=int, default=10000, help="suscripciones destino de la difusión")
+    parser.add_argument("--latencia-ms", type=float, default=20, help="latencia simulada del servicio push")
+    parser.add_argument("--hilos", type=int, default=None, help="envíos en paralelo (por defecto PUSH_WORKERS)")
+    parser.add_argument("--generar-vapid", action="store_true", help="usar una clave VAPID temporal en lugar de la del .env")
+    args = parser.parse_args()
+
+    if args.generar_vapid:
+        # Antes de importar la app: las variables de entorno tienen prioridad sobre el .env
+        from py_vapid import Vapid
+        vapid = Vapid()
+        vapid.generate_keys()
+        os.environ["VAPID_PRIVATE_KEY"] = _b64(vapid.private_key.private_numbers().private_value.to_bytes(32, "big"))
+        os.environ.setdefault("VAPID_EMAIL", "mailto:bench@example.com")
+
+    import logging
+    from pywebpush import webpush
+    from app.core.config import settings
+    from app.utils.push_crypto import enviar_webpush, resumen_push_crypto
+    logging.disable(logging.CRITICAL)
+
+    hilos = args.hilos or settings.PUSH_WORKERS
+    base = iniciar_servicio_push(args.latencia_ms / 1000)
+    print(f"Generando {args.suscripciones} suscripciones...")
+    suscripciones = generar_suscripciones(base, args.suscripciones)
+    data = '{"title": "📢 Nueva publicación", "body": "Benchmark", "data": {"url": "/social"}}'
+
+    def via_webpush(suscripcion, data):
+        webpush(
+            subscription_info=suscripcion,
+            data=data,
+            vapid_private_key=settings.VAPID_PRIVATE_KEY,
+            vapid_claims={"sub": settings.VAPID_EMAIL}
+        )
+
+    resultados = [
+        medir("webpush()", via_webpush, suscripciones, data, hilos),
+        # La segunda difusión ya encuentra las claves y conexiones en cache
+        medir("enviar_webpush (1ra)", enviar_webpush, suscripciones, data, hilos),
+        medir("enviar_webpush (2da)", enviar_webpush, suscripciones, data, hilos),
+    ]
+
+    print(f"\nDifusión a {args.suscripciones} suscripciones, {hilos} hilos, latencia {args.latencia_ms} ms:")
+    print(f"{'vía':<24}{'envíos/s':>10}{'total ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'enviados':>10}{'410':>7}{'errores':>9}")
+    for r in resultados:
+        print(f"{r['via']:<24}{r['envios_por_segundo']:>10}{r['total_ms']:>10}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['enviados']:>10}{r['invalidas']:>7}{r['errores']:>9}")
+        if r["primer_error"]:
+            print(f"  primer error: {r['primer_error'][:200]}")
+    print(f"\npush_crypto: {resumen_push_crypto()}")
+
+if __name__ == "__main__":
+    main()
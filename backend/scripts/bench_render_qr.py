@@ -0,0 +1,74 @@
+"""
+Benchmark del render de imágenes QR según el número de procesos del pool
+(QR_RENDER_PROCESOS) en la máquina donde corre: cuántos QR/s se emiten con el
+render en el hilo llamador (0) y con 1, 2, 4... procesos.
+
+Cada configuración reparte los trabajos en bloques de QR_RENDER_CHUNK entre
+QR_WORKERS hilos, como programar_emision_qr. Los trabajos son distintos en cada
+medición para no leer de cache_imagenes_qr. El arranque del pool y la precarga
+de fuentes quedan fuera de la medición.
+
+Uso (desde backend/, con el .env de la app):
+    python scripts/bench_render_qr.py --qr 400 --procesos 0,1,2,4,8
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.qr_render_service import ServicioRenderQR, TrabajoRenderQR
+from app.utils.qr import generar_payloads_qr
+
+def _trabajos(total: int) -> list[TrabajoRenderQR]:
+    # Nombres únicos por medición: ninguna imagen sale de la cache
+    prefijo = uuid.uuid4().hex[:8]
+    ahora = datetime.now(timezone.utc)
+    expiracion = ahora + timedelta(days=1)
+    return [
+        TrabajoRenderQR(payload, "Ana López", f"Visitante {prefijo} {i}", "Residencial Benchmark", "Casa 4", ahora, expiracion)
+        for i, payload in enumerate(generar_payloads_qr(list(range(1, total + 1)), expiracion))
+    ]
+
+def medir(procesos: int, total: int, hilos: int, chunk: int, repeticiones: int) -> float:
+    """Mejor QR/s de `repeticiones` corridas con `procesos` procesos de render."""
+    servicio = ServicioRenderQR(procesos, chunk)
+    try:
+        servicio.renderizar_lote(_trabajos(max(1, procesos) * chunk))
+        mejor = 0.0
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            for _ in range(repeticiones):
+                trabajos = _trabajos(total)
+                bloques = [trabajos[i:i + chunk] for i in range(0, total, chunk)]
+                inicio = time.perf_counter()
+                list(pool.map(servicio.renderizar_lote, bloques))
+                mejor = max(mejor, total / (time.perf_counter() - inicio))
+        return mejor
+    finally:
+        servicio.cerrar()
+
+def main():
+    nucleos = os.cpu_count() or 1
+    por_defecto = ",".join(str(p) for p in sorted({0, 1, 2, 4, nucleos}))
+    parser = argparse.ArgumentParser(description="Benchmark del render de QR por número de procesos")
+    parser.add_argument("--qr", type=int, default=400, help="imágenes por corrida")
+    parser.add_argument("--procesos", default=por_defecto, help="lista de QR_RENDER_PROCESOS a medir (0 = en el hilo)")
+    parser.add_argument("--hilos", type=int, default=settings.QR_WORKERS, help="hilos de emisión (QR_WORKERS)")
+    parser.add_argument("--chunk", type=int, default=settings.QR_RENDER_CHUNK, help="imágenes por bloque (QR_RENDER_CHUNK)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="se reporta la mejor de N corridas")
+    args = parser.parse_args()
+
+    print(f"{nucleos} núcleos, {args.qr} QR por corrida, {args.hilos} hilos, bloques de {args.chunk}")
+    resultados = [(int(p), medir(int(p), args.qr, args.hilos, args.chunk, args.repeticiones)) for p in args.procesos.split(",")]
+    base = resultados[0][1]
+    print(f"\n{'procesos':>9}{'QR/s':>10}{'vs ' + str(resultados[0][0]):>10}")
+    for procesos, qr_por_segundo in resultados:
+        print(f"{procesos:>9}{qr_por_segundo:>10.0f}{qr_por_segundo / base:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
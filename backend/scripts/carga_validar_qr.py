@@ -0,0 +1,155 @@
+"""
+Prueba de carga de POST /visitas/guardia/validar_qr: escaneos concurrentes de
+guardias contra uno o más despliegues (p. ej. la versión sync anterior al motor
+async y la versión async actual) y comparación de solicitudes/s y latencias.
+
+Cada escaneo aprueba su visita, así que cada solicitud usa un QR distinto. Antes
+de medir cada objetivo se crea un lote con /visitas/admin/crear_visitas_masivas
+y sus payloads se leen de la BD configurada en el .env, que debe ser la misma
+de los despliegues. El admin y el guardia deben ser de la misma residencial.
+
+Uso (desde backend/):
+    python scripts/carga_validar_qr.py \\
+        --objetivo sync=http://localhost:8001 --objetivo async=http://localhost:8000 \\
+        --admin admin@correo.com:clave --guardia guardia@correo.com:clave \\
+        --escaneos 2000 --concurrencia 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.models.visita import Visita
+from app.schemas.visita_schema import MAX_VISITAS_MASIVAS
+
+TIMEOUT_SEGUNDOS = 30
+
+def _post(url: str, datos: dict = None, json_body: dict = None, token: str = None) -> tuple:
+    """POST con urllib; retorna (status, cuerpo JSON o None)."""
+    cabeceras = {"User-Agent": "carga-validar-qr"}
+    if token:
+        cabeceras["Authorization"] = f"Bearer {token}"
+    if json_body is not None:
+        cuerpo = json.dumps(json_body).encode("utf-8")
+        cabeceras["Content-Type"] = "application/json"
+    else:
+        cuerpo = urllib.parse.urlencode(datos or {}).encode("utf-8")
+        cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+    solicitud = urllib.request.Request(url, data=cuerpo, headers=cabeceras, method="POST")
+    try:
+        with urllib.request.urlopen(solicitud, timeout=TIMEOUT_SEGUNDOS) as respuesta:
+            return respuesta.status, json.loads(respuesta.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def iniciar_sesion(base: str, credenciales: str) -> str:
+    email, clave = credenciales.split(":", 1)
+    estado, cuerpo = _post(f"{base}/auth/token", datos={"username": email, "password": clave})
+    if estado != 200:
+        raise SystemExit(f"No se pudo iniciar sesión como {email} en {base} (HTTP {estado})")
+    return cuerpo["access_token"]
+
+def preparar_qrs(base: str, token_admin: str, total: int) -> list[str]:
+    """Crea `total` visitas pendientes en lotes y retorna sus payloads QR."""
+    qrs = []
+    while len(qrs) < total:
+        cantidad = min(MAX_VISITAS_MASIVAS, total - len(qrs))
+        prefijo = uuid.uuid4().hex[:8]
+        estado, lote = _post(f"{base}/visitas/admin/crear_visitas_masivas", json_body={
+            "motivo": "Prueba de carga",
+            "visitantes": [
+                {
+                    "nombre_conductor": f"Carga {prefijo} {i}",
+                    "dni_conductor": f"{prefijo}{i:05d}",
+                    "tipo_vehiculo": "Carro",
+                    "placa_chasis": f"C{prefijo}{i}",
+                    "motivo_visita": "Prueba de carga",
+                    "destino_visita": "Prueba de carga"
+                }
+                for i in range(cantidad)
+            ]
+        }, token=token_admin)
+        if estado != 200:
+            raise SystemExit(f"No se pudo crear el lote de visitas en {base} (HTTP {estado})")
+        db = SessionLocal()
+        try:
+            qrs.extend(db.execute(
+                select(Visita.qr_code).where(Visita.lote_id == lote["lote_id"]).order_by(Visita.id)
+            ).scalars().all())
+        finally:
+            db.close()
+    return qrs
+
+def _escanear(url: str, token: str, qr: str) -> tuple:
+    inicio = time.perf_counter()
+    try:
+        estado, cuerpo = _post(url, datos={"qr_code": qr, "accion": "aprobar"}, token=token)
+    except Exception:
+        estado, cuerpo = None, None
+    latencia_ms = (time.perf_counter() - inicio) * 1000
+    return estado == 200 and bool(cuerpo and cuerpo.get("valido")), latencia_ms
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, round(p / 100 * (len(valores) - 1)))]
+
+def medir(nombre: str, base: str, token_guardia: str, qrs: list[str], concurrencia: int, calentamiento: int) -> dict:
+    url = f"{base}/visitas/guardia/validar_qr"
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        # Conexiones, pools de BD y cachés listos antes de medir
+        list(pool.map(lambda qr: _escanear(url, token_guardia, qr), qrs[:calentamiento]))
+        medidos = qrs[calentamiento:]
+        inicio = time.perf_counter()
+        resultados = list(pool.map(lambda qr: _escanear(url, token_guardia, qr), medidos))
+        duracion = time.perf_counter() - inicio
+
+    latencias = sorted(latencia for _, latencia in resultados)
+    validos = sum(1 for valido, _ in resultados if valido)
+    return {
+        "objetivo": nombre,
+        "escaneos": len(medidos),
+        "validos": validos,
+        "errores": len(medidos) - validos,
+        "solicitudes_por_segundo": round(len(medidos) / duracion, 1),
+        "p50_ms": round(_percentil(latencias, 50), 1),
+        "p95_ms": round(_percentil(latencias, 95), 1),
+        "p99_ms": round(_percentil(latencias, 99), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de escaneos QR concurrentes (sync vs async)")
+    parser.add_argument("--objetivo", action="append", required=True, help="nombre=url_base, repetible (p. ej. sync=http://localhost:8001)")
+    parser.add_argument("--admin", required=True, help="email:clave del admin que crea las visitas")
+    parser.add_argument("--guardia", required=True, help="email:clave del guardia que escanea")
+    parser.add_argument("--escaneos", type=int, default=2000, help="escaneos medidos por objetivo")
+    parser.add_argument("--concurrencia", type=int, default=50, help="guardias escaneando a la vez")
+    parser.add_argument("--calentamiento", type=int, default=50, help="escaneos previos no medidos")
+    args = parser.parse_args()
+
+    resultados = []
+    for objetivo in args.objetivo:
+        nombre, base = objetivo.split("=", 1)
+        base = base.rstrip("/")
+        token_admin = iniciar_sesion(base, args.admin)
+        token_guardia = iniciar_sesion(base, args.guardia)
+        qrs = preparar_qrs(base, token_admin, args.escaneos + args.calentamiento)
+        print(f"{nombre}: {len(qrs)} visitas preparadas, midiendo con {args.concurrencia} escaneos concurrentes...")
+        resultados.append(medir(nombre, base, token_guardia, qrs, args.concurrencia, args.calentamiento))
+
+    print(f"\n{'objetivo':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'válidos':>10}{'errores':>10}")
+    for r in resultados:
+        print(f"{r['objetivo']:<12}{r['solicitudes_por_segundo']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['validos']:>10}{r['errores']:>10}")
+
+if __name__ == "__main__":
+    main()
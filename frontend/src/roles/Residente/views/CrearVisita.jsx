@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useRef } from "react";
 import api from "../../../api";
 import { getImageUrl } from "../../../utils/imageUtils";
+import { esperarQrVisita } from "../../../utils/qrEstado";
 import CustomPhoneInput from "../../../components/PhoneInput";
 import QRFullscreen from "../../Admin/components/QRFullscreen";
 import BtnRegresar from "../../Admin/components/BtnRegresar";
@@ -177,12 +178,19 @@ function FormCrearVisita({
           headers: { Authorization: `Bearer ${token}` },
         }
       );
-      if (res.data && res.data.length > 0 && res.data[0].qr_url) {
-        setQrUrl(getImageUrl(res.data[0].qr_url));
+      const visitaCreada = res.data && res.data.length > 0 ? res.data[0] : null;
+      const qrUrlVisita = visitaCreada
+        ? visitaCreada.qr_url || (await esperarQrVisita(visitaCreada.id, token))
+        : null;
+      if (qrUrlVisita) {
+        setQrUrl(getImageUrl(qrUrlVisita));
         setSuccessMessage("Visita creada con éxito. Descarga el QR a continuación.");
         setTimeout(() => {
           qrRef.current?.scrollIntoView({ behavior: 'smooth' });
         }, 100);
+      } else if (visitaCreada) {
+        // La visita ya existe: el QR se sigue emitiendo (o se reintenta) en el servidor
+        setSuccessMessage("Visita creada con éxito. El código QR aún se está generando: te llegará por correo y podrás verlo en Mis Visitas.");
       }
     } catch (err) {
       setError(
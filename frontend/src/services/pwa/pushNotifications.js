@@ -309,7 +309,8 @@ class PushNotificationService {
         'publicacion_creada'
       ],
       guardia: [
-        'visita_creada'
+        'visita_creada',
+        'lote_visitas_creado'
       ],
       residente: [
         'escaneo_entrada',
@@ -332,6 +333,11 @@ class PushNotificationService {
         body: data.visitante || 'Se ha creado una nueva visita',
         icon: '🚨'
       },
+      lote_visitas_creado: {
+        title: '🚨 Nuevo lote de visitas',
+        body: data.total ? `${data.total} visitas programadas` : 'Se ha creado un lote de visitas',
+        icon: '🚨'
+      },
       escaneo_entrada: {
         title: '🚪 Visitante ha ingresado',
         body: data.visitante || 'Un visitante ha ingresado',
@@ -0,0 +1,32 @@
+import api from '../api';
+
+/**
+ * Waits until the backend finishes rendering and uploading a visit's QR image.
+ *
+ * Visit creation returns immediately with `qr_estado: "pendiente"`; the image is
+ * issued in the background and `qr_url` is filled in later.
+ *
+ * @param {number} visitaId - ID of the created visit
+ * @param {string} token - Bearer token of the current user
+ * @param {object} [options]
+ * @param {number} [options.intervalMs=1500] - Delay between polls
+ * @param {number} [options.maxIntentos=20] - Max polls before giving up
+ * @returns {Promise<string|null>} - The qr_url, or null if it failed, timed out or the status
+ *   could not be read (the visit itself was created; the backend keeps retrying the QR)
+ */
+export const esperarQrVisita = async (visitaId, token, { intervalMs = 1500, maxIntentos = 20 } = {}) => {
+  for (let intento = 0; intento < maxIntentos; intento++) {
+    let res;
+    try {
+      res = await api.get(`/visitas/residente/qr_estado/${visitaId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+    } catch {
+      return null;
+    }
+    if (res.data?.qr_url) return res.data.qr_url;
+    if (res.data?.qr_estado === 'fallido') return null;
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  return null;
+};